@@ -1,2 +1,4 @@
 from .api_calls import ApiCalls
+from .token_cache import TokenCache
+from .bandwidth_limiter import BandwidthLimiter, parse_schedule
 from . import exceptions
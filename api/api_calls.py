@@ -1,11 +1,10 @@
 import ast
-import itertools
 import json
 import logging
 import threading
+import time
 
 from http import HTTPStatus
-from os import path
 from rauth import OAuth2Service
 from requests import ConnectionError
 from requests.adapters import HTTPAdapter
@@ -15,12 +14,99 @@ from urllib.error import URLError
 import model
 
 from . import exceptions
+from .multipart_body import MultipartBody, DEFAULT_BUFFER_MEMORY
+
+
+class _LinkCache(object):
+    """
+    Remembers hypermedia links that have already been resolved by ApiCalls._get_link
+
+    Entries are keyed by (source url, rel, target key, target value) and expire after `ttl` seconds.
+
+    Resource listings searched by a target key are also indexed by that key, so finding any other resource
+    in the same listing does not fetch it again or scan it.
+
+    Urls are never built from templates (e.g. "projects/{}/samples"), links are only taken from the server's
+    responses, so a resource that does not exist is still reported as missing.
+    """
+
+    def __init__(self, ttl):
+        """
+        :param ttl: seconds a resolved link is kept before it has to be fetched again
+        """
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._links = {}
+        self._indexes = {}
+
+    @staticmethod
+    def make_key(target_url, target_key, target_dict=None):
+        if target_dict:
+            return target_url, target_key, target_dict["key"], str(target_dict["value"]).lower()
+        return target_url, target_key, None, None
+
+    def get(self, key):
+        """
+        Returns the cached href for key, or None when it is missing or expired
+        """
+        with self._lock:
+            entry = self._links.get(key)
+            if entry is None:
+                return None
+            href, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._links[key]
+                return None
+            return href
+
+    def put(self, key, href):
+        with self._lock:
+            self._links[key] = (href, time.monotonic() + self._ttl)
+
+    def get_index(self, target_url, dict_key):
+        """
+        Returns the index of the resources listed on target_url by dict_key, {lower case value: links},
+        or None when the listing has not been indexed or the index has expired
+        """
+        with self._lock:
+            entry = self._indexes.get((target_url, dict_key))
+            if entry is None:
+                return None
+            index, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._indexes[(target_url, dict_key)]
+                return None
+            return index
+
+    def put_index(self, target_url, dict_key, index):
+        with self._lock:
+            self._indexes[(target_url, dict_key)] = (index, time.monotonic() + self._ttl)
+
+    def invalidate(self, target_url=None):
+        """
+        Drops cached links
+
+        :param target_url: only drop links that were resolved from this url, when None everything is dropped
+        """
+        with self._lock:
+            if target_url is None:
+                self._links = {}
+                self._indexes = {}
+                return
+            for key in [k for k in self._links if k[0] == target_url]:
+                del self._links[key]
+            for key in [k for k in self._indexes if k[0] == target_url]:
+                del self._indexes[key]
 
 
 class ApiCalls(object):
 
+    # get a new access token when the current one expires within this many seconds
+    TOKEN_REFRESH_MARGIN = 60
+
     def __init__(self, client_id, client_secret,
-                 base_url, username, password, max_wait_time=20, http_max_retries=5):
+                 base_url, username, password, max_wait_time=20, http_max_retries=5, link_cache_ttl=300,
+                 token_cache=None, upload_buffer_memory=None, bandwidth_limiter=None):
         """
         Create OAuth2Session and store it
 
@@ -30,6 +116,11 @@ class ApiCalls(object):
             base_url -- url of the IRIDA server
             username -- username for server
             password -- password for given username
+            link_cache_ttl -- seconds a resolved hypermedia link is reused before it is looked up again
+            token_cache -- optional TokenCache, access tokens are shared with other processes through it
+            upload_buffer_memory -- bytes each file upload may use to read the file ahead of sending it,
+                defaults to 32 MiB
+            bandwidth_limiter -- optional BandwidthLimiter shared by every file upload
 
         return ApiCalls object
         """
@@ -41,32 +132,64 @@ class ApiCalls(object):
         self.password = password
         self.max_wait_time = max_wait_time
         self.http_max_retries = http_max_retries
+        self.upload_buffer_memory = upload_buffer_memory or DEFAULT_BUFFER_MEMORY
+        self.bandwidth_limiter = bandwidth_limiter
 
         self._stop_upload = False
 
         self._session_lock = threading.Lock()
         self._session_set_externally = False
+        self._token_expires_at = None
+        self._token_cache = token_cache
+        self._round_trip_lock = threading.Lock()
+        self._round_trip_count = 0
         self._create_session()
         self.cached_projects = None
         self.cached_samples = {}
+        # name / id indexes built from cached_projects and cached_samples, rebuilt when those lists are replaced
+        self._project_index = (None, {})
+        self._sample_indexes = {}
+        # one lock per listing (projects, samples of a project), so threads that need the same listing share one request
+        self._listing_locks = {}
+        self._listing_locks_lock = threading.Lock()
+        self._link_cache = _LinkCache(link_cache_ttl)
 
     @property
     def _session(self):
-        try:  # Todo: rework this code without the try/catch/finally and odd exception raise
-            self._session_lock.acquire()
-            response = self._session_instance.options(self.base_url)
-            if response.status_code != HTTPStatus.OK:
-                raise Exception
-            else:
-                logging.debug("Existing session still works, going to reuse it.")
-        except Exception:
-            logging.debug("Token is probably expired, going to get a new session.")
-            self._reinitialize_session()
-        finally:
-            self._session_lock.release()
+        """
+        Returns the live session, getting a new access token first when the current one is about to expire
+        """
+        if self._token_needs_refresh():
+            with self._session_lock:
+                # another thread may have refreshed the token while we were waiting for the lock
+                if self._token_needs_refresh():
+                    logging.debug("Token is about to expire, going to get a new one.")
+                    self._refresh_access_token()
 
         return self._session_instance
 
+    def _token_needs_refresh(self):
+        """
+        True when the access token expires within TOKEN_REFRESH_MARGIN seconds
+        Tokens that were issued without an expiry are only replaced when IRIDA rejects them
+        """
+        if self._token_expires_at is None:
+            return False
+        return time.monotonic() + ApiCalls.TOKEN_REFRESH_MARGIN >= self._token_expires_at
+
+    def _refresh_access_token(self, rejected_token=None):
+        """
+        Gets a new access token and gives it to the existing session, so open connections are kept
+        Expects the caller to hold _session_lock
+
+        arguments:
+            rejected_token -- a token IRIDA refused, it is removed from the token cache so it is not used again
+        """
+        if rejected_token is not None and self._token_cache is not None:
+            self._token_cache.discard(self.base_url, self.client_id, self.username, rejected_token)
+        oauth_service = self._get_oauth_service()
+        self._session_instance.access_token = self._get_access_token(oauth_service)
+
     def _reinitialize_session(self):
         oauth_service = self._get_oauth_service()
         access_token = self._get_access_token(oauth_service)
@@ -74,8 +197,44 @@ class ApiCalls(object):
         # We add a HTTPAdapter with max retries so we don't fail out if one request gets lost
         _sess.mount('https://', HTTPAdapter(max_retries=self.http_max_retries))
         _sess.mount('http://', HTTPAdapter(max_retries=self.http_max_retries))
+        # When a token is rejected anyway (e.g. revoked on the server) we get a new one and retry once
+        _sess.hooks['response'].append(self._retry_unauthorized)
         self._session_instance = _sess
 
+    def _retry_unauthorized(self, response, **kwargs):
+        """
+        Response hook for the session
+        When IRIDA responds with 401, a new access token is fetched and the request is sent once more
+
+        Requests with a streamed body (file uploads) can not be sent again, their 401 response is returned as is
+
+        arguments:
+            response -- the response to check
+            kwargs -- the arguments the request was sent with (timeout, verify, proxies, etc.)
+
+        returns the original response or the response of the retried request
+        """
+        request = response.request
+        if response.status_code != HTTPStatus.UNAUTHORIZED or getattr(request, "token_retried", False):
+            return response
+        if request.body is not None and not isinstance(request.body, (str, bytes)):
+            return response
+
+        rejected_authorization = request.headers.get("Authorization")
+        with self._session_lock:
+            # only get a new token if another thread has not already done so
+            if rejected_authorization == "Bearer {}".format(self._session_instance.access_token):
+                logging.debug("Token was rejected, going to get a new one.")
+                self._refresh_access_token(rejected_token=self._session_instance.access_token)
+            access_token = self._session_instance.access_token
+
+        retry_request = request.copy()
+        retry_request.token_retried = True
+        retry_request.headers["Authorization"] = "Bearer {}".format(access_token)
+        response.close()
+        logging.debug("Retrying request to {} with new token".format(request.url))
+        return self._session_instance.send(retry_request, **kwargs)
+
     def _create_session(self):
         """
         create session to be re-used until expiry for get and post calls
@@ -120,6 +279,9 @@ class ApiCalls(object):
     def _get_access_token(self, oauth_service):
         """
         get access token to be used to get session from oauth_service
+        the lifetime of the token (expires_in) is recorded so it can be refreshed ahead of expiry
+        when there is a token cache, a valid cached token is used instead of asking IRIDA for a new one,
+        and new tokens are added to the cache
 
         arguments:
             oauth_service -- O2AuthService from get_oauth_service
@@ -140,6 +302,15 @@ class ApiCalls(object):
             irida_dict = ast.literal_eval(return_dict.decode("utf-8"))
             return irida_dict
 
+        if self._token_cache is not None:
+            cached_token = self._token_cache.get(self.base_url, self.client_id, self.username,
+                                                 min_lifetime=ApiCalls.TOKEN_REFRESH_MARGIN)
+            if cached_token is not None:
+                access_token, expires_in = cached_token
+                logging.debug("Using cached access token")
+                self._token_expires_at = time.monotonic() + expires_in
+                return access_token
+
         params = {
             "data": {
                 "grant_type": "password",
@@ -151,8 +322,9 @@ class ApiCalls(object):
         }
 
         try:
-            access_token = oauth_service.get_access_token(
-                decoder=token_decoder, **params)
+            response = oauth_service.get_raw_access_token(**params)
+            token_dict = token_decoder(response.content)
+            access_token = token_dict["access_token"]
         except ConnectionError as e:
             logging.error("Can not connect to IRIDA")
             raise exceptions.IridaConnectionError("Could not connect to the IRIDA server. URL may be incorrect."
@@ -162,21 +334,31 @@ class ApiCalls(object):
             raise exceptions.IridaConnectionError("Could not get access token from IRIDA. Credentials may be incorrect."
                                                   " IRIDA returned with error message: {}".format(e.args))
 
+        if "expires_in" in token_dict:
+            self._token_expires_at = time.monotonic() + int(token_dict["expires_in"])
+            # tokens without an expiry are not shared, other processes could not tell when to stop using them
+            if self._token_cache is not None:
+                self._token_cache.put(self.base_url, self.client_id, self.username,
+                                      access_token, int(token_dict["expires_in"]))
+        else:
+            self._token_expires_at = None
+
         return access_token
 
-    def _validate_url_existence(self, url):
+    def _get_resource(self, url):
         """
-        tries to validate existence of given url by trying to open it.
-        true if HTTP OK and no errors when authenticating credentials
+        fetches a resource with a single GET request and returns its parsed json body
         if errors or non HTTP.OK code occur, throws a IridaConnectionError
 
         arguments:
-            url -- the url link to open and validate
+            url -- the url of the resource to get
 
         returns
-            true if http response OK 200
+            the json response as a dictionary
             raises IridaConnectionError otherwise
         """
+        with self._round_trip_lock:
+            self._round_trip_count += 1
         try:
             response = self._session.get(url)
         except URLError as e:
@@ -185,14 +367,21 @@ class ApiCalls(object):
             raise exceptions.IridaConnectionError("Could not connect to IRIDA, URL '{}' responded with: {}"
                                                   "".format(url, str(e)))
 
-        if response.status_code == HTTPStatus.OK:
-            return True
-        else:
+        if response.status_code != HTTPStatus.OK:
             logging.error("Could not connect to IRIDA, URL '{}' responded with: {} {}"
                           "".format(url, response.status_code, response.reason))
             raise exceptions.IridaConnectionError("Could not connect to IRIDA, URL '{}' responded with: {} {}"
                                                   "".format(url, response.status_code, response.reason))
 
+        return response.json()
+
+    @property
+    def round_trip_count(self):
+        """
+        Number of GET requests sent to IRIDA by this instance to fetch resources and traverse links
+        """
+        return self._round_trip_count
+
     def _get_link(self, target_url, target_key, target_dict=None):
         """
         makes a call to target_url(api) expecting a json response
@@ -212,29 +401,34 @@ class ApiCalls(object):
 
         logging.debug("api_calls._get_link: target_url: {}, target_key: {}".format(target_url, target_key))
 
-        self._validate_url_existence(target_url)
-        response = self._session.get(target_url)
+        cache_key = self._link_cache.make_key(target_url, target_key, target_dict)
+        cached_link = self._link_cache.get(cache_key)
+        if cached_link is not None:
+            logging.debug("api_calls._get_link: resolved {} on {} in 0 round trips (cached)"
+                          "".format(target_key, target_url))
+            return cached_link
 
         if target_dict:  # we are targeting specific resources in the response
 
-            resources_list = response.json()["resource"]["resources"]
-            # try to get all keys from target_dict to our list or links
-            try:
-                links_list = next(
-                    r["links"] for r in resources_list
-                    if r[target_dict["key"]].lower() ==
-                    str(target_dict["value"]).lower()
-                )
+            resource_index = self._link_cache.get_index(target_url, target_dict["key"])
+            if resource_index is None:
+                response_json = self._get_resource(target_url)
+                logging.debug("api_calls._get_link: resolved {} on {} in 1 round trip".format(target_key, target_url))
+                resource_index = self._index_resources(target_url, response_json["resource"]["resources"],
+                                                       target_dict["key"])
+            else:
+                logging.debug("api_calls._get_link: resolved {} on {} in 0 round trips (indexed)"
+                              "".format(target_key, target_url))
 
+            try:
+                links_list = resource_index[str(target_dict["value"]).lower()]
             except KeyError:
-                raise exceptions.IridaKeyError(target_dict["key"] + " not found. Available keys: " +
-                                               ", ".join(resources_list[0].keys()))
-
-            except StopIteration:
-                raise exceptions.IridaKeyError(target_dict["value"] + " not found.")
+                raise exceptions.IridaKeyError(str(target_dict["value"]) + " not found.")
 
         else:  # get all the links in the response
-            links_list = response.json()["resource"]["links"]
+            response_json = self._get_resource(target_url)
+            logging.debug("api_calls._get_link: resolved {} on {} in 1 round trip".format(target_key, target_url))
+            links_list = response_json["resource"]["links"]
         try:
             ret_val = next(link["href"] for link in links_list
                            if link["rel"] == target_key)
@@ -245,8 +439,62 @@ class ApiCalls(object):
             raise exceptions.IridaKeyError(target_key + " not found in links. Available links: " +
                                            ", ".join([str(link["rel"]) for link in links_list]))
 
+        self._link_cache.put(cache_key, ret_val)
+
         return ret_val
 
+    def _index_resources(self, target_url, resources_list, key):
+        """
+        Indexes the links of the resources listed on target_url by the lower case value of key,
+        and keeps the index in the link cache
+
+        arguments:
+            target_url -- URL the resources were listed on
+            resources_list -- the "resources" of the response
+            key -- resource key to index by (e.g identifier or sampleName)
+
+        returns the index, {lower case value: links}
+        """
+        resource_index = {}
+        for resource in resources_list:
+            if key in resource:
+                # the first resource with a value wins, like a scan of the list would
+                resource_index.setdefault(str(resource[key]).lower(), resource["links"])
+        if resources_list and not resource_index:
+            raise exceptions.IridaKeyError(key + " not found. Available keys: " +
+                                           ", ".join(resources_list[0].keys()))
+
+        self._link_cache.put_index(target_url, key, resource_index)
+        return resource_index
+
+    def clear_link_cache(self, target_url=None):
+        """
+        Drops cached hypermedia links so they are fetched from the server on next use
+
+        arguments:
+            target_url -- optional, only drop links that were found on this url
+        """
+        self._link_cache.invalidate(target_url)
+
+    def clear_caches(self):
+        """
+        Drops the cached project and sample listings and the cached hypermedia links, so projects and samples
+        created on IRIDA since they were fetched are found
+        """
+        with self._listing_lock("projects"):
+            self.cached_projects = None
+        for project_id in list(self.cached_samples):
+            with self._listing_lock(("samples", project_id)):
+                self.cached_samples.pop(project_id, None)
+        self.clear_link_cache()
+
+    def _listing_lock(self, key):
+        """
+        Returns the lock held while the listing identified by key is fetched and cached
+        """
+        with self._listing_locks_lock:
+            return self._listing_locks.setdefault(key, threading.Lock())
+
     def get_projects(self):
         """
         API call to api/projects to get list of projects
@@ -256,35 +504,34 @@ class ApiCalls(object):
 
         logging.info("Loading projects.")
 
-        if self.cached_projects is None:
-            logging.debug("Loading projects from IRIDA server.")
-            url = self._get_link(self.base_url, "projects")
-            response = self._session.get(url)
-
-            result = response.json()["resource"]["resources"]
-
-            try:
-                project_list = [
-                    model.Project(
-                        name=project_dict["name"],
-                        description=project_dict["projectDescription"],
-                        id=project_dict["identifier"]
-                    )
-                    for project_dict in result
-                ]
-
-            except KeyError as e:
-                e.args = map(str, e.args)
-                msg_arg = " ".join(e.args)
-                logging.debug(msg_arg + " not found. Available keys: " +
-                              ", ".join(result[0].keys()))
-                raise exceptions.IridaKeyError(msg_arg + " not found. Available keys: " +
-                                               ", ".join(result[0].keys()))
-            self.cached_projects = project_list
-        else:
-            logging.debug("Loading projects from cache.")
+        with self._listing_lock("projects"):
+            if self.cached_projects is None:
+                logging.debug("Loading projects from IRIDA server.")
+                url = self._get_link(self.base_url, "projects")
+                result = self._get_resource(url)["resource"]["resources"]
+
+                try:
+                    project_list = [
+                        model.Project(
+                            name=project_dict["name"],
+                            description=project_dict["projectDescription"],
+                            id=project_dict["identifier"]
+                        )
+                        for project_dict in result
+                    ]
+
+                except KeyError as e:
+                    e.args = map(str, e.args)
+                    msg_arg = " ".join(e.args)
+                    logging.debug(msg_arg + " not found. Available keys: " +
+                                  ", ".join(result[0].keys()))
+                    raise exceptions.IridaKeyError(msg_arg + " not found. Available keys: " +
+                                                   ", ".join(result[0].keys()))
+                self.cached_projects = project_list
+            else:
+                logging.debug("Loading projects from cache.")
 
-        return self.cached_projects
+            return self.cached_projects
 
     """
     Potential future functionality:
@@ -304,38 +551,41 @@ class ApiCalls(object):
 
         logging.info("Getting samples from project '{}'".format(project_id))
 
-        if project_id not in self.cached_samples:
-            try:
-                project_url = self._get_link(self.base_url, "projects")
-                url = self._get_link(project_url, "project/samples",
-                                     target_dict={
-                                         "key": "identifier",
-                                         "value": project_id
-                                     })
-
-            except StopIteration:
-                logging.error("The given project ID doesn't exist: ".format(project_id))
-                raise exceptions.IridaResourceError("The given project ID doesn't exist", project_id)
+        with self._listing_lock(("samples", project_id)):
+            sample_list = self.cached_samples.get(project_id)
+            if sample_list is None:
+                try:
+                    project_url = self._get_link(self.base_url, "projects")
+                    url = self._get_link(project_url, "project/samples",
+                                         target_dict={
+                                             "key": "identifier",
+                                             "value": project_id
+                                         })
 
-            response = self._session.get(url)
-            result = response.json()["resource"]["resources"]
-
-            sample_list = []
-            for sample_dict in result:
-                # use name and description from dictionary as base parameters when creating sample
-                sample_name = sample_dict['sampleName']
-                sample_desc = sample_dict['description']
-                # remove them from the dict so we don't have useless duplicate data
-                del sample_dict['sampleName']
-                del sample_dict['description']
-                sample_list.append(model.Sample(
-                    sample_name=sample_name,
-                    description=sample_desc,
-                    samp_dict=sample_dict
-                ))
-            self.cached_samples[project_id] = sample_list
-
-        return self.cached_samples[project_id]
+                except StopIteration:
+                    logging.error("The given project ID doesn't exist: ".format(project_id))
+                    raise exceptions.IridaResourceError("The given project ID doesn't exist", project_id)
+
+                result = self._get_resource(url)["resource"]["resources"]
+                # the listing is the one get_sequence_files searches by sampleName, index it while we have it
+                self._index_resources(url, result, "sampleName")
+
+                sample_list = []
+                for sample_dict in result:
+                    # use name and description from dictionary as base parameters when creating sample
+                    sample_name = sample_dict['sampleName']
+                    sample_desc = sample_dict['description']
+                    # remove them from the dict so we don't have useless duplicate data
+                    del sample_dict['sampleName']
+                    del sample_dict['description']
+                    sample_list.append(model.Sample(
+                        sample_name=sample_name,
+                        description=sample_desc,
+                        samp_dict=sample_dict
+                    ))
+                self.cached_samples[project_id] = sample_list
+
+            return sample_list
 
     def get_sequence_files(self, project_id, sample_name):
         """
@@ -370,7 +620,7 @@ class ApiCalls(object):
                                      "key": "sampleName",
                                      "value": sample_name
                                  })
-            response = self._session.get(url)
+            response_json = self._get_resource(url)
 
         except StopIteration:
             logging.error("The given sample doesn't exist: ".format(sample_name))
@@ -379,7 +629,7 @@ class ApiCalls(object):
         # todo future development
         # This response should be parsed into SequenceFile objects
         # This is a bit tricky because Forward and Reverse reads are different files in the returned resources
-        result = response.json()["resource"]["resources"]
+        result = response_json["resource"]["resources"]
 
         return result
 
@@ -401,9 +651,10 @@ class ApiCalls(object):
         """
         logging.info("Sending project to IRIDA.")
 
+        url = self._get_link(self.base_url, "projects")
         if clear_cache:
             self.cached_projects = None
-        url = self._get_link(self.base_url, "projects")
+            self.clear_link_cache(url)
         json_obj = json.dumps(project.get_uploadable_dict())
         headers = {
             "headers": {
@@ -433,9 +684,6 @@ class ApiCalls(object):
 
         logging.info("Creating sample '{}' for project '{}' on IRIDA.".format(sample.sample_name, project_id))
 
-        self.cached_samples = {}  # reset the cache, we're updating stuff
-        self.cached_projects = None
-
         try:
             project_url = self._get_link(self.base_url, "projects")
             url = self._get_link(project_url, "project/samples",
@@ -454,11 +702,16 @@ class ApiCalls(object):
             }
         }
 
-        json_obj = json.dumps(sample.get_uploadable_dict())
+        json_obj = json.dumps(dict(sample.get_uploadable_dict()))
         response = self._session.post(url, json_obj, **headers)
 
         if response.status_code == HTTPStatus.CREATED:  # 201
             json_res = json.loads(response.text)
+            # reset the samples of this project now the new sample exists, so a listing fetched by another thread
+            # while the sample was being created is not kept. Links to samples on this project change as well
+            with self._listing_lock(("samples", project_id)):
+                self.cached_samples.pop(project_id, None)
+                self.clear_link_cache(url)
         else:
             logging.error("Did not create sample on server. Response code is '{}' and error message is '{}'"
                           "".format(response.status_code, response.text))
@@ -479,12 +732,14 @@ class ApiCalls(object):
         This method simply sets a flag to instruct any in-progress generators called
         by `_send_sequence_files` below to stop generating data and raise an exception
         that will set the run to an error state on the server.
+        The flag is not cleared, later uploads with this instance are stopped as well.
         """
 
         self._stop_upload = True
         self._session.close()
 
-    def send_sequence_files(self, sequence_file, sample_name, project_id, upload_id):
+    def send_sequence_files(self, sequence_file, sample_name, project_id, upload_id, checksums=None,
+                            should_stop=None):
         """
         post request to send sequence files found in given sample argument
         raises error if either project ID or sample ID found in Sample object
@@ -493,110 +748,51 @@ class ApiCalls(object):
         arguments:
             sample -- Sample object
             upload_id -- the run to upload the files to
+            checksums -- optional dict, once the files have been accepted the size, MD5 and SHA-256 of each file
+                (computed while it was sent) are added to it as {file name: {"size", "md5", "sha256"}}
+            should_stop -- optional function, when it returns True the upload is stopped and
+                IridaUploadCanceledException is raised. Lets uploads running at the same time on this instance
+                be stopped separately, e.g. all the samples of one run
 
         returns result of post request.
         """
 
         boundary = "B0undary"
-        read_size = 32768
-        self._stop_upload = False
-
-        def _send_file(filename, parameter_name):
-            """This function is a generator that yields a multipart form-data
-            entry for the specified file. This function will yield `read_size`
-            bytes of the specified file name at a time as the generator is called.
-            This function will also terminate generating data when the field
-            `self._stop_upload` is set.
-
-            Args:
-                filename: the file to read and yield in `read_size` chunks to
-                          the server.
-                parameter_name: the form field name to send to the server.
-            """
 
-            # Send the boundary header section for the file
-            logging.debug("Sending the boundary header section for {}".format(filename))
-            yield (("\r\n--{boundary}\r\n"
-                   "Content-Disposition: form-data; name=\"{parameter_name}\"; filename=\"{filename}\"\r\n\r\n").format(
-                boundary=boundary, parameter_name=parameter_name, filename=filename.replace("\\", "/"))).encode()
+        def _stop_requested():
+            return self._stop_upload or (should_stop is not None and should_stop())
 
-            # Get total file size for progress
-            total_file_size = path.getsize(filename)
-
-            # Send the contents of the file, read_size bytes at a time until
-            # we've either read the entire file, or we've been instructed to
-            # stop the upload by the UI
-            logging.info("Starting to send file {}".format(filename))
-            try:
-                with open(filename, "rb", read_size) as fastq_file:
-                    data = fastq_file.read(read_size)
-                    # Command line progress info printing
-                    # Todo: once message passing is in place, this might find its home in that module
-                    bytes_read = 0
-                    while data and not self._stop_upload:
-                        bytes_read += len(data)
-                        print("Progress: ", round(bytes_read/total_file_size*100, 2),
-                              "% Uploaded     \r", end="")
-                        yield data
-                        data = fastq_file.read(read_size)
-                    print()  # end cap to the dots we printed above
-                    logging.info("Finished sending file {}".format(filename))
-                    if self._stop_upload:
-                        logging.info("Halting upload on user request.")
-            except IOError:
-                logging.error("Could not open file: {}".format(filename))
-                raise exceptions.FileError("Could not open file: {}".format(filename))
-
-        def _send_parameters(parameter_name, parameters):
-            """This function is a generator that yields a multipart form-data
-            entry with additional file metadata.
-
-            Args:
-                parameter_name: the form field name to use to send to the server.
-                parameters: a JSON encoded object with the metadata for the file.
-            """
-
-            logging.debug("Going to send parameters for {}".format(parameter_name))
-            yield (("\r\n--{boundary}\r\nContent-Disposition: form-data; name=\"{parameter_name}\"\r\n"
-                   "Content-Type: application/json\r\n\r\n{parameters}\r\n").format(
-                boundary=boundary, parameter_name=parameter_name, parameters=parameters)).encode()
-
-        def _finish_request():
-            """This function is a generator that yields the terminal boundary
-            entry for a multipart form-data upload."""
-
-            yield ("--{boundary}--".format(boundary=boundary)).encode()
-
-        def _sample_upload_generator(sequence_file_up):
-            """This function accepts the sequence_file and composes a series of generators
-            that are used to send the file contents and metadata for the sample.
+        def _sample_upload_body(sequence_file_up):
+            """This function accepts the sequence_file and composes the multipart body
+            that sends the file contents and metadata for the sample.
 
             Args:
                 sequence_file_up: the sequence_file to send to the server
             """
 
-            file_metadata = sequence_file_up.properties_dict
+            file_metadata = dict(sequence_file_up.properties_dict)
             file_metadata["miseqRunId"] = str(upload_id)
             file_metadata_json = json.dumps(file_metadata)
 
+            body = MultipartBody(boundary, buffer_memory=self.upload_buffer_memory,
+                                 should_stop=_stop_requested,
+                                 bandwidth_limiter=self.bandwidth_limiter)
             if sequence_file_up.is_paired_end():
-                # Compose a collection of generators to send both files of a paired-end
-                # file set and the corresponding metadata
-                logging.debug("api_calls._sample_upload_generator: is paired end read")
-                return itertools.chain(
-                    _send_file(filename=sequence_file_up.file_list[0], parameter_name="file1"),
-                    _send_file(filename=sequence_file_up.file_list[1], parameter_name="file2"),
-                    _send_parameters(parameter_name="parameters1", parameters=file_metadata_json),
-                    _send_parameters(parameter_name="parameters2", parameters=file_metadata_json),
-                    _finish_request())
+                # Send both files of a paired-end file set and the corresponding metadata
+                logging.debug("api_calls._sample_upload_body: is paired end read")
+                for parameter_name, filename in zip(["file1", "file2"], sequence_file_up.file_list):
+                    body.add_file(parameter_name=parameter_name, filename=filename,
+                                  parts=sequence_file_up.get_file_parts(filename))
+                body.add_parameters(parameter_name="parameters1", parameters=file_metadata_json)
+                body.add_parameters(parameter_name="parameters2", parameters=file_metadata_json)
             else:
-                # Compose a generator to send the single file from a single-end
-                # file set and the corresponding metadata.
-                logging.debug("api_calls._sample_upload_generator: is single end read")
-                return itertools.chain(
-                    _send_file(filename=sequence_file_up.file_list[0], parameter_name="file"),
-                    _send_parameters(parameter_name="parameters", parameters=file_metadata_json),
-                    _finish_request())
+                # Send the single file from a single-end file set and the corresponding metadata.
+                logging.debug("api_calls._sample_upload_body: is single end read")
+                filename = sequence_file_up.file_list[0]
+                body.add_file(parameter_name="file", filename=filename, parts=sequence_file_up.get_file_parts(filename))
+                body.add_parameters(parameter_name="parameters", parameters=file_metadata_json)
+            body.finish()
+            return body
 
         try:
             project_url = self._get_link(self.base_url, "projects")
@@ -626,15 +822,16 @@ class ApiCalls(object):
             url = seq_url
 
         logging.debug("Sending files to [{}]".format(url))
-        data_pkg = _sample_upload_generator(sequence_file)
+        data_pkg = _sample_upload_body(sequence_file)
+        # requests sets the Content-Length from len(data_pkg), so the body is not chunked
         headers_pkg = {"Content-Type": "multipart/form-data; boundary={}".format(boundary)}
-        logging.debug("data:" + str(data_pkg))
+        logging.debug("data: {} bytes".format(len(data_pkg)))
         logging.debug("headers: " + str(headers_pkg))
 
         response = self._session.post(url, data=data_pkg, headers=headers_pkg)
 
         logging.debug("api_calls: send_sequence_files: response: " + response.text)
-        if self._stop_upload:
+        if _stop_requested():
             logging.info("Upload was halted on user request")
             logging.debug("Raising exception so that server upload status is set to error state.")
             raise exceptions.IridaUploadCanceledException("Upload halted on user request.")
@@ -648,6 +845,9 @@ class ApiCalls(object):
             logging.debug("response.text: " + response.text)
             raise e
 
+        if checksums is not None:
+            checksums.update(data_pkg.checksums)
+
         return json_res
 
     def create_seq_run(self, metadata):
@@ -725,9 +925,7 @@ class ApiCalls(object):
         logging.debug("Getting sequencing runs")
 
         url = self._get_link(self.base_url, "sequencingRuns")
-        response = self._session.get(url)
-
-        json_res_list = response.json()["resource"]["resources"]
+        json_res_list = self._get_resource(url)["resource"]["resources"]
 
         return json_res_list
 
@@ -828,9 +1026,7 @@ class ApiCalls(object):
         :return: True or False
         """
         logging.debug("project exists: {}".format(project_id))
-        project_id = str(project_id)
-        project_list = self.get_projects()
-        return any([p.id == project_id for p in project_list])
+        return str(project_id) in self._get_project_index()
 
     def sample_exists(self, sample_name, project_id):
         """
@@ -841,5 +1037,32 @@ class ApiCalls(object):
         :return: True or False
         """
         logging.debug("sample exists: sample: {}, on project: {}".format(sample_name, project_id))
+        return sample_name.lower() in self._get_sample_index(project_id)
+
+    def _get_project_index(self):
+        """
+        Returns the projects from get_projects indexed by id, {id: Project}
+        The index is rebuilt when the cached project list has been replaced
+        """
+        project_list = self.get_projects()
+        indexed_list, project_index = self._project_index
+        if indexed_list is not project_list:
+            project_index = {}
+            for project in project_list:
+                project_index.setdefault(project.id, project)
+            self._project_index = (project_list, project_index)
+        return project_index
+
+    def _get_sample_index(self, project_id):
+        """
+        Returns the samples from get_samples indexed by lower case sample name, {name: Sample}
+        The index is rebuilt when the cached sample list of the project has been replaced
+        """
         sample_list = self.get_samples(project_id)
-        return any([s.sample_name.lower() == sample_name.lower() for s in sample_list])
+        indexed_list, sample_index = self._sample_indexes.get(project_id, (None, None))
+        if indexed_list is not sample_list:
+            sample_index = {}
+            for sample in sample_list:
+                sample_index.setdefault(sample.sample_name.lower(), sample)
+            self._sample_indexes[project_id] = (sample_list, sample_index)
+        return sample_index
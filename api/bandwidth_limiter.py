@@ -0,0 +1,133 @@
+import logging
+import re
+import threading
+import time
+
+# A schedule entry, e.g. "08:00-18:00=1000000"
+_SCHEDULE_ENTRY = re.compile(r"^(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2})=(\d+)$")
+# Seconds between checks for new limits, when the limiter is given a function to check with
+RELOAD_LIMITS_SECONDS = 30
+
+
+def parse_schedule(schedule):
+    """
+    Parses a bandwidth schedule, comma separated entries of "HH:MM-HH:MM=bytes per second"
+    e.g. "08:00-18:00=1000000, 18:00-20:00=5000000". An entry may cross midnight (e.g. "22:00-06:00=5000000").
+    A rate of 0 means no limit during that entry, e.g. "22:00-06:00=0" lifts the limit overnight.
+
+    arguments:
+        schedule -- schedule string, empty for no schedule
+
+    returns a list of (start minute of the day, end minute of the day, bytes per second)
+    raises ValueError when the schedule can not be parsed
+    """
+    windows = []
+    for entry in schedule.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        match = _SCHEDULE_ENTRY.match(entry.replace(" ", ""))
+        if match is None:
+            raise ValueError("Bandwidth schedule entry '{}' is not of the form HH:MM-HH:MM=bytes".format(entry))
+        start_hour, start_minute, end_hour, end_minute, rate = (int(group) for group in match.groups())
+        if start_hour > 23 or end_hour > 24 or start_minute > 59 or end_minute > 59:
+            raise ValueError("Bandwidth schedule entry '{}' is not a valid time of day".format(entry))
+        windows.append((start_hour * 60 + start_minute, end_hour * 60 + end_minute, rate))
+    return windows
+
+
+class BandwidthLimiter(object):
+    """
+    Limits the combined upload rate of every file upload that uses it, with a token bucket
+
+    Uploads ask for permission before sending each chunk. Requests are granted in the order they are made,
+    so concurrent uploads share the bandwidth evenly. Up to burst_seconds worth of unused bandwidth
+    can be used at once.
+
+    The limit can be changed at any time with set_limits, and can follow a time of day schedule.
+    A rate of 0 (or None) means no limit.
+    """
+
+    def __init__(self, rate=None, schedule=None, burst_seconds=1.0, reload_limits=None,
+                 reload_seconds=RELOAD_LIMITS_SECONDS):
+        """
+        arguments:
+            rate -- bytes per second when no schedule entry applies
+            schedule -- optional list of (start minute of the day, end minute of the day, bytes per second),
+                see parse_schedule
+            burst_seconds -- seconds of unused bandwidth that can be saved up
+            reload_limits -- optional function, called from consume at most every reload_seconds so uploads that
+                are running pick up new limits, e.g. from the config file. It sets them with set_limits
+            reload_seconds -- seconds between calls to reload_limits
+        """
+        self._lock = threading.Lock()
+        self._rate = rate
+        self._schedule = schedule or []
+        self._burst_seconds = burst_seconds
+        # time at which everything granted so far has been paid for at the current rate
+        self._available_at = time.monotonic()
+        self._reload_limits = reload_limits
+        self._reload_seconds = reload_seconds
+        self._next_reload = time.monotonic() + reload_seconds
+
+    def set_limits(self, rate=None, schedule=None):
+        """
+        Changes the limit, uploads in progress use the new limit from their next chunk
+        """
+        with self._lock:
+            if (rate, schedule or []) != (self._rate, self._schedule):
+                logging.info("Upload bandwidth limit: {}".format(
+                    "{} bytes/s".format(rate) if rate else "none") +
+                    (", with schedule {}".format(schedule) if schedule else ""))
+            self._rate = rate
+            self._schedule = schedule or []
+
+    def current_rate(self):
+        """
+        returns the bytes per second allowed now, None when there is no limit
+        """
+        local_time = time.localtime()
+        minute = local_time.tm_hour * 60 + local_time.tm_min
+        rate = self._rate
+        for start, end, window_rate in self._schedule:
+            if (start <= minute < end) if start <= end else (minute >= start or minute < end):
+                rate = window_rate
+                break
+        return rate or None
+
+    def consume(self, byte_count):
+        """
+        Blocks until byte_count bytes may be sent
+
+        The wait is worked out at the rate in effect now, so callers should ask for small amounts at a time
+        to follow changes of the limit closely
+        """
+        self._reload_if_due()
+        rate = self.current_rate()
+        if rate is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            # unused bandwidth builds up, but only for burst_seconds
+            self._available_at = max(self._available_at, now - self._burst_seconds) + byte_count / rate
+            wait = self._available_at - now
+        if wait > 0:
+            time.sleep(wait)
+
+    def _reload_if_due(self):
+        """
+        Calls reload_limits when reload_seconds have passed since it was last called, from one upload at a time
+        A failure is logged and the current limits are kept, it never stops an upload
+        """
+        if self._reload_limits is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_reload:
+                return
+            self._next_reload = now + self._reload_seconds
+        try:
+            self._reload_limits()
+        except Exception as e:
+            logging.warning("Could not check for new upload bandwidth limits, keeping the current limits: {}"
+                            "".format(e))
@@ -0,0 +1,296 @@
+import hashlib
+import logging
+import queue
+import threading
+import time
+from os import path
+
+from . import exceptions
+
+# Default memory (in bytes) one upload may use to read its files ahead of sending them
+DEFAULT_BUFFER_MEMORY = 32 * 1024 * 1024
+# The memory is split into this many buffers, so reading can run this many buffers ahead of sending
+READ_AHEAD_BUFFERS = 4
+# Bounds of the chunk size, the chunk size adapts to how fast files are read and sent
+MIN_CHUNK_SIZE = 64 * 1024
+INITIAL_CHUNK_SIZE = 1024 * 1024
+# Chunks are sized so one takes about this many seconds to read or send, whichever is slower
+TARGET_CHUNK_SECONDS = 0.25
+# The progress of a file is logged at most this often
+PROGRESS_LOG_SECONDS = 10
+# When the upload rate is limited, chunks are sent in pieces of at most this many bytes, so the upload is paced
+# evenly and a change of the limit applies from the next piece rather than the next chunk
+LIMITED_PIECE_SIZE = 256 * 1024
+
+
+class MultipartBody(object):
+    """
+    A multipart/form-data request body, made of files and fields, that requests can stream
+
+    The length of the body is known before it is sent, so the request is sent with a Content-Length instead of
+    being chunked. File contents are read ahead on a background thread into a ring of reusable buffers
+    (see _ReadAhead) and sent as memoryviews of them, so reading the disk and writing the socket overlap,
+    and no new bytes object is created for each piece of a file. The MD5 and SHA-256 of each file are computed
+    on the same thread as it is read, so checking the upload later does not need the files to be read again.
+
+    The body can only be iterated over by one request at a time.
+    """
+
+    def __init__(self, boundary, buffer_memory=DEFAULT_BUFFER_MEMORY, should_stop=None, bandwidth_limiter=None):
+        """
+        arguments:
+            boundary -- the multipart boundary, must match the boundary in the Content-Type header
+            buffer_memory -- memory (in bytes) the buffers files are read into may use
+            should_stop -- optional function, when it returns True the upload is stopped
+                and IridaUploadCanceledException is raised
+            bandwidth_limiter -- optional BandwidthLimiter, each piece of a file waits for it before it is sent,
+                see LIMITED_PIECE_SIZE
+        """
+        self._boundary = boundary
+        self._max_chunk_size = max(MIN_CHUNK_SIZE, buffer_memory // READ_AHEAD_BUFFERS)
+        self._should_stop = should_stop
+        self._bandwidth_limiter = bandwidth_limiter
+        # each part is either bytes, or a (file name, files on disk, file size) tuple
+        self._parts = []
+        self._length = 0
+        self._checksums = {}
+
+    def add_file(self, parameter_name, filename, parts=None):
+        """
+        Adds a file field, the size of the file is read now and that many bytes are sent
+
+        arguments:
+            parameter_name -- the form field name to send to the server
+            filename -- path of the file to send
+            parts -- optional list of files on disk that are sent back to back as the contents of filename
+                (e.g. the lanes of a gzipped fastq file), filename itself does not need to exist
+        """
+        if parts is None:
+            parts = [filename]
+        file_size = 0
+        for part in parts:
+            try:
+                file_size += path.getsize(part)
+            except OSError:
+                logging.error("Could not open file: {}".format(part))
+                raise exceptions.FileError("Could not open file: {}".format(part))
+
+        self._add_bytes(("\r\n--{boundary}\r\n"
+                         "Content-Disposition: form-data; name=\"{parameter_name}\"; filename=\"{filename}\"\r\n\r\n"
+                         "").format(boundary=self._boundary, parameter_name=parameter_name,
+                                    filename=filename.replace("\\", "/")).encode())
+        self._parts.append((filename, parts, file_size))
+        self._length += file_size
+
+    def add_parameters(self, parameter_name, parameters):
+        """
+        Adds a field with additional file metadata
+
+        arguments:
+            parameter_name -- the form field name to send to the server
+            parameters -- a JSON encoded object with the metadata for the file
+        """
+        self._add_bytes(("\r\n--{boundary}\r\nContent-Disposition: form-data; name=\"{parameter_name}\"\r\n"
+                         "Content-Type: application/json\r\n\r\n{parameters}\r\n"
+                         "").format(boundary=self._boundary, parameter_name=parameter_name,
+                                    parameters=parameters).encode())
+
+    def finish(self):
+        """
+        Adds the terminal boundary, no parts can be added after it
+        """
+        self._add_bytes("--{boundary}--".format(boundary=self._boundary).encode())
+
+    def _add_bytes(self, data):
+        self._parts.append(data)
+        self._length += len(data)
+
+    @property
+    def checksums(self):
+        """
+        Checksums of the files that have been sent completely, as
+        {file name: {"size": bytes sent, "md5": hex digest, "sha256": hex digest}}
+        """
+        return self._checksums
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for part in self._parts:
+            if isinstance(part, bytes):
+                yield part
+            else:
+                filename, file_parts, file_size = part
+                yield from self._send_file(filename, file_parts, file_size)
+
+    def _send_file(self, filename, file_parts, file_size):
+        """
+        Yields the contents of a file as memoryviews of the read ahead buffers, until file_size bytes have been sent
+        """
+        if file_parts == [filename]:
+            logging.info("Starting to send file {}".format(filename))
+        else:
+            logging.info("Starting to send file {} from {} parts".format(filename, len(file_parts)))
+        bytes_sent = 0
+        next_progress_log = time.monotonic() + PROGRESS_LOG_SECONDS
+        read_ahead = _ReadAhead(file_parts, file_size, self._max_chunk_size)
+        try:
+            for chunk in read_ahead:
+                piece_size = len(chunk) if self._bandwidth_limiter is None else LIMITED_PIECE_SIZE
+                for offset in range(0, len(chunk), piece_size):
+                    piece = chunk[offset:offset + piece_size]
+                    if self._should_stop is not None and self._should_stop():
+                        logging.info("Halting upload on user request.")
+                        raise exceptions.IridaUploadCanceledException("Upload halted on user request.")
+                    if self._bandwidth_limiter is not None:
+                        self._bandwidth_limiter.consume(len(piece))
+                    bytes_sent += len(piece)
+                    # logged rather than printed, so concurrent uploads do not overwrite each other and the progress
+                    # reaches the run's log
+                    if time.monotonic() >= next_progress_log:
+                        logging.info("Sent {} of {} bytes ({}%) of file {}".format(
+                            bytes_sent, file_size, round(bytes_sent / file_size * 100, 2), filename))
+                        next_progress_log = time.monotonic() + PROGRESS_LOG_SECONDS
+                    yield piece
+        finally:
+            read_ahead.close()
+        self._checksums[filename] = read_ahead.checksums()
+        logging.info("Finished sending file {}".format(filename))
+
+
+class _ReadAhead(object):
+    """
+    Reads files, one after the other, on a background thread into a ring of READ_AHEAD_BUFFERS buffers,
+    while the caller sends the buffers that have been filled
+
+    The size of each read adapts to the measured read and send throughput, so a chunk takes about
+    TARGET_CHUNK_SECONDS to go through the slower of the two, between MIN_CHUNK_SIZE and max_chunk_size.
+    Iterating yields memoryviews, each one is only valid until the next one is requested.
+    The files are hashed as one file as they are read, checksums() is complete once every chunk has been yielded.
+    """
+
+    def __init__(self, file_list, file_size, max_chunk_size):
+        """
+        arguments:
+            file_list -- files to read, in order
+            file_size -- combined size of the files, exactly this many bytes are read
+            max_chunk_size -- size of each buffer
+        """
+        self._file_list = file_list
+        self._file_size = file_size
+        self._max_chunk_size = max(MIN_CHUNK_SIZE, min(max_chunk_size, file_size))
+        self._chunk_size = min(INITIAL_CHUNK_SIZE, self._max_chunk_size)
+        # bytes per second, None until the first chunk has been measured
+        self._read_rate = None
+        self._send_rate = None
+        self._free_buffers = queue.Queue()
+        self._filled_buffers = queue.Queue()
+        self._closed = threading.Event()
+        self._thread = None
+        self._bytes_read = 0
+        self._md5 = hashlib.md5()
+        self._sha256 = hashlib.sha256()
+
+    @property
+    def chunk_size(self):
+        return self._chunk_size
+
+    def checksums(self):
+        return {"size": self._bytes_read, "md5": self._md5.hexdigest(), "sha256": self._sha256.hexdigest()}
+
+    def __iter__(self):
+        for _ in range(READ_AHEAD_BUFFERS):
+            self._free_buffers.put(memoryview(bytearray(self._max_chunk_size)))
+        # named after the sending thread, so its log records go to the same run log
+        self._thread = threading.Thread(target=self._read, name=threading.current_thread().name + "_read-ahead",
+                                        daemon=True)
+        self._thread.start()
+
+        while True:
+            item = self._filled_buffers.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            buffer, read_count = item
+            start = time.monotonic()
+            yield buffer[:read_count]
+            # the caller asks for the next chunk once it has sent this one
+            self._send_rate = self._measure(self._send_rate, read_count, time.monotonic() - start)
+            self._adapt_chunk_size()
+            self._free_buffers.put(buffer)
+
+    def _read(self):
+        """
+        Fills free buffers from the files until file_size bytes have been read, runs on the read ahead thread
+        """
+        filename = None
+        try:
+            for filename in self._file_list:
+                # unbuffered, readinto reads straight into our buffers
+                with open(filename, "rb", buffering=0) as fastq_file:
+                    if not self._read_file(fastq_file):
+                        return
+            if self._bytes_read < self._file_size:
+                # the Content-Length has already been sent, a shorter body would never be accepted
+                self._filled_buffers.put(exceptions.FileError(
+                    "File changed while it was being uploaded: {}".format(filename)))
+                return
+        except IOError:
+            logging.error("Could not open file: {}".format(filename))
+            self._filled_buffers.put(exceptions.FileError("Could not open file: {}".format(filename)))
+            return
+        self._filled_buffers.put(None)
+
+    def _read_file(self, fastq_file):
+        """
+        Fills free buffers from one file until it ends, or file_size bytes have been read
+
+        returns False when reading was stopped with close()
+        """
+        while self._bytes_read < self._file_size:
+            buffer = self._free_buffers.get()
+            if buffer is None or self._closed.is_set():
+                return False
+            start = time.monotonic()
+            read_size = min(self._chunk_size, self._file_size - self._bytes_read)
+            read_count = fastq_file.readinto(buffer[:read_size])
+            if not read_count:
+                self._free_buffers.put(buffer)
+                return True
+            self._read_rate = self._measure(self._read_rate, read_count, time.monotonic() - start)
+            # hashlib releases the GIL for large updates, so hashing overlaps with sending too
+            self._md5.update(buffer[:read_count])
+            self._sha256.update(buffer[:read_count])
+            self._bytes_read += read_count
+            self._filled_buffers.put((buffer, read_count))
+        return True
+
+    @staticmethod
+    def _measure(rate, byte_count, seconds):
+        """
+        Returns the moving average of the throughput, including a chunk of byte_count bytes that took seconds
+        """
+        chunk_rate = byte_count / max(seconds, 1e-6)
+        if rate is None:
+            return chunk_rate
+        return 0.7 * rate + 0.3 * chunk_rate
+
+    def _adapt_chunk_size(self):
+        rates = [rate for rate in (self._read_rate, self._send_rate) if rate is not None]
+        if not rates:
+            return
+        target = min(rates) * TARGET_CHUNK_SECONDS
+        # change by at most a factor of 2 per chunk, so one slow read does not swing the size
+        target = max(self._chunk_size / 2, min(self._chunk_size * 2, target))
+        self._chunk_size = int(max(MIN_CHUNK_SIZE, min(self._max_chunk_size, target)))
+
+    def close(self):
+        """
+        Stops the read ahead thread, it is stopped after the read in progress
+        """
+        self._closed.set()
+        self._free_buffers.put(None)
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class TokenCache(object):
+    """
+    Keeps OAuth access tokens on disk, so every uploader process for the same server and user can reuse a token
+    instead of asking IRIDA for a new one
+
+    Tokens are stored by (base_url, client_id, username) with the time they expire.
+    The cache file is only readable by the current user, and is locked while it is read or written
+    so processes that start at the same time do not overwrite each other.
+
+    The cache never stops an upload: if the file can not be read or written, a new token is requested as usual.
+    """
+
+    def __init__(self, cache_file):
+        """
+        arguments:
+            cache_file -- path to the file the tokens are kept in, the directory is created if it does not exist
+        """
+        self._cache_file = cache_file
+        self._lock_file = cache_file + ".lock"
+        self._thread_lock = threading.Lock()
+
+    @property
+    def cache_file(self):
+        return self._cache_file
+
+    @staticmethod
+    def _make_key(base_url, client_id, username):
+        # the key is hashed so the file does not list the servers and users that have been used
+        key = "\n".join([base_url, client_id, username])
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def get(self, base_url, client_id, username, min_lifetime=0):
+        """
+        Returns a cached access token that is still valid for at least min_lifetime seconds
+
+        returns (access_token, seconds until it expires), or None when there is no usable token
+        """
+        key = self._make_key(base_url, client_id, username)
+        try:
+            with self._locked(exclusive=False):
+                entry = self._read().get(key)
+        except OSError as e:
+            logging.warning("Could not read access token cache {}: {}".format(self._cache_file, e))
+            return None
+
+        if entry is None:
+            return None
+        expires_in = entry["expires_at"] - time.time()
+        if expires_in <= min_lifetime:
+            return None
+        return entry["access_token"], expires_in
+
+    def put(self, base_url, client_id, username, access_token, expires_in):
+        """
+        Stores an access token that expires in expires_in seconds, expired tokens are removed from the file
+        """
+        key = self._make_key(base_url, client_id, username)
+        try:
+            with self._locked(exclusive=True):
+                tokens = self._read()
+                tokens[key] = {"access_token": access_token, "expires_at": time.time() + expires_in}
+                self._write(tokens)
+        except OSError as e:
+            logging.warning("Could not write access token cache {}: {}".format(self._cache_file, e))
+
+    def discard(self, base_url, client_id, username, access_token):
+        """
+        Removes a token that IRIDA rejected
+        A newer token that another process already stored is kept
+        """
+        key = self._make_key(base_url, client_id, username)
+        try:
+            with self._locked(exclusive=True):
+                tokens = self._read()
+                entry = tokens.get(key)
+                if entry is not None and entry["access_token"] == access_token:
+                    del tokens[key]
+                    self._write(tokens)
+        except OSError as e:
+            logging.warning("Could not write access token cache {}: {}".format(self._cache_file, e))
+
+    def _read(self):
+        """
+        Returns the tokens in the cache file that have not expired
+        Expects the caller to hold the file lock
+        """
+        try:
+            with open(self._cache_file, "r") as cache_file:
+                tokens = json.load(cache_file)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logging.warning("Access token cache {} is not valid, ignoring it".format(self._cache_file))
+            return {}
+
+        now = time.time()
+        return {key: entry for key, entry in tokens.items()
+                if isinstance(entry, dict) and entry.get("expires_at", 0) > now and "access_token" in entry}
+
+    def _write(self, tokens):
+        """
+        Replaces the cache file in one step, with a file that only the current user can read
+        Expects the caller to hold the file lock
+        """
+        # mkstemp creates the file with 0600 permissions
+        handle, temp_file = tempfile.mkstemp(dir=os.path.dirname(self._cache_file), prefix=".tokens")
+        try:
+            with os.fdopen(handle, "w") as cache_file:
+                json.dump(tokens, cache_file)
+            os.replace(temp_file, self._cache_file)
+        except OSError:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+
+    @contextmanager
+    def _locked(self, exclusive):
+        """
+        Holds the lock file (and a lock for other threads in this process) while the cache file is used
+        """
+        cache_dir = os.path.dirname(self._cache_file)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, mode=0o700)
+
+        with self._thread_lock:
+            handle = os.open(self._lock_file, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                else:
+                    # Windows only has exclusive locks
+                    msvcrt.locking(handle, msvcrt.LK_LOCK, 1)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(handle, fcntl.LOCK_UN)
+                    else:
+                        msvcrt.locking(handle, msvcrt.LK_UNLCK, 1)
+            finally:
+                os.close(handle)
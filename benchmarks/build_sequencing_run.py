@@ -0,0 +1,115 @@
+"""
+Benchmark for building a SequencingRun from large sample sheets
+
+Writes MiSeq SampleSheet.csv / directory SampleList.csv files with an increasing number of rows and times
+parse + build for each. The per row time should stay flat as the sheet grows.
+
+The data directory listing is faked so the benchmark does not need to create a fastq file for every row.
+
+Run from the root of the repository:
+    python3 -m benchmarks.build_sequencing_run
+    python3 -m benchmarks.build_sequencing_run --parser directory --rows 1000 10000 100000 --memory
+"""
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+
+import parsers.directory.sample_parser
+import parsers.miseq.sample_parser
+from parsers.sample_sheet import clear_sample_sheet_cache
+
+# samples per project, so the number of projects grows with the sheet
+SAMPLES_PER_PROJECT = 10
+
+
+def _write_miseq_sheet(sheet_dir, rows):
+    file_list = []
+    with open(os.path.join(sheet_dir, "SampleSheet.csv"), "w") as sheet:
+        sheet.write("[Header]\nIEMFileVersion,4\nWorkflow,GenerateFASTQ\n\n[Reads]\n151\n151\n\n[Data]\n")
+        sheet.write("Sample_ID,Sample_Name,Sample_Plate,Sample_Well,Sample_Project,Description\n")
+        for i in range(rows):
+            sample_name = "sample-{}".format(i)
+            sheet.write("{name},{name},1,A01,{project},\n".format(name=sample_name, project=i // SAMPLES_PER_PROJECT))
+            for read in (1, 2):
+                file_list.append("{}_S{}_L001_R{}_001.fastq.gz".format(sample_name, i + 1, read))
+    return os.path.join(sheet_dir, "SampleSheet.csv"), file_list
+
+
+def _write_directory_sheet(sheet_dir, rows):
+    file_list = []
+    with open(os.path.join(sheet_dir, "SampleList.csv"), "w") as sheet:
+        sheet.write("[Data]\nSample_Name,Project_ID,File_Forward,File_Reverse\n")
+        for i in range(rows):
+            file_f = "sample-{}_R1.fastq.gz".format(i)
+            file_r = "sample-{}_R2.fastq.gz".format(i)
+            sheet.write("sample-{},{},{},{}\n".format(i, i // SAMPLES_PER_PROJECT, file_f, file_r))
+            file_list.extend([file_f, file_r])
+    return os.path.join(sheet_dir, "SampleList.csv"), file_list
+
+
+def _build_miseq(sheet_file):
+    return parsers.miseq.sample_parser.build_sequencing_run_from_samples(sheet_file, {"layoutType": "PAIRED_END"})
+
+
+def _build_directory(sheet_file):
+    return parsers.directory.sample_parser.build_sequencing_run_from_samples(sheet_file)
+
+
+PARSERS = {
+    "miseq": (parsers.miseq.sample_parser, _write_miseq_sheet, _build_miseq),
+    "directory": (parsers.directory.sample_parser, _write_directory_sheet, _build_directory),
+}
+
+
+def run(parser_name, row_counts, measure_memory):
+    module, write_sheet, build = PARSERS[parser_name]
+
+    print("{:>10} {:>12} {:>14} {:>12}".format("rows", "seconds", "us per row", "peak MiB"))
+    for rows in row_counts:
+        sheet_dir = tempfile.mkdtemp()
+        try:
+            sheet_file, file_list = write_sheet(sheet_dir, rows)
+            clear_sample_sheet_cache()
+
+            def fake_walk(directory):
+                return iter([(directory, [], file_list)])
+
+            with patch.object(module, "walk", fake_walk):
+                if measure_memory:
+                    tracemalloc.start()
+                start = time.perf_counter()
+                sequencing_run = build(sheet_file)
+                elapsed = time.perf_counter() - start
+                peak = 0
+                if measure_memory:
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+
+            sample_count = sum(len(p.sample_list) for p in sequencing_run.project_list)
+            assert sample_count == rows, "expected {} samples, built {}".format(rows, sample_count)
+            print("{:>10} {:>12.3f} {:>14.1f} {:>12}".format(
+                rows, elapsed, elapsed / rows * 1e6, "{:.1f}".format(peak / 2 ** 20) if measure_memory else "-"))
+        finally:
+            shutil.rmtree(sheet_dir)
+
+
+def main(argv=None):
+    argument_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    argument_parser.add_argument("--parser", choices=sorted(PARSERS.keys()), default="miseq")
+    argument_parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    argument_parser.add_argument("--memory", action="store_true",
+                                 help="Also report peak memory (tracing slows the build down)")
+    args = argument_parser.parse_args(argv)
+    # keep the per sheet info logging out of the results
+    logging.getLogger().setLevel(logging.WARNING)
+    run(args.parser, args.rows, args.memory)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Microbenchmark for validating a SequencingRun before upload
+
+Times core.model_validator.validate_sequencing_run (compiled schemas) against validating the same run with
+cerberus Validators, the way the validator worked before the schemas were compiled.
+
+Run from the root of the repository:
+    python3 -m benchmarks.model_validator
+    python3 -m benchmarks.model_validator --samples 100 1000 10000 --repeat 5
+"""
+import argparse
+import sys
+import time
+
+import model
+from core import model_validator
+
+SAMPLES_PER_PROJECT = 10
+
+
+def _build_sequencing_run(sample_count):
+    projects = {}
+    for i in range(sample_count):
+        sample = model.Sample("sample-{}".format(i), description="", sample_number=i + 1,
+                              samp_dict={"sample_project": str(i // SAMPLES_PER_PROJECT)})
+        sample.sequence_file = model.SequenceFile(
+            file_list=["sample-{}_S1_L001_R1_001.fastq.gz".format(i), "sample-{}_S1_L001_R2_001.fastq.gz".format(i)],
+            properties_dict={"Sample_Well": "A01", "index": "AAAAAAAA"})
+        project_id = str(i // SAMPLES_PER_PROJECT)
+        projects.setdefault(project_id, model.Project(id=project_id)).add_sample(sample)
+    return model.SequencingRun({"layoutType": "PAIRED_END"}, list(projects.values()))
+
+
+def _validate_with_cerberus(sequencing_run):
+    """
+    Validates like the uncompiled validator did, with new cerberus Validators for each run
+    """
+    from cerberus import Validator, TypeDefinition
+
+    types_mapping = dict(Validator.types_mapping)
+    for type_name, (included, excluded) in model_validator._TYPE_DEFINITIONS.items():
+        types_mapping.setdefault(type_name, TypeDefinition(type_name, included, excluded))
+    validator_class = type('ModelValidator', (Validator,), {'types_mapping': types_mapping})
+
+    v_sequencing_run = validator_class(model.SequencingRun.uploadable_schema, allow_unknown=True)
+    v_project = validator_class(model.Project.uploadable_schema, allow_unknown=True)
+    v_sample = validator_class(model.Sample.uploadable_schema, allow_unknown=True)
+    v_sequence_file = validator_class(model.SequenceFile.uploadable_schema, allow_unknown=True)
+
+    error_count = 0
+    error_count += not v_sequencing_run.validate(sequencing_run.get_dict())
+    for p in sequencing_run.project_list:
+        error_count += not v_project.validate(p.get_dict())
+        for s in p.sample_list:
+            error_count += not v_sample.validate(s.get_dict())
+            error_count += not v_sequence_file.validate(s.sequence_file.get_dict())
+            model_validator._validate_sequence_file_names(s.sequence_file)
+    return error_count
+
+
+def _best_time(function, argument, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(argument)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(sample_counts, repeat):
+    try:
+        import cerberus  # noqa: F401
+        has_cerberus = True
+    except ImportError:
+        has_cerberus = False
+
+    print("{:>10} {:>14} {:>14} {:>10}".format("samples", "compiled ms", "cerberus ms", "speedup"))
+    for sample_count in sample_counts:
+        sequencing_run = _build_sequencing_run(sample_count)
+        assert model_validator.validate_sequencing_run(sequencing_run).is_valid()
+
+        compiled = _best_time(model_validator.validate_sequencing_run, sequencing_run, repeat)
+        if has_cerberus:
+            cerberus_time = _best_time(_validate_with_cerberus, sequencing_run, repeat)
+            print("{:>10} {:>14.2f} {:>14.2f} {:>9.1f}x".format(
+                sample_count, compiled * 1000, cerberus_time * 1000, cerberus_time / compiled))
+        else:
+            print("{:>10} {:>14.2f} {:>14} {:>10}".format(sample_count, compiled * 1000, "-", "-"))
+
+
+def main(argv=None):
+    argument_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    argument_parser.add_argument("--samples", type=int, nargs="+", default=[100, 1000, 10000])
+    argument_parser.add_argument("--repeat", type=int, default=3, help="Runs per size, the best time is shown")
+    args = argument_parser.parse_args(argv)
+    run(args.samples, args.repeat)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
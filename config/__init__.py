@@ -1 +1 @@
-from config.config import read_config_option, write_config_option, setup
+from config.config import read_config_option, write_config_option, setup, reload_if_changed
@@ -9,6 +9,24 @@ import global_settings
 
 conf_parser = None
 user_config_file = None
+# Modification time of the config file when it was last read, see reload_if_changed
+_config_file_mtime = None
+
+# Defaults for settings that are not in the config file
+SettingsDefault = namedtuple('SettingsDefault', ['setting', 'default_value'])
+
+default_settings = [SettingsDefault._make(["client_id", ""]),
+                    SettingsDefault._make(["client_secret", ""]),
+                    SettingsDefault._make(["username", ""]),
+                    SettingsDefault._make(["password", ""]),
+                    SettingsDefault._make(["base_url", ""]),
+                    SettingsDefault._make(["parser", "directory"]),
+                    SettingsDefault._make(["max_concurrent_uploads", "1"]),
+                    SettingsDefault._make(["cache_access_token", "True"]),
+                    SettingsDefault._make(["upload_buffer_mb", "32"]),
+                    SettingsDefault._make(["upload_bandwidth_limit", "0"]),
+                    SettingsDefault._make(["upload_bandwidth_schedule", ""]),
+                    SettingsDefault._make(["state_database", ""])]
 
 
 def setup():
@@ -19,6 +37,7 @@ def setup():
 
     global conf_parser
     global user_config_file
+    global _config_file_mtime
     # If a config file was passed as a parameter, use it, else use the default config directory
     if global_settings.config_file:
         user_config_file = global_settings.config_file
@@ -31,16 +50,6 @@ def setup():
     conf_parser = RawConfigParser()
     logging.debug("User config file: " + user_config_file)
 
-    # Set defaults for settings if file does not already exist
-    SettingsDefault = namedtuple('SettingsDefault', ['setting', 'default_value'])
-
-    default_settings = [SettingsDefault._make(["client_id", ""]),
-                        SettingsDefault._make(["client_secret", ""]),
-                        SettingsDefault._make(["username", ""]),
-                        SettingsDefault._make(["password", ""]),
-                        SettingsDefault._make(["base_url", ""]),
-                        SettingsDefault._make(["parser", "directory"])]
-
     load_from_file = os.path.exists(user_config_file)
     # Loading config from file
     if load_from_file:
@@ -74,6 +83,47 @@ def setup():
         logging.info("Config File Created: " + str(user_config_file))
         logging.info("Please edit your config file to connect to IRIDA")
 
+    _config_file_mtime = _get_config_file_mtime()
+
+
+def _get_config_file_mtime():
+    try:
+        return os.stat(user_config_file).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+
+
+def reload_if_changed():
+    """
+    Reads the config file again when it has changed since it was last read, so settings that are read for each run
+    (e.g. the upload bandwidth limits) can be changed without restarting the uploader
+    A config file that can not be read is ignored, and the settings read before are kept
+
+    :return: True when the config file was read again
+    """
+    global conf_parser
+    global _config_file_mtime
+    if conf_parser is None:
+        return False
+    config_file_mtime = _get_config_file_mtime()
+    if config_file_mtime is None or config_file_mtime == _config_file_mtime:
+        return False
+
+    new_conf_parser = RawConfigParser()
+    try:
+        new_conf_parser.read(user_config_file)
+        for config in default_settings:
+            if not new_conf_parser.has_option("Settings", config.setting):
+                new_conf_parser.set("Settings", config.setting, config.default_value)
+    except Exception as e:
+        logging.error("Config file {} is not valid, keeping the settings read before: {}".format(user_config_file, e))
+        return False
+    logging.info("Config file {} changed, reading it again".format(user_config_file))
+    # replaced in one step, threads reading options see either the old or the new settings
+    conf_parser = new_conf_parser
+    _config_file_mtime = config_file_mtime
+    return True
+
 
 def read_config_option(key, expected_type=None, default_value=None):
     """Read the specified value from the configuration file.
@@ -95,8 +145,10 @@ def read_config_option(key, expected_type=None, default_value=None):
             return conf_parser.get("Settings", key)
         elif expected_type is bool:
             return conf_parser.getboolean("Settings", key)
+        elif expected_type is int:
+            return conf_parser.getint("Settings", key)
     except (ValueError, NoOptionError) as e:
-        if default_value:
+        if default_value is not None:
             return default_value
         else:
             raise
@@ -116,3 +168,5 @@ def write_config_option(field_name, field_value):
 
     with open(user_config_file, 'w') as c_file:
         conf_parser.write(c_file)
+    global _config_file_mtime
+    _config_file_mtime = _get_config_file_mtime()
@@ -4,6 +4,13 @@ It handles initializing and managing an api instance as well as preparing IRIDA
 """
 
 import logging
+import os
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from appdirs import user_cache_dir
 
 import api
 import config
@@ -13,9 +20,33 @@ from . import model_validator
 # The api instance is a global variable which lets the api behave like a singleton
 # managed within this file
 _api_instance = None
-
-
-def _initialize_api(client_id, client_secret, base_url, username, password, max_wait_time=20):
+# The config values the api instance was created from, it is only re-created when they change
+_api_settings = None
+_api_lock = threading.Lock()
+# Number of samples that are uploaded at the same time, read from the config file when the api is initialized
+# The limit holds across every run this process uploads at the same time, see _get_upload_streams
+_max_concurrent_uploads = 1
+_upload_streams = None
+_upload_streams_lock = threading.Lock()
+# Shared by every api instance, so the bandwidth limit holds across runs. The limits are read from the config file
+# each time the api is initialized, and checked again while files upload, see _reload_bandwidth_limits
+_bandwidth_limiter = api.BandwidthLimiter(reload_limits=lambda: _reload_bandwidth_limits())
+
+# Number of requests sent at the same time while checking IRIDA for a run and preparing it (not uploads)
+MAX_CONCURRENT_REQUESTS = 8
+
+# Fields of a sequence file on IRIDA that are compared with the checksums recorded during upload, when they are set
+IRIDA_CHECKSUM_FIELDS = {"uploadSha256": "sha256"}
+IRIDA_SIZE_FIELDS = ("fileSize", "fileSizeBytes")
+
+# Outcomes of a sample upload
+SAMPLE_UPLOAD_COMPLETE = "complete"
+SAMPLE_UPLOAD_ERROR = "error"
+SAMPLE_UPLOAD_CANCELED = "canceled"
+
+
+def _initialize_api(client_id, client_secret, base_url, username, password, max_wait_time=20, token_cache=None,
+                    upload_buffer_memory=None, bandwidth_limiter=None):
     """
     Creates the ApiCalls object from the api layer.
     Sets the instance to use the global _api_instance variable so it behaves as a singleton that can be easily re-init
@@ -26,10 +57,16 @@ def _initialize_api(client_id, client_secret, base_url, username, password, max_
     :param username:
     :param password:
     :param max_wait_time:
+    :param token_cache: optional api.TokenCache to share access tokens with other uploader processes
+    :param upload_buffer_memory: optional, bytes each file upload may use to read ahead of sending
+    :param bandwidth_limiter: optional api.BandwidthLimiter for the file uploads
     :return: The ApiCalls instance
     """
-    global _api_instance
-    _api_instance = api.ApiCalls(client_id, client_secret, base_url, username, password, max_wait_time)
+    global _api_instance, _api_settings
+    _api_settings = None
+    _api_instance = api.ApiCalls(client_id, client_secret, base_url, username, password, max_wait_time,
+                                 token_cache=token_cache, upload_buffer_memory=upload_buffer_memory,
+                                 bandwidth_limiter=bandwidth_limiter)
     return _api_instance
 
 
@@ -48,23 +85,209 @@ def _get_api_instance():
     return _api_instance
 
 
+def get_api_instance():
+    """
+    Returns the shared ApiCalls instance, initializing it from the config file on first use
+
+    Parsers that need to query IRIDA should use this, so they share the session and the project / sample caches
+    with the upload instead of logging in again
+
+    :return: the api instance
+    """
+    with _api_lock:
+        if _api_instance is not None:
+            return _api_instance
+    return initialize_api_from_config()
+
+
 def initialize_api_from_config():
     """
     Loads the api parameters from the config file and initializes the api with them
 
+    The current api instance is kept when it was created from the same parameters, so its session is reused.
+    Its cached projects, samples and links are cleared, this is called at the start of each run
+
     :return: the api instance
     """
+    # settings like the bandwidth limits can be changed while the uploader runs
+    config.reload_if_changed()
+
     client_id = config.read_config_option("client_id")
     client_secret = config.read_config_option("client_secret")
     base_url = config.read_config_option("base_url")
     username = config.read_config_option("username")
     password = config.read_config_option("password")
 
-    return _initialize_api(client_id=client_id,
-                           client_secret=client_secret,
-                           base_url=base_url,
-                           username=username,
-                           password=password)
+    global _max_concurrent_uploads
+    _max_concurrent_uploads = max(1, config.read_config_option("max_concurrent_uploads", expected_type=int,
+                                                               default_value=1))
+
+    _update_bandwidth_limits()
+
+    cache_access_token = config.read_config_option("cache_access_token", expected_type=bool, default_value=True)
+    upload_buffer_mb = max(1, config.read_config_option("upload_buffer_mb", expected_type=int, default_value=32))
+
+    global _api_settings
+    settings = (client_id, client_secret, base_url, username, password, cache_access_token, upload_buffer_mb)
+    with _api_lock:
+        if _api_instance is not None and _api_settings == settings:
+            logging.debug("Reusing api instance")
+            # each run starts from what is on IRIDA now, e.g. projects created while watching a directory
+            _api_instance.clear_caches()
+            return _api_instance
+
+        token_cache = None
+        if cache_access_token:
+            token_cache = api.TokenCache(os.path.join(user_cache_dir("irida-uploader"), "tokens.json"))
+
+        api_instance = _initialize_api(client_id=client_id,
+                                       client_secret=client_secret,
+                                       base_url=base_url,
+                                       username=username,
+                                       password=password,
+                                       token_cache=token_cache,
+                                       upload_buffer_memory=upload_buffer_mb * 1024 * 1024,
+                                       bandwidth_limiter=_bandwidth_limiter)
+        _api_settings = settings
+        return api_instance
+
+
+def _update_bandwidth_limits():
+    """
+    Reads the upload bandwidth limit and schedule from the config file into the shared bandwidth limiter
+    An invalid schedule is ignored, so only the limit applies
+
+    :return: None
+    """
+    rate = max(0, config.read_config_option("upload_bandwidth_limit", expected_type=int, default_value=0))
+    schedule_option = config.read_config_option("upload_bandwidth_schedule", default_value="")
+    try:
+        schedule = api.parse_schedule(schedule_option or "")
+    except ValueError as e:
+        logging.error("Ignoring upload_bandwidth_schedule: {}".format(e))
+        schedule = []
+    _bandwidth_limiter.set_limits(rate, schedule)
+
+
+def _reload_bandwidth_limits():
+    """
+    Called by the bandwidth limiter while files upload, so uploads that are running follow new limits
+    once the config file has been changed
+
+    :return: None
+    """
+    if config.reload_if_changed():
+        _update_bandwidth_limits()
+
+
+def get_uploaded_files(sample_keys):
+    """
+    Finds the files that are already on IRIDA for many samples at once
+
+    The samples of each project are listed once, sequence files are then only listed for the samples that exist,
+    with up to MAX_CONCURRENT_REQUESTS requests at the same time
+
+    :param sample_keys: iterable of (project_id, sample_name)
+    :return: set of (project_id, sample_name, file_name) for every file already uploaded
+    """
+    api_instance = get_api_instance()
+
+    samples_by_project = OrderedDict()
+    for project_id, sample_name in sample_keys:
+        samples_by_project.setdefault(project_id, OrderedDict())[sample_name] = None
+
+    candidates = []
+    for project_id, sample_names in samples_by_project.items():
+        existing_samples = {sample.sample_name for sample in api_instance.get_samples(project_id)}
+        candidates.extend((project_id, sample_name) for sample_name in sample_names if sample_name in existing_samples)
+    logging.debug("{} of {} samples already exist on IRIDA".format(
+        len(candidates), sum(len(sample_names) for sample_names in samples_by_project.values())))
+
+    uploaded_files = set()
+    if not candidates:
+        return uploaded_files
+
+    def _list_sequence_files(sample_key):
+        return api_instance.get_sequence_files(*sample_key)
+
+    with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_REQUESTS, len(candidates)),
+                            thread_name_prefix=threading.current_thread().name) as executor:
+        for (project_id, sample_name), sequence_files in zip(candidates,
+                                                             executor.map(_list_sequence_files, candidates)):
+            for sequence_file in sequence_files:
+                uploaded_files.add((project_id, sample_name, sequence_file["fileName"]))
+
+    return uploaded_files
+
+
+def verify_uploaded_files(file_checksums):
+    """
+    Checks that files recorded as uploaded arrived intact, without downloading them
+
+    The sequence files of every sample are listed with up to MAX_CONCURRENT_REQUESTS requests at the same time.
+    Each file must be on its sample, and its size and checksum must match when IRIDA reports them.
+
+    :param file_checksums: dictionary of (project_id, sample_name) to the checksums recorded when the files of the
+        sample were uploaded, {file name: {"size", "md5", "sha256"}}, see ApiCalls.send_sequence_files
+    :return: list of error messages, empty when every file was verified
+    """
+    api_instance = get_api_instance()
+    sample_keys = list(file_checksums)
+    if not sample_keys:
+        return []
+
+    def _list_sequence_files(sample_key):
+        try:
+            return api_instance.get_sequence_files(*sample_key)
+        except api.exceptions.IridaResourceError:
+            return None
+
+    errors = []
+    checked_count = 0
+    with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_REQUESTS, len(sample_keys)),
+                            thread_name_prefix=threading.current_thread().name) as executor:
+        for (project_id, sample_name), sequence_files in zip(sample_keys,
+                                                             executor.map(_list_sequence_files, sample_keys)):
+            if sequence_files is None:
+                errors.append("Sample {} does not exist on Project {}".format(sample_name, project_id))
+                continue
+            files_on_irida = {sequence_file["fileName"]: sequence_file for sequence_file in sequence_files}
+            for file_name, checksums in file_checksums[(project_id, sample_name)].items():
+                irida_file = files_on_irida.get(os.path.basename(file_name))
+                if irida_file is None:
+                    errors.append("File {} is missing from Sample {} on Project {}".format(
+                        file_name, sample_name, project_id))
+                    continue
+                file_errors = _compare_uploaded_file(irida_file, checksums)
+                errors.extend("File {} on Sample {} on Project {}: {}".format(
+                    file_name, sample_name, project_id, error) for error in file_errors)
+                checked_count += 1
+
+    logging.info("Verified {} files on {} samples, found {} errors".format(checked_count, len(sample_keys),
+                                                                           len(errors)))
+    return errors
+
+
+def _compare_uploaded_file(irida_file, checksums):
+    """
+    Compares a sequence file resource from IRIDA with the checksums recorded when it was uploaded
+    Only the fields this IRIDA version reports are compared
+
+    :return: list of mismatches
+    """
+    errors = []
+    for field, checksum_key in IRIDA_CHECKSUM_FIELDS.items():
+        if irida_file.get(field) and checksums.get(checksum_key) \
+                and irida_file[field].lower() != checksums[checksum_key]:
+            errors.append("{} on IRIDA is {}, {} was uploaded".format(
+                field, irida_file[field], checksums[checksum_key]))
+    for field in IRIDA_SIZE_FIELDS:
+        # some versions report a formatted size (e.g. "1.2 MB"), only a number of bytes can be compared
+        if isinstance(irida_file.get(field), int) and checksums.get("size") is not None \
+                and irida_file[field] != checksums["size"]:
+            errors.append("{} on IRIDA is {} bytes, {} bytes were uploaded".format(
+                field, irida_file[field], checksums["size"]))
+    return errors
 
 
 def prepare_and_validate_for_upload(sequencing_run):
@@ -73,6 +296,9 @@ def prepare_and_validate_for_upload(sequencing_run):
     Validates that projects exist,
     Creates Samples on Projects on Irida if they do not exist yet
 
+    Projects are checked, and missing samples created, by a pool of MAX_CONCURRENT_REQUESTS workers.
+    Samples that were created are verified once all of them have been sent.
+
     Collects all errors during prep/validation in ValidationResult
 
     :param sequencing_run: SequencingRun object
@@ -81,44 +307,101 @@ def prepare_and_validate_for_upload(sequencing_run):
     # get api
     api_instance = _get_api_instance()
 
-    validation_result = model.ValidationResult()
-    # Start online validation
-    logging.debug("Checking existence of projects")
-    for project in sequencing_run.project_list:
+    return _prepare_samples(api_instance, sequencing_run)
+
+
+def _prepare_samples(api_instance, sequencing_run, on_sample_ready=None):
+    """
+    Checks that the projects of the sequencing run exist and creates the samples that do not exist yet
+
+    :param api_instance: ApiCalls instance to prepare IRIDA with
+    :param sequencing_run: SequencingRun object
+    :param on_sample_ready: optional, called with (sample, project_id) as soon as a sample exists on IRIDA.
+        Samples that already exist are passed on from the worker threads as they are found, created samples
+        once all of them have been sent and verified.
+    :return: ValidationResult object with all errors that raised while prepping
+    """
+
+    def _find_missing_samples(project):
+        """
+        :return: None if the project does not exist, else the list of samples that are not on the project yet
+        """
         logging.debug("Checking existence of project: {}".format(project.id))
         if not api_instance.project_exists(project.id):
-            # No project, add error to validation result and continue
             logging.debug("Could not find project: {}".format(project.id))
-            err = api.exceptions.IridaResourceError("Project does not exist", project.id)
-            validation_result.add_error(err)
-            continue
+            return None
         logging.debug("Project {} exists".format(project.id))
 
         logging.debug("Checking existence of samples")
+        missing_samples = []
         for sample in project.sample_list:
             logging.debug("Checking existence of Sample {} on Project {}".format(sample.sample_name, project.id))
             if api_instance.sample_exists(sample.sample_name, project.id):
                 logging.debug("Sample {} exists on Project {}".format(sample.sample_name, project.id))
+                if on_sample_ready:
+                    on_sample_ready(sample, project.id)
             else:
-                logging.debug("Sample not found, creating new Sample")
-                try:
-                    api_instance.send_sample(sample, project.id)
-                except api.exceptions.IridaResourceError as e:
-                    logging.debug("Sample could not be created")
-                    validation_result.add_error(e)
-                    continue
-                logging.debug("Verifying sample was created")
-                if not api_instance.sample_exists(sample.sample_name, project.id):
-                    logging.debug("Sample was not created")
-                    err = api.exceptions.IridaResourceError("Could not create new Sample on Project {}", project.id)
-                    validation_result.add_error(err)
-                    continue
-                logging.debug("Sample Created")
+                missing_samples.append(sample)
+        return missing_samples
+
+    def _create_sample(sample, project_id):
+        """
+        :return: None if the sample was sent, else the IridaResourceError raised while sending or verifying it
+        """
+        logging.debug("Sample {} not found, creating new Sample".format(sample.sample_name))
+        try:
+            api_instance.send_sample(sample, project_id)
+        except api.exceptions.IridaResourceError as e:
+            logging.debug("Sample could not be created")
+            return e
+        return None
+
+    def _verify_sample_created(sample, project_id):
+        if not api_instance.sample_exists(sample.sample_name, project_id):
+            logging.debug("Sample {} was not created".format(sample.sample_name))
+            return api.exceptions.IridaResourceError("Could not create new Sample on Project {}", project_id)
+        logging.debug("Sample {} Created".format(sample.sample_name))
+        return None
+
+    validation_result = model.ValidationResult()
+    project_list = sequencing_run.project_list
+    if not project_list:
+        return validation_result
+
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS,
+                            thread_name_prefix=threading.current_thread().name) as executor:
+        # Start online validation
+        logging.debug("Checking existence of projects")
+        missing_samples = list(executor.map(_find_missing_samples, project_list))
+
+        new_samples = []
+        for project, project_missing_samples in zip(project_list, missing_samples):
+            if project_missing_samples is None:
+                # No project, add error to validation result and continue
+                err = api.exceptions.IridaResourceError("Project does not exist", project.id)
+                validation_result.add_error(err)
+                continue
+            new_samples.extend((sample, project.id) for sample in project_missing_samples)
+
+        create_futures = [executor.submit(_create_sample, sample, project_id) for sample, project_id in new_samples]
+        # errors are added in sample order, whichever sample finished first
+        create_errors = [future.result() for future in create_futures]
+
+    # verified once every sample has been sent, so each project's samples are listed once rather than per sample
+    logging.debug("Verifying samples were created")
+    create_errors = [error if error is not None else _verify_sample_created(sample, project_id)
+                     for (sample, project_id), error in zip(new_samples, create_errors)]
+
+    for (sample, project_id), error in zip(new_samples, create_errors):
+        if error is not None:
+            validation_result.add_error(error)
+        elif on_sample_ready:
+            on_sample_ready(sample, project_id)
 
     return validation_result
 
 
-def upload_sequencing_run(sequencing_run):
+def upload_sequencing_run(sequencing_run, run_id=None, on_run_created=None, on_sample_uploaded=None):
     """
     Handles uploading a sequencing run
 
@@ -126,33 +409,121 @@ def upload_sequencing_run(sequencing_run):
     Expects sequencing run to have been validated
     Expects sequencing run to be valid for upload
 
+    Samples are uploaded by a pool of `max_concurrent_uploads` workers (from the config file).
+    The first failing sample stops the other samples, including uploads in progress, and the seq run status
+    is only set once every worker has finished.
+
     :param sequencing_run: run to upload
-    :return:
+    :param run_id: optional, id of an existing seq run on IRIDA to resume uploading to,
+        when not given a new seq run is created
+    :param on_run_created: optional, called with the run id once a new seq run has been created
+    :param on_sample_uploaded: optional, called with (run_id, project_id, sample, file_checksums) each time a sample
+        finishes uploading, see ApiCalls.send_sequence_files for the checksums.
+        This is called from the upload worker threads.
+    :return: the id of the seq run the samples were uploaded to
+    """
+    # get api
+    api_instance = _get_api_instance()
+
+    run_id = _start_seq_run(api_instance, sequencing_run, run_id, on_run_created)
+
+    def _upload():
+        _upload_samples(api_instance, sequencing_run, run_id, on_sample_uploaded)
+        return True
+
+    _upload_to_seq_run(api_instance, run_id, _upload)
+
+    return run_id
+
+
+def prepare_and_upload_sequencing_run(sequencing_run, run_id=None, on_run_created=None, on_sample_uploaded=None):
+    """
+    Prepares IRIDA to accept the sequencing run and uploads it at the same time
+
+    Does the work of prepare_and_validate_for_upload and upload_sequencing_run, but each sample starts
+    uploading as soon as it exists on IRIDA, while the samples after it are still being checked and created.
+
+    Expects api to have been set up
+    Expects sequencing run to have passed offline validation
+
+    When preparing fails, the samples are canceled, including uploads in progress, and the seq run is set to error.
+
+    :param sequencing_run: run to prepare and upload
+    :param run_id: optional, id of an existing seq run on IRIDA to resume uploading to,
+        when not given a new seq run is created
+    :param on_run_created: optional, called with the run id once a new seq run has been created
+    :param on_sample_uploaded: optional, called with (run_id, project_id, sample, file_checksums) each time a sample
+        finishes uploading, see ApiCalls.send_sequence_files for the checksums.
+        This is called from the upload worker threads.
+    :return: tuple of the id of the seq run, and the ValidationResult of preparing IRIDA.
+        When the ValidationResult is not valid, the upload did not complete.
     """
     # get api
     api_instance = _get_api_instance()
 
-    # create a seq run
-    run_id = api_instance.create_seq_run(sequencing_run.metadata)
-    logging.info("Sequencing run id '{}' has been created for upload".format(run_id))
+    run_id = _start_seq_run(api_instance, sequencing_run, run_id, on_run_created)
+    validation_result = model.ValidationResult()
+
+    def _prepare_and_upload():
+        upload_pool = _SampleUploadPool(api_instance, run_id, on_sample_uploaded)
+        try:
+            prepare_result = _prepare_samples(api_instance, sequencing_run, on_sample_ready=upload_pool.submit)
+        except Exception:
+            upload_pool.stop()
+            upload_pool.finish()
+            raise
+        for error in prepare_result.error_list:
+            validation_result.add_error(error)
+        if not validation_result.is_valid():
+            logging.error("Sequencing run can not be uploaded, canceling the samples")
+            upload_pool.stop()
+        upload_pool.finish()
+        return validation_result.is_valid()
+
+    _upload_to_seq_run(api_instance, run_id, _prepare_and_upload)
+
+    return run_id, validation_result
+
+
+def _start_seq_run(api_instance, sequencing_run, run_id=None, on_run_created=None):
+    """
+    Creates a new seq run on IRIDA, unless run_id is given
+
+    :return: the id of the seq run to upload to
+    """
+    if run_id is None:
+        # create a seq run
+        run_id = api_instance.create_seq_run(sequencing_run.metadata)
+        logging.info("Sequencing run id '{}' has been created for upload".format(run_id))
+        if on_run_created:
+            on_run_created(run_id)
+    else:
+        logging.info("Resuming upload to existing Sequencing run id '{}'".format(run_id))
+    return run_id
+
 
+def _upload_to_seq_run(api_instance, run_id, upload_function):
+    """
+    Sets the seq run to uploading, calls upload_function, and sets the seq run to complete
+
+    The seq run is set to error instead when upload_function returns False,
+    or when it raises an IridaResourceError or a FileError
+
+    :param api_instance: ApiCalls instance to upload with
+    :param run_id: id of the seq run on IRIDA
+    :param upload_function: uploads the samples, returns True when every sample was uploaded
+    :return: None
+    """
     try:
         # set seq run to upload
         api_instance.set_seq_run_uploading(run_id)
 
-        # loop through projects
-        for project in sequencing_run.project_list:
-            # loop through samples
-            for sample in project.sample_list:
-                logging.info("Uploading to Sample {} on Project {}".format(sample.sample_name, project.id))
-                # upload files
-                api_instance.send_sequence_files(sequence_file=sample.sequence_file,
-                                                 sample_name=sample.sample_name,
-                                                 project_id=project.id,
-                                                 upload_id=run_id)
-
-        # set seq run to complete
-        api_instance.set_seq_run_complete(run_id)
+        # upload files
+        if upload_function():
+            # set seq run to complete
+            api_instance.set_seq_run_complete(run_id)
+        else:
+            api_instance.set_seq_run_error(run_id)
 
         # set seq run to error if there is an error
     except api.exceptions.IridaConnectionError as e:
@@ -166,9 +537,165 @@ def upload_sequencing_run(sequencing_run):
         logging.error("Failed to upload SequencingRun, Could not access files to upload to IRIDA")
         api_instance.set_seq_run_error(run_id)
         raise e
-    # Todo: once threading is added, the upload canceled error will likely need to be caught/raised here
+    # Todo: the upload canceled error will likely need to be caught/raised here
 
-    return run_id
+
+def _upload_samples(api_instance, sequencing_run, run_id, on_sample_uploaded=None):
+    """
+    Uploads the sequence files of every sample in the sequencing run using a pool of worker threads
+
+    When a sample fails, the other samples are canceled, including uploads in progress,
+    and the error of the first failed sample is raised.
+
+    :param api_instance: ApiCalls instance to upload with
+    :param sequencing_run: run with the samples to upload
+    :param run_id: id of the seq run on IRIDA the files are uploaded to
+    :param on_sample_uploaded: optional, called with (run_id, project_id, sample, file_checksums)
+        after each successful sample
+    :return: dictionary of (project id, sample name) to the samples upload outcome
+    """
+    upload_pool = _SampleUploadPool(api_instance, run_id, on_sample_uploaded)
+    for project in sequencing_run.project_list:
+        for sample in project.sample_list:
+            upload_pool.submit(sample, project.id)
+    return upload_pool.finish()
+
+
+def _get_upload_streams():
+    """
+    Returns the semaphore every sample upload in the process holds while it sends files, so runs uploaded at the same
+    time share `max_concurrent_uploads` upload streams
+
+    A new semaphore is made when the limit changes, uploads in progress release the one they acquired
+
+    :return: threading.BoundedSemaphore
+    """
+    global _upload_streams
+    with _upload_streams_lock:
+        if _upload_streams is None or _upload_streams[0] != _max_concurrent_uploads:
+            _upload_streams = (_max_concurrent_uploads, threading.BoundedSemaphore(_max_concurrent_uploads))
+        return _upload_streams[1]
+
+
+class _SampleUploadPool(object):
+    """
+    Uploads samples on a pool of `max_concurrent_uploads` worker threads, as they are submitted
+    Each upload waits for one of the upload streams shared with the other runs being uploaded
+
+    When a sample fails, the other samples are canceled, including uploads in progress, and samples submitted
+    later are not uploaded. finish() waits for the workers and raises the error of the first failed sample.
+    """
+
+    def __init__(self, api_instance, run_id, on_sample_uploaded=None):
+        """
+        :param api_instance: ApiCalls instance to upload with
+        :param run_id: id of the seq run on IRIDA the files are uploaded to
+        :param on_sample_uploaded: optional, called with (run_id, project_id, sample, file_checksums)
+            after each successful sample
+        """
+        self._api_instance = api_instance
+        self._run_id = run_id
+        self._on_sample_uploaded = on_sample_uploaded
+        # set by the first sample that fails, so workers do not start on any more samples and uploads in progress
+        # stop, only this pool's uploads are stopped when the api instance is shared with other runs
+        self._stop_uploading = threading.Event()
+        self._first_error = None
+        # re-entrant: a future that is already done runs its callback in the thread that adds it
+        self._lock = threading.RLock()
+        self._futures = OrderedDict()
+        self._canceled = []
+        self._upload_streams = _get_upload_streams()
+        logging.debug("Uploading samples with {} concurrent upload(s)".format(_max_concurrent_uploads))
+        self._executor = ThreadPoolExecutor(max_workers=_max_concurrent_uploads,
+                                            thread_name_prefix=threading.current_thread().name)
+
+    def _upload_sample(self, sample, project_id):
+        if self._stop_uploading.is_set():
+            return SAMPLE_UPLOAD_CANCELED
+        logging.info("Uploading to Sample {} on Project {}".format(sample.sample_name, project_id))
+        file_checksums = {}
+        try:
+            with self._upload_streams:
+                if self._stop_uploading.is_set():
+                    return SAMPLE_UPLOAD_CANCELED
+                self._api_instance.send_sequence_files(sequence_file=sample.sequence_file,
+                                                       sample_name=sample.sample_name,
+                                                       project_id=project_id,
+                                                       upload_id=self._run_id,
+                                                       checksums=file_checksums,
+                                                       should_stop=self._stop_uploading.is_set)
+        except api.exceptions.IridaUploadCanceledException:
+            if self._stop_uploading.is_set():
+                # stopped because another sample failed, that sample's error is the one raised
+                logging.info("Canceled upload of Sample {} on Project {}".format(sample.sample_name, project_id))
+                return SAMPLE_UPLOAD_CANCELED
+            self._stop_uploading.set()
+            raise
+        except Exception:
+            self._stop_uploading.set()
+            raise
+        if self._on_sample_uploaded:
+            self._on_sample_uploaded(self._run_id, project_id, sample, file_checksums)
+        return SAMPLE_UPLOAD_COMPLETE
+
+    def _on_done(self, future):
+        if future.cancelled() or future.exception() is None:
+            return
+        with self._lock:
+            if self._first_error is None:
+                # raise the error that stopped the upload, rather than one from an upload that was still running
+                self._first_error = future.exception()
+                logging.error("A sample failed to upload, canceling the other samples")
+                self.stop()
+
+    def submit(self, sample, project_id):
+        """
+        Queues a sample for upload, it is canceled instead when uploading has been stopped
+        """
+        with self._lock:
+            if self._stop_uploading.is_set():
+                self._canceled.append((project_id, sample.sample_name))
+                return
+            future = self._executor.submit(self._upload_sample, sample, project_id)
+            self._futures[future] = (project_id, sample.sample_name)
+        future.add_done_callback(self._on_done)
+
+    def stop(self):
+        """
+        Cancels samples that have not started uploading, and stops uploads in progress
+        """
+        with self._lock:
+            self._stop_uploading.set()
+            for future in self._futures:
+                future.cancel()
+
+    def finish(self):
+        """
+        Waits for the workers to finish
+
+        :return: dictionary of (project id, sample name) to the samples upload outcome
+        """
+        self._executor.shutdown(wait=True)
+
+        outcomes = {}
+        for future, (project_id, sample_name) in self._futures.items():
+            if future.cancelled():
+                outcomes[(project_id, sample_name)] = SAMPLE_UPLOAD_CANCELED
+            elif future.exception() is not None:
+                outcomes[(project_id, sample_name)] = SAMPLE_UPLOAD_ERROR
+                logging.error("Sample {} on Project {} failed to upload".format(sample_name, project_id))
+            else:
+                outcomes[(project_id, sample_name)] = future.result()
+        for project_id, sample_name in self._canceled:
+            outcomes[(project_id, sample_name)] = SAMPLE_UPLOAD_CANCELED
+
+        logging.info("Uploaded {} of {} samples".format(
+            list(outcomes.values()).count(SAMPLE_UPLOAD_COMPLETE), len(outcomes)))
+
+        if self._first_error is not None:
+            raise self._first_error
+
+        return outcomes
 
 
 def send_project(project):
@@ -1,6 +1,11 @@
 import os
 import logging
+import sqlite3
+import threading
+import time
 
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from pprint import pformat
 
 import api
@@ -10,13 +15,23 @@ import progress
 import os
 from model import DirectoryStatus
 
-from . import api_handler, parsing_handler, logger
+from . import api_handler, parsing_handler, logger, run_watcher
 
 EXIT_CODE_ERROR = 1
 EXIT_CODE_SUCCESS = 0
 
+# Orders batch_upload can upload runs in
+BATCH_ORDER_OLDEST = 'oldest'
+BATCH_ORDER_SMALLEST = 'smallest'
+BATCH_ORDER_PRIORITY = 'priority'
+BATCH_ORDERS = [BATCH_ORDER_OLDEST, BATCH_ORDER_SMALLEST, BATCH_ORDER_PRIORITY]
 
-def validate_and_upload_single_entry(directory, force_upload=False):
+# Seconds a run directory has to go without new marker files before it is checked when watching a directory,
+# so a run that is still being copied is not checked before all of its files are in place
+WATCH_SETTLE_SECONDS = 5
+
+
+def validate_and_upload_single_entry(directory, force_upload=False, resume_upload=False, pipeline_upload=False):
     """
     This function acts as a single point of entry for uploading a directory
 
@@ -28,6 +43,10 @@ def validate_and_upload_single_entry(directory, force_upload=False):
 
     :param directory: Directory of the sequencing run to upload
     :param force_upload: When set to true, the upload status file will be ignored and file will attempt to be uploaded
+    :param resume_upload: When set to true, a partial or failed upload is continued: samples the status file marks
+        as uploaded are skipped, and the remaining samples are uploaded to the same sequencing run on IRIDA
+    :param pipeline_upload: When set to true, samples start uploading as soon as they exist on IRIDA,
+        while the samples after them are still being verified and created
     :return:
     """
     logging_start_block(directory)
@@ -42,14 +61,24 @@ def validate_and_upload_single_entry(directory, force_upload=False):
 
     # Only upload if run is new, or force_upload is True
     if not force_upload:
-        if not directory_status.status_equals(DirectoryStatus.NEW):
+        if resume_upload and directory_status.status_equals(DirectoryStatus.COMPLETE):
+            logging.error("ERROR! Run in directory {} has already been uploaded, there is nothing to resume. "
+                          "You can upload it again with the --force argument.".format(directory))
+            return exit_error()
+        if not resume_upload and not directory_status.status_equals(DirectoryStatus.NEW):
             logging.error("ERROR! Run in directory {} is not new. It has either been uploaded, "
                           "or an upload was attempted with error. "
                           "Please check the status file 'irida_uploader_status.info' "
                           "in the run directory for more details. "
-                          "You can bypass this error by uploading with the --force argument.".format(directory))
+                          "You can continue an upload that did not finish with the --resume argument, "
+                          "or bypass this error by uploading with the --force argument.".format(directory))
             return exit_error()
 
+    # Progress from an earlier attempt is only kept when resuming, everything else starts from scratch
+    if not resume_upload:
+        directory_status.run_id = None
+        directory_status.sample_status_dict = {}
+
     # Add progress file to directory
     try:
         directory_status.status = DirectoryStatus.PARTIAL
@@ -92,36 +121,65 @@ def validate_and_upload_single_entry(directory, force_upload=False):
         return exit_error()
     logging.info("*** Connected ***")
 
-    logging.info("*** Verifying run (online validation) ***")
-    try:
-        validation_result = api_handler.prepare_and_validate_for_upload(sequencing_run)
-    except api.exceptions.IridaConnectionError as e:
-        logging.error("Lost connection to Irida")
-        logging.error("Errors: " + pformat(e.args))
-        directory_status.status = DirectoryStatus.ERROR
-        progress.write_directory_status(directory_status)
-        return exit_error()
+    def _write_run_id(new_run_id):
+        _write_upload_progress(progress.write_directory_status, directory_status, run_id=new_run_id)
 
-    if not validation_result.is_valid():
-        logging.error("Sequencing run can not be uploaded")
-        logging.error("Sequencing run can not be uploaded. Encountered {} errors"
-                      "".format(validation_result.error_count()))
-        logging.error("Errors: " + pformat(validation_result.error_list))
-        directory_status.status = DirectoryStatus.ERROR
-        progress.write_directory_status(directory_status)
-        return exit_error()
-    logging.info("*** Run Verified ***")
+    def _write_sample_uploaded(upload_run_id, project_id, sample, file_checksums):
+        _write_upload_progress(progress.write_sample_status, directory_status, upload_run_id, project_id, sample,
+                               file_checksums)
 
-    # Start upload
-    logging.info("*** Starting Upload ***")
-    try:
-        run_id = api_handler.upload_sequencing_run(sequencing_run)
-    except api.exceptions.IridaConnectionError as e:
-        logging.error("Lost connection to Irida")
-        logging.error("Errors: " + pformat(e.args))
-        directory_status.status = DirectoryStatus.ERROR
-        progress.write_directory_status(directory_status)
-        return exit_error()
+    if pipeline_upload:
+        if resume_upload:
+            _skip_uploaded_samples(sequencing_run, directory_status)
+
+        logging.info("*** Verifying run (online validation) and starting upload ***")
+        try:
+            run_id, validation_result = api_handler.prepare_and_upload_sequencing_run(
+                sequencing_run,
+                run_id=directory_status.run_id,
+                on_run_created=_write_run_id,
+                on_sample_uploaded=_write_sample_uploaded)
+        except api.exceptions.IridaConnectionError as e:
+            logging.error("Lost connection to Irida")
+            logging.error("Errors: " + pformat(e.args))
+            directory_status.status = DirectoryStatus.ERROR
+            progress.write_directory_status(directory_status)
+            return exit_error()
+
+        if not validation_result.is_valid():
+            return _exit_validation_error(validation_result, directory_status)
+        logging.info("*** Run Verified ***")
+    else:
+        logging.info("*** Verifying run (online validation) ***")
+        try:
+            validation_result = api_handler.prepare_and_validate_for_upload(sequencing_run)
+        except api.exceptions.IridaConnectionError as e:
+            logging.error("Lost connection to Irida")
+            logging.error("Errors: " + pformat(e.args))
+            directory_status.status = DirectoryStatus.ERROR
+            progress.write_directory_status(directory_status)
+            return exit_error()
+
+        if not validation_result.is_valid():
+            return _exit_validation_error(validation_result, directory_status)
+        logging.info("*** Run Verified ***")
+
+        if resume_upload:
+            _skip_uploaded_samples(sequencing_run, directory_status)
+
+        # Start upload
+        logging.info("*** Starting Upload ***")
+        try:
+            run_id = api_handler.upload_sequencing_run(sequencing_run,
+                                                       run_id=directory_status.run_id,
+                                                       on_run_created=_write_run_id,
+                                                       on_sample_uploaded=_write_sample_uploaded)
+        except api.exceptions.IridaConnectionError as e:
+            logging.error("Lost connection to Irida")
+            logging.error("Errors: " + pformat(e.args))
+            directory_status.status = DirectoryStatus.ERROR
+            progress.write_directory_status(directory_status)
+            return exit_error()
     logging.info("*** Upload Complete ***")
 
     # Set progress file to complete
@@ -141,6 +199,315 @@ def validate_and_upload_single_entry(directory, force_upload=False):
     return exit_success()
 
 
+def batch_upload(directory, jobs=1, order=BATCH_ORDER_OLDEST, priority_file=None, pipeline_upload=False):
+    """
+    Uploads every new run in a directory of run directories
+
+    Runs are found with the parser's find_runs, and started in the given order. Up to `jobs` runs are uploaded at the
+    same time, each with its own status file and log. They share one api, and `max_concurrent_uploads` upload
+    streams between them.
+
+    :param directory: Directory that contains the sequencing run directories
+    :param jobs: number of runs to upload at the same time
+    :param order: BATCH_ORDER_OLDEST to start with the oldest run directory, BATCH_ORDER_SMALLEST to start with the
+        run with the smallest files, or BATCH_ORDER_PRIORITY to follow priority_file
+    :param priority_file: file with a run directory name per line, those runs are uploaded first in that order,
+        and the other runs oldest first. Required for BATCH_ORDER_PRIORITY
+    :param pipeline_upload: When set to true, samples start uploading as soon as they exist on IRIDA
+    :return: exit code, success when every new run was uploaded
+    """
+    logging.info("*** Looking for runs in {} ***".format(directory))
+    try:
+        directory_status_list = parsing_handler.get_runs(directory)
+        run_directories = _order_runs([directory_status.directory for directory_status in directory_status_list
+                                       if directory_status.status_equals(DirectoryStatus.NEW)],
+                                      order, priority_file)
+    except parsers.exceptions.DirectoryError as e:
+        logging.error("ERROR! An error occurred with directory '{}', with message: {}".format(e.directory, e.message))
+        return exit_error()
+    except (OSError, ValueError) as e:
+        logging.error("ERROR! Could not order the runs in directory '{}': {}".format(directory, e))
+        return exit_error()
+    logging.info("Found {} new runs of {} runs in {}".format(len(run_directories), len(directory_status_list),
+                                                             directory))
+
+    def _upload_run(run_directory):
+        try:
+            return validate_and_upload_single_entry(run_directory, pipeline_upload=pipeline_upload)
+        except Exception as e:
+            # one broken run directory must not stop the runs after it
+            logging.exception("ERROR! Upload of run in directory {} failed: {}".format(run_directory, e))
+            return EXIT_CODE_ERROR
+
+    # the executor starts runs in the order they are submitted
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="run") as executor:
+        exit_codes = list(executor.map(_upload_run, run_directories))
+
+    failed_runs = [run_directory for run_directory, exit_code in zip(run_directories, exit_codes)
+                   if exit_code != EXIT_CODE_SUCCESS]
+    logging.info("Uploaded {} of {} new runs in {}".format(len(run_directories) - len(failed_runs),
+                                                           len(run_directories), directory))
+    if failed_runs:
+        logging.error("Runs that could not be uploaded: " + pformat(failed_runs))
+        return exit_error()
+    return exit_success()
+
+
+def _order_runs(run_directories, order, priority_file=None):
+    """
+    Sorts run directories into the order they are uploaded in, see batch_upload
+
+    :return: sorted list of run directories
+    """
+    if order not in BATCH_ORDERS:
+        raise ValueError("Unknown order '{}', expected one of {}".format(order, BATCH_ORDERS))
+
+    if order == BATCH_ORDER_SMALLEST:
+        return sorted(run_directories, key=_get_directory_size)
+
+    run_directories = sorted(run_directories, key=lambda run_directory: os.stat(run_directory).st_mtime)
+    if order == BATCH_ORDER_PRIORITY:
+        if priority_file is None:
+            raise ValueError("A priority file is needed to upload runs in priority order")
+        with open(priority_file, "r") as priority_list:
+            priorities = [line.strip() for line in priority_list if line.strip() and not line.startswith('#')]
+        priority_indexes = {os.path.basename(os.path.normpath(name)): index for index, name
+                            in reversed(list(enumerate(priorities)))}
+        # sorting is stable, so runs that are not in the file stay oldest first
+        run_directories.sort(key=lambda run_directory: priority_indexes.get(
+            os.path.basename(os.path.normpath(run_directory)), len(priority_indexes)))
+    return run_directories
+
+
+def _get_directory_size(directory):
+    """
+    :return: combined size of the files in a directory and its subdirectories
+    """
+    size = 0
+    for root, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            try:
+                size += os.path.getsize(os.path.join(root, file_name))
+            except OSError:
+                pass
+    return size
+
+
+def watch_and_upload(directory, jobs=1, pipeline_upload=False, stop_event=None):
+    """
+    Watches a directory, and uploads each new run that appears in it, until stopped
+
+    Runs already in the directory are checked when watching starts. After that, a run is checked when one of the
+    files that mark a finished run is written to it (see run_watcher.RUN_MARKER_FILES). Only new runs are uploaded.
+    Up to `jobs` runs are uploaded at the same time, each with its own status file and log, and they share one api.
+
+    :param directory: Directory the sequencing runs are written to
+    :param jobs: number of runs to upload at the same time
+    :param pipeline_upload: When set to true, samples start uploading as soon as they exist on IRIDA
+    :param stop_event: optional threading.Event, watching stops when it is set. Watching also stops on Ctrl+C
+    :return: exit code, once watching has stopped and the runs being uploaded have finished
+    """
+    if not os.path.isdir(directory):
+        logging.error("ERROR! Directory {} does not exist".format(directory))
+        return exit_error()
+    if stop_event is None:
+        stop_event = threading.Event()
+
+    watcher = run_watcher.RunWatcher(directory)
+    executor = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="run")
+    # runs queued or being uploaded, they are not checked again until they are done
+    active_runs = set()
+    active_runs_lock = threading.Lock()
+    # run directories that changed, with the time they can be checked
+    settling_runs = {}
+
+    def _upload_run(run_directory):
+        try:
+            _upload_if_new(run_directory, pipeline_upload)
+        finally:
+            with active_runs_lock:
+                active_runs.discard(run_directory)
+
+    logging.info("Uploading new runs in {} with {} concurrent run(s), press Ctrl+C to stop".format(directory, jobs))
+    try:
+        while not stop_event.is_set():
+            now = time.monotonic()
+            timeout = min([1.0] + [max(0, ready_at - now) for ready_at in settling_runs.values()])
+            for run_directory in watcher.wait_for_changes(timeout):
+                settling_runs[run_directory] = time.monotonic() + WATCH_SETTLE_SECONDS
+
+            now = time.monotonic()
+            for run_directory, ready_at in list(settling_runs.items()):
+                if ready_at > now:
+                    continue
+                del settling_runs[run_directory]
+                with active_runs_lock:
+                    if run_directory in active_runs:
+                        continue
+                    active_runs.add(run_directory)
+                executor.submit(_upload_run, run_directory)
+    except KeyboardInterrupt:
+        logging.info("Stopping, waiting for the runs being uploaded to finish")
+    finally:
+        watcher.close()
+        executor.shutdown(wait=True)
+    logging.info("Stopped watching {}".format(directory))
+    return exit_success()
+
+
+def _upload_if_new(directory, pipeline_upload=False):
+    """
+    Uploads a run found while watching a directory, when it is new and complete
+
+    Runs that are not complete yet are left until their marker files change again.
+    Errors are logged instead of raised, so the next runs are still uploaded.
+
+    :param directory: Directory of the sequencing run
+    :param pipeline_upload: When set to true, samples start uploading as soon as they exist on IRIDA
+    :return: None
+    """
+    try:
+        directory_status = parsing_handler.get_run_status(directory)
+        if not directory_status.status_equals(DirectoryStatus.NEW):
+            logging.debug("Not uploading run in {} with status '{}': {}".format(
+                directory, directory_status.status, directory_status.message))
+            return
+        validate_and_upload_single_entry(directory, pipeline_upload=pipeline_upload)
+    except Exception as e:
+        # one broken run directory must not stop the runs after it
+        logging.exception("ERROR! Upload of run in directory {} failed: {}".format(directory, e))
+
+
+def verify_single_entry(directory):
+    """
+    Checks that the samples the status file of a directory records as uploaded arrived on IRIDA intact
+
+    The size and checksums recorded while each file was uploaded are compared with what IRIDA reports,
+    the files are not downloaded again.
+
+    :param directory: Directory of a sequencing run that has been uploaded
+    :return: exit code, success when every file was verified
+    """
+    logging_start_block(directory)
+    logging.debug("verify_single_entry:Starting {}".format(directory))
+
+    directory_status = parsing_handler.get_run_status(directory)
+    if directory_status.status_equals(DirectoryStatus.INVALID):
+        logging.error("ERROR! Run in directory {} is invalid. Returned with message: '{}'"
+                      "".format(directory_status.directory, directory_status.message))
+        return exit_error()
+
+    file_checksums = progress.get_uploaded_file_checksums(directory_status)
+    if not file_checksums:
+        logging.error("ERROR! The status file in directory {} does not record any uploaded samples, "
+                      "there is nothing to verify.".format(directory))
+        return exit_error()
+    if not directory_status.status_equals(DirectoryStatus.COMPLETE):
+        logging.warning("The upload of run in directory {} did not complete, "
+                        "only the samples that finished uploading are verified.".format(directory))
+
+    logging.info("*** Connecting to IRIDA ***")
+    try:
+        api_handler.initialize_api_from_config()
+        logging.info("*** Connected ***")
+        logging.info("*** Verifying uploaded files ***")
+        errors = api_handler.verify_uploaded_files(file_checksums)
+    except api.exceptions.IridaConnectionError as e:
+        logging.error("ERROR! Could not connect to IRIDA.")
+        logging.error("Errors: " + pformat(e.args))
+        return exit_error()
+
+    if errors:
+        logging.error("Uploaded files in directory '{}' do not match IRIDA. Encountered {} errors"
+                      "".format(directory, len(errors)))
+        logging.error("Errors: " + pformat(errors))
+        return exit_error()
+
+    logging.info("Uploaded files in directory '{}' match IRIDA".format(directory))
+    logging_end_block()
+    return exit_success()
+
+
+def list_run_statuses(directory):
+    """
+    Logs the status of every run in a directory that the state database has recorded, without reading the runs
+
+    :param directory: Directory that contains the sequencing run directories
+    :return: exit code, error when there is no state database
+    """
+    state_store = progress.get_state_store()
+    if state_store is None:
+        logging.error("ERROR! There is no state database to read run statuses from. "
+                      "Set state_database in the config file to keep one.")
+        return EXIT_CODE_ERROR
+    try:
+        runs = state_store.find_runs(parent_directory=directory)
+    except sqlite3.Error as e:
+        logging.error("ERROR! Could not read the state database {}: {}".format(state_store.database_file, e))
+        return EXIT_CODE_ERROR
+
+    for run in runs:
+        logging.info("{:<8} {} {}".format(run["status"],
+                                          time.strftime("%Y-%m-%d %H:%M", time.localtime(run["updated"])),
+                                          run["directory"]))
+    status_counts = Counter(run["status"] for run in runs)
+    logging.info("{} runs in {}: {}".format(len(runs), directory, ", ".join(
+        "{} {}".format(count, status) for status, count in sorted(status_counts.items()))))
+    return EXIT_CODE_SUCCESS
+
+
+def _exit_validation_error(validation_result, directory_status):
+    """
+    Logs the errors of a sequencing run that could not be uploaded, and sets the status file to error
+
+    :param validation_result: ValidationResult with the errors from online validation
+    :param directory_status: DirectoryStatus of the run
+    :return: exit code
+    """
+    logging.error("Sequencing run can not be uploaded")
+    logging.error("Sequencing run can not be uploaded. Encountered {} errors"
+                  "".format(validation_result.error_count()))
+    logging.error("Errors: " + pformat(validation_result.error_list))
+    directory_status.status = DirectoryStatus.ERROR
+    progress.write_directory_status(directory_status)
+    return exit_error()
+
+
+def _skip_uploaded_samples(sequencing_run, directory_status):
+    """
+    Removes samples the status file marks as uploaded from the sequencing run
+    Projects left without samples are removed as well
+
+    :param sequencing_run: SequencingRun to filter
+    :param directory_status: DirectoryStatus with the progress of an earlier upload attempt
+    :return: None
+    """
+    for project in sequencing_run.project_list:
+        remaining_samples = []
+        for sample in project.sample_list:
+            if progress.sample_upload_complete(directory_status, project.id, sample.sample_name):
+                logging.info("Skipping Sample {} on Project {}, it has already been uploaded"
+                             "".format(sample.sample_name, project.id))
+            else:
+                remaining_samples.append(sample)
+        project.sample_list[:] = remaining_samples
+    sequencing_run.project_list = [p for p in sequencing_run.project_list if p.sample_list]
+
+
+def _write_upload_progress(write_function, *args, **kwargs):
+    """
+    Writes upload progress to the status file
+    A failure to write progress is logged but does not stop the upload, it only means the upload cannot be resumed
+
+    :param write_function: progress module function to call
+    :return: None
+    """
+    try:
+        write_function(*args, **kwargs)
+    except (progress.exceptions.DirectoryError, OSError) as e:
+        logging.warning("Could not write upload progress to status file: {}".format(e))
+
+
 def exit_error():
     """
     Returns an failed run exit code which ends the process when returned
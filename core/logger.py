@@ -1,6 +1,7 @@
 from appdirs import user_log_dir
 import os
 import logging.handlers
+import threading
 
 import global_settings
 
@@ -47,9 +48,33 @@ root_logger.addHandler(console)
 
 global_settings.log_file = user_log_dir(log_directory_name)
 
-# manages the logging directory
-# only one directory can have a logger at a time
-directory_logger = None
+# manages the logging directories
+# several runs can be uploaded at once, each from its own thread. The directory logger of a run only logs records
+# from the thread that uploads it, and the threads it starts, which are named after it
+# (e.g. ThreadPoolExecutor(thread_name_prefix=threading.current_thread().name))
+# only one directory can have a logger per thread at a time
+directory_loggers = {}
+_directory_loggers_lock = threading.Lock()
+
+
+class _ThreadFilter(logging.Filter):
+    """
+    Passes records logged by a thread, and by threads named after it
+    """
+
+    def __init__(self, thread_name):
+        super().__init__()
+        self._thread_name = thread_name
+
+    def filter(self, record):
+        return record.threadName == self._thread_name or record.threadName.startswith(self._thread_name + "_")
+
+
+def has_directory_logger():
+    """
+    :return: True when the current thread is logging to a directory
+    """
+    return threading.current_thread().name in directory_loggers
 
 
 def add_log_to_directory(directory):
@@ -59,32 +84,37 @@ def add_log_to_directory(directory):
     :param directory: directory to create a logger in
     :return: None
     """
-    global directory_logger
-
-    # If there is already a directory logger in place, throw an exception
-    if directory_logger:
-        logging.error("A directory logger already exists!")
-        raise Exception("ERROR:add_log_to_directory: A directory logger already exists!")
-
-    logging.info("Adding log file to {}".format(directory))
-    log_file = os.path.join(directory, 'irida-uploader.log')
-    directory_logger = logging.handlers.RotatingFileHandler(
-        filename=log_file,
-        maxBytes=(1024 * 1024 * 1024 * 10),  # 10GB max file size
-        backupCount=100,
-    )
-    directory_logger.setLevel(logging.INFO)
-    directory_logger.setFormatter(log_format)
-    root_logger.addHandler(directory_logger)
+    thread_name = threading.current_thread().name
+
+    with _directory_loggers_lock:
+        # If there is already a directory logger in place, throw an exception
+        if thread_name in directory_loggers:
+            logging.error("A directory logger already exists!")
+            raise Exception("ERROR:add_log_to_directory: A directory logger already exists!")
+
+        logging.info("Adding log file to {}".format(directory))
+        log_file = os.path.join(directory, 'irida-uploader.log')
+        directory_logger = logging.handlers.RotatingFileHandler(
+            filename=log_file,
+            maxBytes=(1024 * 1024 * 1024 * 10),  # 10GB max file size
+            backupCount=100,
+        )
+        directory_logger.setLevel(logging.INFO)
+        directory_logger.setFormatter(log_format)
+        directory_logger.addFilter(_ThreadFilter(thread_name))
+        directory_loggers[thread_name] = directory_logger
+        root_logger.addHandler(directory_logger)
 
 
 def remove_directory_logger():
     """
-    Deletes the existing directory logger so logging stops
+    Deletes the existing directory logger of the current thread so logging stops
 
     :return: None
     """
-    global directory_logger
-    root_logger.removeHandler(directory_logger)
-    directory_logger = None
+    with _directory_loggers_lock:
+        directory_logger = directory_loggers.pop(threading.current_thread().name, None)
+        if directory_logger is not None:
+            root_logger.removeHandler(directory_logger)
+            directory_logger.close()
     logging.info("Stopped active logging to run directory")
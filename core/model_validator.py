@@ -1,7 +1,29 @@
-from cerberus import Validator
+"""
+Validates the object model against the uploadable_schema of each model class
+
+The schemas are written as cerberus schemas. Each schema is compiled once, into straight-line checks that give the
+same errors cerberus would. The compiler only knows the rules and types the model schemas use, a schema that uses
+anything else falls back to cerberus, so the schemas can still use any cerberus rule.
+"""
+from collections.abc import Iterable, Mapping, Sequence, Sized
 
 import model
 
+# cerberus type names used in the schemas -> (included types, excluded types)
+_TYPE_DEFINITIONS = {
+    'dict': ((Mapping,), ()),
+    'integer': ((int,), ()),
+    'list': ((Sequence,), (str,)),
+    'string': ((str,), ()),
+    # model types
+    'project': ((model.Project,), ()),
+    'sample': ((model.Sample,), ()),
+    'sequence_file': ((model.SequenceFile,), ()),
+}
+
+# the rules the model schemas use, which the schema compiler knows, anything else is handed to cerberus
+_COMPILED_RULES = {'allowed', 'anyof_type', 'empty', 'minlength', 'nullable', 'required', 'schema', 'type'}
+
 
 def validate_sequencing_run(sequencing_run):
     """
@@ -16,11 +38,11 @@ def validate_sequencing_run(sequencing_run):
     """
     validation_result = model.ValidationResult()
 
-    # Validation objects
-    v_sequencing_run = Validator(model.SequencingRun.uploadable_schema, allow_unknown=True)
-    v_project = Validator(model.Project.uploadable_schema, allow_unknown=True)
-    v_sample = Validator(model.Sample.uploadable_schema, allow_unknown=True)
-    v_sequence_file = Validator(model.SequenceFile.uploadable_schema, allow_unknown=True)
+    # Validation objects, compiled once
+    v_sequencing_run = _sequencing_run_validator
+    v_project = _project_validator
+    v_sample = _sample_validator
+    v_sequence_file = _sequence_file_validator
 
     # validation is nested so we can catch multiple levels of project/sample/file errors
 
@@ -63,13 +85,220 @@ def validate_send_project(project):
     :return: raises a ModelValidationError when project is invalid
     """
 
-    v_project = Validator(model.Project.send_project_schema, allow_unknown=True)
-    _validate_object(v_project, project)
+    _validate_object(_send_project_validator, project)
 
 
 def _validate_object(validator, o):
-    if not validator.validate(o.get_dict()):
-        raise model.exceptions.ModelValidationError(validator.errors, o)
+    errors = validator.validate(o.get_dict())
+    if errors:
+        raise model.exceptions.ModelValidationError(errors, o)
+
+
+def compile_schema(schema):
+    """
+    Compiles a cerberus schema into a validator, unknown fields in documents are allowed
+
+    :param schema: cerberus schema dict
+    :return: object with a validate(document) method that returns a dict of cerberus style errors,
+        empty when the document is valid
+    """
+    if _can_compile(schema):
+        return _CompiledValidator(schema)
+    return _CerberusValidator(schema)
+
+
+def _can_compile(schema):
+    for rules in schema.values():
+        if not set(rules) <= _COMPILED_RULES:
+            return False
+        if 'type' in rules and rules['type'] not in _TYPE_DEFINITIONS:
+            return False
+        if not all(t in _TYPE_DEFINITIONS for t in rules.get('anyof_type', [])):
+            return False
+        if 'schema' in rules:
+            # the same rule means item rules for lists and a sub schema for dicts
+            if rules.get('type') == 'list':
+                if not _can_compile({0: rules['schema']}):
+                    return False
+            elif rules.get('type') == 'dict':
+                if not _can_compile(rules['schema']):
+                    return False
+            else:
+                return False
+    return True
+
+
+class _CompiledValidator:
+    """
+    A cerberus schema compiled into a list of field checks
+    Holds no state between calls, so one instance can be shared by every thread
+    """
+
+    def __init__(self, schema):
+        self._field_checks = [(field, rules.get('required', False), _compile_rules(rules))
+                              for field, rules in schema.items()]
+
+    def validate(self, document):
+        errors = {}
+        for field, required, check in self._field_checks:
+            if field not in document:
+                if required:
+                    errors[field] = ['required field']
+                continue
+            field_errors = check(document[field])
+            if field_errors:
+                errors[field] = field_errors
+        return errors
+
+
+def _compile_rules(rules):
+    """
+    Builds a function that checks a value against the rules for one field
+
+    Rules are checked in the order cerberus uses: nullable, type, empty, then the rest in schema order
+    A null value or a wrong type stops the other rules, with an empty rule an empty value skips allowed and minlength
+    """
+    nullable = rules.get('nullable', False)
+    type_check = _compile_type(rules['type']) if 'type' in rules else None
+    empty = rules.get('empty')
+
+    checks = []
+    for rule, constraint in rules.items():
+        if rule == 'minlength':
+            checks.append((True, _compile_minlength(constraint)))
+        elif rule == 'allowed':
+            checks.append((True, _compile_allowed(constraint)))
+        elif rule == 'anyof_type':
+            checks.append((False, _compile_anyof_type(constraint)))
+        elif rule == 'schema':
+            if rules['type'] == 'list':
+                checks.append((False, _compile_item_schema(constraint)))
+            else:
+                checks.append((False, _compile_sub_schema(constraint)))
+
+    def check(value):
+        if value is None:
+            return [] if nullable else ['null value not allowed']
+
+        errors = []
+        if type_check is not None:
+            error = type_check(value)
+            if error:
+                return [error]
+
+        # like cerberus, empty values are only special when the schema has an empty rule
+        is_empty = empty is not None and isinstance(value, Sized) and len(value) == 0
+        if is_empty and not empty:
+            errors.append('empty values not allowed')
+
+        for skipped_when_empty, rule_check in checks:
+            if is_empty and skipped_when_empty:
+                continue
+            errors.extend(rule_check(value))
+        return errors
+
+    return check
+
+
+def _compile_type(type_name):
+    included, excluded = _TYPE_DEFINITIONS[type_name]
+    message = 'must be of {} type'.format(type_name)
+
+    def check(value):
+        if not isinstance(value, included) or isinstance(value, excluded):
+            return message
+        return None
+
+    return check
+
+
+# The rule checks below return a list of errors, empty when the value passes
+
+
+def _compile_minlength(min_length):
+    message = 'min length is {}'.format(min_length)
+
+    def check(value):
+        if isinstance(value, Iterable) and len(value) < min_length:
+            return [message]
+        return []
+
+    return check
+
+
+def _compile_allowed(allowed_values):
+
+    def check(value):
+        if isinstance(value, Iterable) and not isinstance(value, str):
+            unallowed = tuple(x for x in value if x not in allowed_values)
+            if unallowed:
+                return ['unallowed values {}'.format(unallowed)]
+        elif value not in allowed_values:
+            return ['unallowed value {}'.format(value)]
+        return []
+
+    return check
+
+
+def _compile_anyof_type(type_names):
+    type_checks = [_compile_type(type_name) for type_name in type_names]
+
+    def check(value):
+        definition_errors = {}
+        for index, type_check in enumerate(type_checks):
+            error = type_check(value)
+            if error is None:
+                return []
+            definition_errors['anyof definition {}'.format(index)] = [error]
+        return ['no definitions validate', definition_errors]
+
+    return check
+
+
+def _compile_item_schema(item_rules):
+    item_check = _compile_rules(item_rules)
+
+    def check(value):
+        item_errors = {}
+        for index, item in enumerate(value):
+            errors = item_check(item)
+            if errors:
+                item_errors[index] = errors
+        return [item_errors] if item_errors else []
+
+    return check
+
+
+def _compile_sub_schema(schema):
+    validator = _CompiledValidator(schema)
+
+    def check(value):
+        errors = validator.validate(value)
+        return [errors] if errors else []
+
+    return check
+
+
+class _CerberusValidator:
+    """
+    Validates with cerberus, for schemas that use rules the compiler does not know
+    cerberus is only imported when such a schema is used
+    """
+
+    def __init__(self, schema):
+        self._schema = schema
+
+    def validate(self, document):
+        from cerberus import Validator, TypeDefinition
+
+        types_mapping = dict(Validator.types_mapping)
+        for type_name, (included, excluded) in _TYPE_DEFINITIONS.items():
+            types_mapping.setdefault(type_name, TypeDefinition(type_name, included, excluded))
+        # a new validator per call, cerberus validators keep the errors of the last document
+        validator_class = type('ModelValidator', (Validator,), {'types_mapping': types_mapping})
+        validator = validator_class(self._schema, allow_unknown=True)
+        validator.validate(document)
+        return validator.errors
 
 
 def _validate_sequence_file_names(sequence_file):
@@ -100,3 +329,10 @@ def _validate_sequence_file_names(sequence_file):
                                                             "First letter that is different between files should "
                                                             "identify forward/reverse with one of ['F', 'f', '1'] and "
                                                             "['R', 'r', '2'] respectively.", sequence_file)
+
+
+_sequencing_run_validator = compile_schema(model.SequencingRun.uploadable_schema)
+_project_validator = compile_schema(model.Project.uploadable_schema)
+_sample_validator = compile_schema(model.Sample.uploadable_schema)
+_sequence_file_validator = compile_schema(model.SequenceFile.uploadable_schema)
+_send_project_validator = compile_schema(model.Project.send_project_schema)
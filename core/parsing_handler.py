@@ -51,6 +51,16 @@ def parse_and_validate(directory):
     return sequencing_run
 
 
+def get_runs(directory):
+    """
+    Given a directory of run directories, returns a DirectoryStatus object for each run, created by the parser
+    :param directory:
+    :return: list of DirectoryStatus
+    """
+    parser_instance = get_parser_from_config()
+    return parser_instance.find_runs(directory)
+
+
 def get_run_status(directory):
     """
     Given a run directory, returns a DirectoryStatus object created by the parser
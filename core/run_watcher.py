@@ -0,0 +1,220 @@
+"""
+This file watches a directory for sequencing runs that are ready to upload
+
+Run directories are found from the files a sequencer (or a copy) writes once a run is complete, see RUN_MARKER_FILES.
+On Linux the directory is watched with inotify, elsewhere (or when inotify can not be used) the run directories
+are polled. Polling only looks at the modification time of each run directory, not at the files in it.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import time
+
+# Files that mark a run directory as (possibly) ready to upload, when one of them appears the run is checked
+RUN_MARKER_FILES = {'CompletedJobInfo.xml', 'SampleSheet.csv', 'SampleList.csv'}
+# Seconds between checks of the run directories when they can not be watched with inotify
+POLL_INTERVAL = 30
+
+# inotify constants, see inotify(7)
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE_SELF = 0x00000400
+_IN_IGNORED = 0x00008000
+_IN_Q_OVERFLOW = 0x00004000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+_ROOT_MASK = _IN_CREATE | _IN_MOVED_TO
+_RUN_MASK = _IN_CLOSE_WRITE | _IN_CREATE | _IN_MOVED_TO | _IN_DELETE_SELF
+
+
+def _load_libc():
+    """
+    Returns libc when it has inotify, otherwise None
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1
+    except (OSError, AttributeError, TypeError):
+        return None
+    return libc
+
+
+_libc = _load_libc()
+
+
+class RunWatcher:
+    """
+    Reports the run directories in a directory that may have become ready to upload
+
+    Every run directory is reported by the first call to wait_for_changes, after that a run directory is only
+    reported when one of the RUN_MARKER_FILES is written in it, or when the run directory is new.
+    """
+
+    def __init__(self, directory, poll_interval=POLL_INTERVAL, use_inotify=True):
+        """
+        :param directory: directory the run directories are in
+        :param poll_interval: seconds between checks when the directory is polled
+        :param use_inotify: when False the directory is always polled
+        """
+        self._directory = directory
+        self._poll_interval = poll_interval
+        self._first_scan = True
+        # run directory modification times, and when they were last checked, when polling
+        self._modified_times = {}
+        self._last_poll = None
+        self._inotify_fd = None
+        # inotify watch descriptors to the run directory they watch, None for the watched directory itself
+        self._watches = {}
+
+        if use_inotify and _libc is not None:
+            try:
+                self._start_inotify()
+            except OSError as e:
+                logging.warning("Could not watch {} with inotify, polling every {} seconds instead: {}".format(
+                    directory, poll_interval, e))
+                self.close()
+        if self._inotify_fd is None:
+            logging.info("Polling {} for runs every {} seconds".format(directory, poll_interval))
+        else:
+            logging.info("Watching {} for runs".format(directory))
+
+    @property
+    def uses_inotify(self):
+        return self._inotify_fd is not None
+
+    def close(self):
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+            self._watches = {}
+
+    def _list_run_directories(self):
+        with os.scandir(self._directory) as entries:
+            return [entry.path for entry in entries if entry.is_dir() and not entry.name.startswith('.')]
+
+    def wait_for_changes(self, timeout=None):
+        """
+        Waits until run directories may have become ready to upload
+
+        :param timeout: seconds to wait at most, None to wait until there is a change
+        :return: set of run directories, empty when the timeout passed without changes
+        """
+        if self._first_scan:
+            self._first_scan = False
+            run_directories = self._list_run_directories()
+            self._modified_times = {d: _modified_time(d) for d in run_directories}
+            self._last_poll = time.monotonic()
+            return set(run_directories)
+
+        if self._inotify_fd is not None:
+            return self._read_inotify(timeout)
+        return self._poll(timeout)
+
+    def _poll(self, timeout):
+        """
+        Reports run directories that are new, or have had files added, checking every poll_interval seconds
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            next_poll = self._last_poll + self._poll_interval
+            if deadline is not None and deadline < next_poll:
+                time.sleep(max(0, deadline - time.monotonic()))
+                return set()
+            time.sleep(max(0, next_poll - time.monotonic()))
+            self._last_poll = time.monotonic()
+
+            changed = set()
+            modified_times = {}
+            for run_directory in self._list_run_directories():
+                modified_times[run_directory] = _modified_time(run_directory)
+                if modified_times[run_directory] != self._modified_times.get(run_directory):
+                    changed.add(run_directory)
+            self._modified_times = modified_times
+            if changed:
+                return changed
+
+    def _start_inotify(self):
+        fd = _libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            raise _libc_error()
+        self._inotify_fd = fd
+        self._add_watch(self._directory, _ROOT_MASK, None)
+        for run_directory in self._list_run_directories():
+            self._add_watch(run_directory, _RUN_MASK, run_directory)
+
+    def _add_watch(self, path, mask, run_directory):
+        wd = _libc.inotify_add_watch(self._inotify_fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise _libc_error(path)
+        self._watches[wd] = run_directory
+
+    def _read_inotify(self, timeout):
+        """
+        Reports run directories a marker file was written in, and new run directories
+        """
+        readable, _, _ = select.select([self._inotify_fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changed = set()
+        try:
+            data = os.read(self._inotify_fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + name_length].rstrip(b"\0")
+            offset += _EVENT_HEADER.size + name_length
+            name = os.fsdecode(name)
+
+            if mask & _IN_Q_OVERFLOW:
+                # events were lost, check every run directory again
+                logging.warning("Too many changes in {}, checking every run".format(self._directory))
+                for run_directory in self._list_run_directories():
+                    if run_directory not in self._watches.values():
+                        self._try_add_run_watch(run_directory)
+                    changed.add(run_directory)
+            elif mask & _IN_IGNORED:
+                self._watches.pop(wd, None)
+            elif wd not in self._watches:
+                continue
+            elif self._watches[wd] is None:
+                # a new run directory, the marker files may already be in it when it was moved here
+                if mask & _IN_ISDIR and not name.startswith('.'):
+                    run_directory = os.path.join(self._directory, name)
+                    self._try_add_run_watch(run_directory)
+                    changed.add(run_directory)
+            elif name in RUN_MARKER_FILES:
+                changed.add(self._watches[wd])
+        return changed
+
+    def _try_add_run_watch(self, run_directory):
+        try:
+            self._add_watch(run_directory, _RUN_MASK, run_directory)
+        except OSError as e:
+            # e.g. the directory has already been removed again
+            logging.debug("Could not watch {}: {}".format(run_directory, e))
+
+
+def _modified_time(directory):
+    try:
+        return os.stat(directory).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _libc_error(path=None):
+    error_number = ctypes.get_errno()
+    if error_number == errno.ENOSPC:
+        return OSError(error_number, "The inotify watch limit was reached, see fs.inotify.max_user_watches", path)
+    return OSError(error_number, os.strerror(error_number), path)
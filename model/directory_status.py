@@ -31,10 +31,14 @@ class DirectoryStatus:
         :param directory: Directory of a potential run
         status: status of the directory: 'new', 'partial', 'complete', 'invalid'
         message: Used when run is invalid,
+        run_id: id of the sequencing run on IRIDA the directory is being / was uploaded to
+        sample_status_dict: per sample upload progress, as read from / written to the status file
         """
         self._directory = directory
         self._status = None
         self._message = None
+        self._run_id = None
+        self._sample_status_dict = {}
 
     @property
     def directory(self):
@@ -78,3 +82,19 @@ class DirectoryStatus:
     @message.setter
     def message(self, message):
         self._message = message
+
+    @property
+    def run_id(self):
+        return self._run_id
+
+    @run_id.setter
+    def run_id(self, run_id):
+        self._run_id = run_id
+
+    @property
+    def sample_status_dict(self):
+        return self._sample_status_dict
+
+    @sample_status_dict.setter
+    def sample_status_dict(self, sample_status_dict):
+        self._sample_status_dict = sample_status_dict
@@ -0,0 +1,93 @@
+"""
+Compact storage for the metadata columns of Sample and SequenceFile objects
+
+Every sample parsed from the same sample sheet has the same metadata keys. Instead of a dict per object, the keys
+are stored once in a shared MetadataTable and each object only keeps a tuple of its values.
+MetadataView gives a read-only dict-like view over a table and a tuple of values without copying them.
+"""
+import sys
+import threading
+from collections.abc import Mapping
+from weakref import WeakValueDictionary
+
+
+class MetadataTable:
+    """
+    An ordered set of interned metadata keys, shared by every object that has the same keys
+
+    Tables are only kept alive while an object is using them
+    """
+
+    __slots__ = ('_keys', '_index', '__weakref__')
+
+    _tables = WeakValueDictionary()
+    _tables_lock = threading.Lock()
+
+    def __init__(self, keys):
+        self._keys = keys
+        self._index = {key: index for index, key in enumerate(keys)}
+
+    @classmethod
+    def get_table(cls, keys):
+        """
+        Returns the shared table for a sequence of keys
+
+        :param keys: metadata keys, in order
+        :return: MetadataTable
+        """
+        keys = tuple(sys.intern(key) if type(key) is str else key for key in keys)
+        with cls._tables_lock:
+            table = cls._tables.get(keys)
+            if table is None:
+                table = cls(keys)
+                cls._tables[keys] = table
+            return table
+
+    @property
+    def keys(self):
+        return self._keys
+
+    def index(self, key):
+        """
+        :return: position of key in the table, None if the key is not in the table
+        """
+        return self._index.get(key)
+
+
+class MetadataView(Mapping):
+    """
+    A read-only dict-like view over a MetadataTable and a tuple of values
+
+    extra holds keys that are not part of the table (e.g. sampleName), or that replace a value in the table
+    """
+
+    __slots__ = ('_table', '_values', '_extra')
+
+    def __init__(self, table, values, extra=None):
+        self._table = table
+        self._values = values
+        self._extra = extra or {}
+
+    def __getitem__(self, key):
+        if key in self._extra:
+            return self._extra[key]
+        index = self._table.index(key)
+        if index is None:
+            raise KeyError(key)
+        return self._values[index]
+
+    def __contains__(self, key):
+        return key in self._extra or self._table.index(key) is not None
+
+    def __iter__(self):
+        for key in self._table.keys:
+            yield key
+        for key in self._extra:
+            if self._table.index(key) is None:
+                yield key
+
+    def __len__(self):
+        return len(self._table.keys) + sum(1 for key in self._extra if self._table.index(key) is None)
+
+    def __repr__(self):
+        return repr(dict(self))
@@ -1,13 +1,6 @@
-from cerberus import Validator, TypeDefinition
-
-from .sample import Sample
-
-
 class Project:
 
-    # Define Sample as a type for validation
-    _sample_type = TypeDefinition('sample', (Sample,), ())
-    Validator.types_mapping['sample'] = _sample_type
+    __slots__ = ('_name', '_sample_list', '_description', '_id')
 
     # schema for sequence file uploading
     uploadable_schema = {'_sample_list': {
@@ -80,4 +73,4 @@ class Project:
         return "ID:" + self._id + " Name: " + self._name + " Description: " + self._description
 
     def get_dict(self):
-        return self.__dict__
+        return {slot: getattr(self, slot) for slot in self.__slots__}
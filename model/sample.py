@@ -5,17 +5,13 @@ Keys from a sequencer include: 'sampleName','description'
 
 Keys from Irida will include these AND many others
 """
-from cerberus import Validator, TypeDefinition
-from copy import deepcopy
-
-from .sequence_file import SequenceFile
+from .metadata_table import MetadataTable, MetadataView
 
 
 class Sample:
 
-    # Define SequenceFile as a type for validation
-    _sample_type = TypeDefinition('sequence_file', (SequenceFile,), ())
-    Validator.types_mapping['sequence_file'] = _sample_type
+    __slots__ = ('_sample_name', '_description', '_sample_number', '_metadata_table', '_metadata_values',
+                 '_sequence_file')
 
     uploadable_schema = {'_sequence_file': {
                             'type': 'sequence_file',
@@ -45,7 +41,9 @@ class Sample:
         self._sample_number = sample_number
         if samp_dict is None:
             samp_dict = {}
-        self._sample_dict = dict(samp_dict)
+        # keys are shared with every sample that has the same metadata columns, only the values are per sample
+        self._metadata_table = MetadataTable.get_table(samp_dict.keys())
+        self._metadata_values = tuple(samp_dict.values())
         self._sequence_file = None
 
     @property
@@ -69,21 +67,21 @@ class Sample:
         self._sequence_file = sq
 
     def get_irida_id(self):
-        if "identifier" in self._sample_dict:
-            return self.get("identifier")
-        else:
-            return None
+        return self.get("identifier")
 
     def get_uploadable_dict(self):  # formatting for sending to irida when creating a project
-        uploadable_dict = deepcopy(self._sample_dict)
-        uploadable_dict['sampleName'] = self.sample_name
-        uploadable_dict['description'] = self.description
-        return uploadable_dict
+        """
+        Returns a read-only dict-like view of the sample metadata with sampleName and description
+        Use dict() on the result when a modifiable copy is needed
+        """
+        return MetadataView(self._metadata_table, self._metadata_values,
+                            extra={'sampleName': self.sample_name, 'description': self.description})
 
     def __getitem__(self, key):
-        if key in self._sample_dict:
-            return self._sample_dict[key]
-        return None
+        index = self._metadata_table.index(key)
+        if index is None:
+            return None
+        return self._metadata_values[index]
 
     def get(self, key):
         return self.__getitem__(key)
@@ -92,4 +90,8 @@ class Sample:
         return str(self.get_uploadable_dict) + str(self.sequence_file)
 
     def get_dict(self):
-        return self.__dict__
+        return {'_sample_name': self._sample_name,
+                '_description': self._description,
+                '_sample_number': self._sample_number,
+                '_sample_dict': MetadataView(self._metadata_table, self._metadata_values),
+                '_sequence_file': self._sequence_file}
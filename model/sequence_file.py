@@ -8,10 +8,13 @@ i5IndexID
 index2
 etc.
 """
+from .metadata_table import MetadataTable, MetadataView
 
 
 class SequenceFile:
 
+    __slots__ = ('_metadata_table', '_metadata_values', '_file_list', '_file_parts')
+
     uploadable_schema = {'_file_list': {
                             'type': 'list',
                             'empty': False,  # must have at least 1 file
@@ -21,32 +24,47 @@ class SequenceFile:
                          '_properties_dict': {'type': 'dict'}
                          }
 
-    def __init__(self, file_list, properties_dict=None):
+    def __init__(self, file_list, properties_dict=None, file_parts=None):
+        """
+        :param file_list: the files of the sample, one for single end reads or two for paired end reads
+        :param properties_dict: sample metadata
+        :param file_parts: optional, {file name: list of files} for files in file_list that do not exist on disk
+            but are made of several files (e.g. one per lane) uploaded back to back as one file
+        """
         if properties_dict is None:
-            self._properties_dict = {}
-        else:
-            self._properties_dict = properties_dict  # Sample metadata, needed run_id gets affixed in upload
+            properties_dict = {}
+        # Sample metadata, needed run_id gets affixed to a copy in upload
+        self._metadata_table = MetadataTable.get_table(properties_dict.keys())
+        self._metadata_values = tuple(properties_dict.values())
         self._file_list = file_list
+        self._file_parts = file_parts or {}
 
     @property
     def properties_dict(self):
-        return self._properties_dict
+        """
+        Read-only dict-like view of the sample metadata, use dict() on it when a modifiable copy is needed
+        """
+        return MetadataView(self._metadata_table, self._metadata_values)
 
     def get(self, key):
-        ret_val = None
-        if self._properties_dict in key:
-            ret_val = self._properties_dict[key]
-        return ret_val
+        return self.properties_dict.get(key)
 
     @property
     def file_list(self):
         return self._file_list
 
+    def get_file_parts(self, file_name):
+        """
+        Returns the files on disk that make up a file in file_list, in order
+        """
+        return self._file_parts.get(file_name, [file_name])
+
     def is_paired_end(self):
         return len(self._file_list) == 2
 
     def __str__(self):
-        return str(self._properties_dict) + str(self._file_list)
+        return str(self.properties_dict) + str(self._file_list)
 
     def get_dict(self):
-        return self.__dict__
+        return {'_properties_dict': self.properties_dict,
+                '_file_list': self._file_list}
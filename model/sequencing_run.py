@@ -1,13 +1,6 @@
-from cerberus import Validator, TypeDefinition
-
-from .project import Project
-
-
 class SequencingRun:
 
-    # Define Project as a type for validation
-    _project_type = TypeDefinition('project', (Project,), ())
-    Validator.types_mapping['project'] = _project_type
+    __slots__ = ('_project_list', '_metadata')
 
     uploadable_schema = {'_project_list': {
                             'type': 'list',
@@ -42,4 +35,4 @@ class SequencingRun:
         self._project_list = p_list
 
     def get_dict(self):
-        return self.__dict__
+        return {slot: getattr(self, slot) for slot in self.__slots__}
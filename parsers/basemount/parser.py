@@ -4,10 +4,9 @@ import re
 
 import progress
 from model.project import Project
-import subprocess
 from .. import exceptions
 from . import sample_parser, validation
-from core.api_handler import initialize_api_from_config, _get_api_instance
+from core.api_handler import get_api_instance
 
 class Parser:
 
@@ -66,8 +65,7 @@ class Parser:
 
     @staticmethod
     def _get_project_id(project_name):
-        api_instance = initialize_api_from_config()
-        api_instance.get_projects()
+        api_instance = get_api_instance()
         if project_name.endswith(' (2)') or project_name.endswith(' (3)'):
             project_name = project_name[:-4]
         project_ids = [x._id for x in api_instance.get_projects() if x._name == project_name]
@@ -82,25 +80,24 @@ class Parser:
 
     @staticmethod
     def get_subreads(directory, r):
-        return sorted(['"' + os.path.join(directory, x) + '"' for x in os.listdir(directory)
-                           if x.endswith(r + '_001.fastq.gz')])
+        """
+        Returns the lane files of a read in a sample directory, in lane order
+        """
+        return sorted([os.path.join(directory, x) for x in os.listdir(directory) if x.endswith(r + '_001.fastq.gz')])
 
     @staticmethod
-    def merge_reads(directory, sample_name, temp_dir='/tmp/irida/'):
-        if not os.path.exists(temp_dir):
-            os.mkdir(temp_dir)
-        merged_reads_r1 = os.path.join(temp_dir, sample_name + '_R1.fastq.gz')
-        merged_reads_r2 = os.path.join(temp_dir, sample_name + '_R2.fastq.gz')
-        if not os.path.exists(merged_reads_r1) or not os.path.exists(merged_reads_r2):
-            read_dir = os.path.join(directory, 'Samples', sample_name, 'Files')
-            r1_list = Parser.get_subreads(read_dir, 'R1')
-            r2_list = Parser.get_subreads(read_dir, 'R2')
-            if len(r1_list) == 4:
-                subprocess.call('cat {} > {}'.format(' '.join(r1_list),
-                                                     merged_reads_r1), shell=True)
-                subprocess.call('cat {} > {}'.format(' '.join(r2_list),
-                                                     merged_reads_r2), shell=True)
-        return merged_reads_r1, merged_reads_r2
+    def _get_lane_files(directory, sample_name):
+        """
+        Finds the lane files of a sample, for any number of lanes
+
+        :return: list of R1 lane files, list of R2 lane files (empty for single end reads)
+        """
+        read_dir = os.path.join(directory, 'Samples', sample_name, 'Files')
+        r1_list = Parser.get_subreads(read_dir, 'R1')
+        r2_list = Parser.get_subreads(read_dir, 'R2')
+        if not r1_list:
+            raise exceptions.DirectoryError("Sample {} does not have any R1 read files".format(sample_name), read_dir)
+        return r1_list, r2_list
 
     @staticmethod
     def get_sample_sheet(directory):
@@ -123,17 +120,18 @@ class Parser:
             sample_paths = [os.path.join(sample_directory, x, "Files") for x in os.listdir(sample_directory) if
                             not x.startswith('.')]
             irida_project_id = Parser._get_project_id(project_name)
-            existing_samples = [x.sample_name for x in _get_api_instance().get_samples(irida_project_id)]
+            existing_samples = [x.sample_name for x in get_api_instance().get_samples(irida_project_id)]
             for sample in sample_paths:
                 sample_dict = dict(project_id=irida_project_id)
                 logging.debug('Reading folder %s' % sample)
                 sample_dict['sample_name'] = re.search("Samples\/(.+)\/Files", sample).group(1)
                 if not sample_dict['sample_name'] in existing_samples:
-                    r1, r2 = Parser.merge_reads(directory, sample_dict['sample_name'], temp_dir='/qib/services/galaxy/temp/irida')
+                    # the lane files are listed, and uploaded back to back as one file per read
+                    r1_list, r2_list = Parser._get_lane_files(directory, sample_dict['sample_name'])
                     if len(sample_dict['sample_name']) < 4:
                         sample_dict['sample_name'] = project_name + '-' + sample_dict['sample_name']
-                    sample_dict['file_forward'] = r1
-                    sample_dict['file_reverse'] = r2
+                    sample_dict['file_forward'] = sample_parser.LANE_FILE_SEPARATOR.join(r1_list)
+                    sample_dict['file_reverse'] = sample_parser.LANE_FILE_SEPARATOR.join(r2_list)
                     sample_sheet.write("{sample_name},{project_id},{file_forward},{file_reverse}\n".format(**sample_dict))
         return sample_sheet_path
 
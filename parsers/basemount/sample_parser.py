@@ -1,12 +1,17 @@
 from os import path, walk
-from csv import reader
 from collections import OrderedDict
-from copy import deepcopy
 import logging
-from core.api_handler import initialize_api_from_config
+import re
+from core.api_handler import get_uploaded_files
 
 import model
 from .. import exceptions
+from ..sample_sheet import read_sample_sheet
+
+# File_Forward and File_Reverse can list the lane files of a read, separated by this
+LANE_FILE_SEPARATOR = ';'
+# The lane in an Illumina fastq file name, e.g. _L001 in sample_S1_L001_R1_001.fastq.gz
+_LANE_PATTERN = re.compile(r'_L\d{3}(?=_)')
 
 
 def build_sequencing_run_from_samples(sample_sheet_file):
@@ -20,41 +25,40 @@ def build_sequencing_run_from_samples(sample_sheet_file):
     logging.debug("Building SequencingRun from parsed data")
 
     # create list of projects and add samples to appropriate project
-    project_list = []
+    # projects are indexed by id so each sample finds its project without searching the list
+    project_dict = OrderedDict()
     for sample_number, sample in enumerate(sample_list):
         # get data from data dict
         sample_name = sample['Sample_Name']
         project_id = sample['Project_ID']
-        file_f = sample['File_Forward']
-        file_r = sample['File_Reverse']
+        file_f, file_r, file_parts = _get_sequence_file_names(sample['File_Forward'], sample['File_Reverse'])
 
-        project = None
         # see if project exists
-        for p in project_list:
-            if project_id == p.id:
-                project = p
+        project = project_dict.get(project_id)
         # create project if it doesn't exitt yet
         if project is None:
             project = model.Project(id=project_id)
-            project_list.append(project)
+            project_dict[project_id] = project
 
         # create sequence file
         if len(file_r) > 0:
             # paired end read
-            sq = model.SequenceFile(properties_dict=None, file_list=[file_f, file_r])
+            sq = model.SequenceFile(properties_dict=None, file_list=[file_f, file_r], file_parts=file_parts)
         else:
             # single end read
-            sq = model.SequenceFile(properties_dict=None, file_list=[file_f])
+            sq = model.SequenceFile(properties_dict=None, file_list=[file_f], file_parts=file_parts)
 
         # create sample
         sample_obj = model.Sample(sample_name=sample_name, sample_number=sample_number+1)
 
         # add sequence file to sample
-        sample_obj.sequence_file = deepcopy(sq)
+        sample_obj.sequence_file = sq
 
         # add sample to project
         project.add_sample(sample_obj)
 
+    project_list = list(project_dict.values())
+
     # add the layout type to the sequencing run so we know if it is paired or single end
     if not project_list:
         logging.error("No samples to upload!")
@@ -73,6 +77,31 @@ def build_sequencing_run_from_samples(sample_sheet_file):
     return sequence_run
 
 
+def _get_sequence_file_names(file_forward, file_reverse):
+    """
+    Gets the files to upload from the File_Forward and File_Reverse columns
+
+    A read with several lane files is uploaded as one file, named like the lane files without the lane, e.g.
+    sample_S1_L001_R1_001.fastq.gz and sample_S1_L002_R1_001.fastq.gz are uploaded as sample_S1_R1_001.fastq.gz.
+    Gzip files can be concatenated, so the lane files are sent back to back without being merged on disk first.
+
+    :return: forward file name, reverse file name ('' for single end reads), {file name: lane files}
+    """
+    file_names = []
+    file_parts = {}
+    for column in [file_forward, file_reverse]:
+        lane_files = [f for f in column.split(LANE_FILE_SEPARATOR) if f]
+        if len(lane_files) > 1:
+            file_name = path.join(path.dirname(lane_files[0]), _LANE_PATTERN.sub('', path.basename(lane_files[0]), 1))
+            if file_name in lane_files:
+                # the file names do not have a lane, name the file after the first lane file
+                file_name = lane_files[0] + '.lanes'
+            file_parts[file_name] = lane_files
+            file_names.append(file_name)
+        else:
+            file_names.append(column)
+    return file_names[0], file_names[1], file_parts
+
 
 def _parse_sample_list(sample_sheet_file):
     """
@@ -92,16 +121,17 @@ def _parse_sample_list(sample_sheet_file):
 
     logging.info("Verifying data parsed from sample sheet {}".format(sample_sheet_file))
     import os
-    api_instance = initialize_api_from_config()
+    # look up what is already on IRIDA for the whole sheet at once instead of row by row
+    uploaded_files = get_uploaded_files((int(sample_dict['Project_ID']), sample_dict['Sample_Name'])
+                                        for sample_dict in sample_dict_list)
     filtered_sample_dict_list = []
     for sample_dict in sample_dict_list:
-        uploaded_seqs = []
-        existing_samples = [x.sample_name for x in api_instance.get_samples(int(sample_dict['Project_ID']))]
-        if sample_dict.get('Sample_Name') in existing_samples:
-            uploaded_seqs = [x['fileName'] for x in api_instance.get_sequence_files(int(sample_dict['Project_ID']),
-                                                                                sample_dict['Sample_Name'])]
-        if os.path.basename(sample_dict['File_Forward']).replace('.gz', '') not in uploaded_seqs and \
-                '%s_R1.fastq' % sample_dict['Sample_Name'] not in uploaded_seqs:
+        project_id = int(sample_dict['Project_ID'])
+        sample_name = sample_dict['Sample_Name']
+        file_forward = _get_sequence_file_names(sample_dict['File_Forward'], sample_dict['File_Reverse'])[0]
+        forward_file_name = os.path.basename(file_forward).replace('.gz', '')
+        if (project_id, sample_name, forward_file_name) not in uploaded_files and \
+                (project_id, sample_name, '%s_R1.fastq' % sample_name) not in uploaded_files:
             filtered_sample_dict_list.append(sample_dict)
         paired_end_read = len(sample_dict['File_Reverse']) > 0
         # keep track if we have both paired and single end reads
@@ -110,19 +140,22 @@ def _parse_sample_list(sample_sheet_file):
         else:
             has_single_end_read = True
 
-        # Check if file names are in the files we found in the directory
-        if not os.path.exists(sample_dict['File_Forward']):
-            raise exceptions.SampleSheetError(
-                ("Your sample sheet is malformed. {} Does not match any file in the directory {}"
-                 "".format(sample_dict['File_Forward'], data_dir)),
-                sample_sheet_file
-            )
-        if paired_end_read and not os.path.exists(sample_dict['File_Reverse']):
-            raise exceptions.SampleSheetError(
-                ("Your sample sheet is malformed. {} Does not match any file in the directory {}"
-                 "".format(sample_dict['File_Reverse'], data_dir)),
-                sample_sheet_file
-            )
+        # Check if file names are in the files we found in the directory, each lane file when a read has several
+        for file_name in sample_dict['File_Forward'].split(LANE_FILE_SEPARATOR):
+            if not os.path.exists(file_name):
+                raise exceptions.SampleSheetError(
+                    ("Your sample sheet is malformed. {} Does not match any file in the directory {}"
+                     "".format(file_name, data_dir)),
+                    sample_sheet_file
+                )
+        if paired_end_read:
+            for file_name in sample_dict['File_Reverse'].split(LANE_FILE_SEPARATOR):
+                if not os.path.exists(file_name):
+                    raise exceptions.SampleSheetError(
+                        ("Your sample sheet is malformed. {} Does not match any file in the directory {}"
+                         "".format(file_name, data_dir)),
+                        sample_sheet_file
+                    )
     # Verify we don't have both single end and paired end reads
     if has_single_end_read and has_paired_end_read:
         raise exceptions.SampleSheetError(
@@ -148,7 +181,7 @@ def _parse_samples(sample_sheet_file):
 
     logging.info("Reading data from sample sheet {}".format(sample_sheet_file))
 
-    csv_reader = get_csv_reader(sample_sheet_file)
+    sample_sheet = read_sample_sheet(sample_sheet_file)
     # start with an ordered dictionary so that keys are ordered in the same
     # way that they are inserted.
     sample_dict = OrderedDict()
@@ -157,23 +190,14 @@ def _parse_samples(sample_sheet_file):
     sample_key_list = ['Sample_Name', 'Project_ID', 'File_Forward', 'File_Reverse']
 
     # initilize dictionary keys from first line (data headers/attributes)
-    set_attributes = False
-    for line in csv_reader:
+    for item in sample_sheet.data_columns:
 
-        if set_attributes:
-            for item in line:
+        if item in sample_key_list:
+            key_name = item
+            sample_dict[key_name] = ""
 
-                if item in sample_key_list:
-                    key_name = item
-                    sample_dict[key_name] = ""
-
-            break
-
-        if "[Data]" in line:
-            set_attributes = True
-
-    # fill in values for keys. line is currently below the [Data] headers
-    for sample_number, line in enumerate(csv_reader):
+    # fill in values for keys from the lines below the [Data] headers
+    for sample_number, line in enumerate(sample_sheet.data_rows):
 
         if len(sample_dict.keys()) != len(line):
             """
@@ -185,12 +209,12 @@ def _parse_samples(sample_sheet_file):
             doing a single end run
             """
             if len(sample_dict.keys()) - len(line) == 1:
-                line.append("")
+                line = line + ("",)
             else:
                 raise exceptions.SampleSheetError(
                     ("Your sample sheet is malformed. Expected to find {} "
                      "columns in the [Data] section, but only found {} columns "
-                     "for line {}.".format(len(sample_dict.keys()), len(line), line)),
+                     "for line {}.".format(len(sample_dict.keys()), len(line), list(line))),
                     sample_sheet_file
                 )
 
@@ -208,37 +232,7 @@ def _parse_samples(sample_sheet_file):
 
             sample_dict[key] = value
 
-        sample_dict_list.append(deepcopy(sample_dict))
+        # a shallow copy is enough, the values are strings
+        sample_dict_list.append(OrderedDict(sample_dict))
 
     return sample_dict_list
-
-
-def get_csv_reader(sample_sheet_file):
-
-    """
-    tries to create a csv.reader object which will be used to
-        parse through the lines in SampleSheet.csv
-    raises an error if:
-            sample_sheet_file is not an existing file
-            sample_sheet_file contains null byte(s)
-
-    arguments:
-            data_dir -- the directory that has SampleSheet.csv in it
-
-    returns a csv.reader object
-    """
-
-    if path.isfile(sample_sheet_file):
-        csv_file = open(sample_sheet_file, "r")
-        # strip any trailing newline characters from the end of the line
-        # including Windows newline characters (\r\n)
-        csv_lines = [x.rstrip('\n') for x in csv_file]
-        csv_lines = [x.rstrip('\r') for x in csv_lines]
-
-        # open and read file in binary then send it to be parsed by csv's reader
-        csv_reader = reader(csv_lines)
-    else:
-        raise exceptions.SampleSheetError("Sample sheet cannot be parsed as a CSV file because it's not a regular file.",
-                                          sample_sheet_file)
-
-    return csv_reader
@@ -1,11 +1,10 @@
 from os import path, walk
-from csv import reader
 from collections import OrderedDict
-from copy import deepcopy
 import logging
 
 import model
 from .. import exceptions
+from ..sample_sheet import read_sample_sheet
 
 
 def build_sequencing_run_from_samples(sample_sheet_file):
@@ -20,7 +19,8 @@ def build_sequencing_run_from_samples(sample_sheet_file):
     logging.debug("Building SequencingRun from parsed data")
 
     # create list of projects and add samples to appropriate project
-    project_list = []
+    # projects are indexed by id so each sample finds its project without searching the list
+    project_dict = OrderedDict()
     for sample_number, sample in enumerate(sample_list):
         # get data from data dict
         sample_name = sample['Sample_Name']
@@ -28,15 +28,12 @@ def build_sequencing_run_from_samples(sample_sheet_file):
         file_f = sample['File_Forward']
         file_r = sample['File_Reverse']
 
-        project = None
         # see if project exists
-        for p in project_list:
-            if project_id == p.id:
-                project = p
+        project = project_dict.get(project_id)
         # create project if it doesn't exitt yet
         if project is None:
             project = model.Project(id=project_id)
-            project_list.append(project)
+            project_dict[project_id] = project
 
         # create sequence file
         if len(file_r) > 0:
@@ -50,11 +47,13 @@ def build_sequencing_run_from_samples(sample_sheet_file):
         sample_obj = model.Sample(sample_name=sample_name, sample_number=sample_number+1)
 
         # add sequence file to sample
-        sample_obj.sequence_file = deepcopy(sq)
+        sample_obj.sequence_file = sq
 
         # add sample to project
         project.add_sample(sample_obj)
 
+    project_list = list(project_dict.values())
+
     # add the layout type to the sequencing run so we know if it is paired or single end
     if project_list[0].sample_list[0].sequence_file.is_paired_end():
         metadata = {'layoutType': 'PAIRED_END'}
@@ -132,7 +131,7 @@ def _parse_samples(sample_sheet_file):
 
     logging.info("Reading data from sample sheet {}".format(sample_sheet_file))
 
-    csv_reader = get_csv_reader(sample_sheet_file)
+    sample_sheet = read_sample_sheet(sample_sheet_file)
     # start with an ordered dictionary so that keys are ordered in the same
     # way that they are inserted.
     sample_dict = OrderedDict()
@@ -141,23 +140,14 @@ def _parse_samples(sample_sheet_file):
     sample_key_list = ['Sample_Name', 'Project_ID', 'File_Forward', 'File_Reverse']
 
     # initilize dictionary keys from first line (data headers/attributes)
-    set_attributes = False
-    for line in csv_reader:
-
-        if set_attributes:
-            for item in line:
-
-                if item in sample_key_list:
-                    key_name = item
-                    sample_dict[key_name] = ""
-
-            break
+    for item in sample_sheet.data_columns:
 
-        if "[Data]" in line:
-            set_attributes = True
+        if item in sample_key_list:
+            key_name = item
+            sample_dict[key_name] = ""
 
-    # fill in values for keys. line is currently below the [Data] headers
-    for sample_number, line in enumerate(csv_reader):
+    # fill in values for keys from the lines below the [Data] headers
+    for sample_number, line in enumerate(sample_sheet.data_rows):
 
         if len(sample_dict.keys()) != len(line):
             """
@@ -169,12 +159,12 @@ def _parse_samples(sample_sheet_file):
             doing a single end run
             """
             if len(sample_dict.keys()) - len(line) == 1:
-                line.append("")
+                line = line + ("",)
             else:
                 raise exceptions.SampleSheetError(
                     ("Your sample sheet is malformed. Expected to find {} "
                      "columns in the [Data] section, but only found {} columns "
-                     "for line {}.".format(len(sample_dict.keys()), len(line), line)),
+                     "for line {}.".format(len(sample_dict.keys()), len(line), list(line))),
                     sample_sheet_file
                 )
 
@@ -192,37 +182,7 @@ def _parse_samples(sample_sheet_file):
 
             sample_dict[key] = value
 
-        sample_dict_list.append(deepcopy(sample_dict))
+        # a shallow copy is enough, the values are strings
+        sample_dict_list.append(OrderedDict(sample_dict))
 
     return sample_dict_list
-
-
-def get_csv_reader(sample_sheet_file):
-
-    """
-    tries to create a csv.reader object which will be used to
-        parse through the lines in SampleSheet.csv
-    raises an error if:
-            sample_sheet_file is not an existing file
-            sample_sheet_file contains null byte(s)
-
-    arguments:
-            data_dir -- the directory that has SampleSheet.csv in it
-
-    returns a csv.reader object
-    """
-
-    if path.isfile(sample_sheet_file):
-        csv_file = open(sample_sheet_file, "r")
-        # strip any trailing newline characters from the end of the line
-        # including Windows newline characters (\r\n)
-        csv_lines = [x.rstrip('\n') for x in csv_file]
-        csv_lines = [x.rstrip('\r') for x in csv_lines]
-
-        # open and read file in binary then send it to be parsed by csv's reader
-        csv_reader = reader(csv_lines)
-    else:
-        raise exceptions.SampleSheetError("Sample sheet cannot be parsed as a CSV file because it's not a regular file.",
-                                          sample_sheet_file)
-
-    return csv_reader
@@ -1,12 +1,16 @@
 import re
 from os import path, walk
-from csv import reader
 from collections import OrderedDict
-from copy import deepcopy
 import logging
 
 import model
 from .. import exceptions
+from ..sample_sheet import read_sample_sheet
+
+# this is the Illumina-defined pattern for naming fastq files, from:
+# http://blog.basespace.illumina.com/2014/08/18/fastq-upload-in-now-available-in-basespace/
+ILLUMINA_FILE_PATTERN = re.compile("^(?P<sample_name>.+)_S(?P<sample_number>\\d+)_L(?P<lane>\\d{3})"
+                                   "_R(?P<read>\\d+)_\\S+\\.fastq.*$")
 
 
 def parse_metadata(sample_sheet_file):
@@ -25,7 +29,7 @@ def parse_metadata(sample_sheet_file):
 
     metadata_dict = {"readLengths": []}
 
-    csv_reader = get_csv_reader(sample_sheet_file)
+    sample_sheet = read_sample_sheet(sample_sheet_file)
 
     metadata_key_translation_dict = {
         'Local Run Manager Analysis Id': 'localrunmanager',
@@ -39,36 +43,19 @@ def parse_metadata(sample_sheet_file):
         'Project Name': 'projectName'
     }
 
-    section = None
-
-    for line in csv_reader:
-        if "[Header]" in line or "[Settings]" in line:
-            section = "header"
-            continue
-        elif "[Reads]" in line:
-            section = "reads"
-            continue
-        elif "[Data]" in line:
-            break
-        elif line and line[0].startswith("["):
-            section = "unknown"
-            continue
+    if any(line and line[0] for line in sample_sheet.preamble):
+        logging.debug("Sample sheet is missing important sections: no sections were found")
+        raise exceptions.SampleSheetError("Sample sheet is missing important sections: no sections were found.",
+                                          sample_sheet_file)
 
-        if not line or not line[0]:
-            continue
+    for key, value in list(sample_sheet.header.items()) + list(sample_sheet.settings.items()):
+        try:
+            key_name = metadata_key_translation_dict[key]
+            metadata_dict[key_name] = value
+        except KeyError:
+            logging.debug("Unexpected key in header: [{}]".format(key))
 
-        if not section:
-            logging.debug("Sample sheet is missing important sections: no sections were found")
-            raise exceptions.SampleSheetError("Sample sheet is missing important sections: no sections were found.",
-                                              sample_sheet_file)
-        elif section is "header":
-            try:
-                key_name = metadata_key_translation_dict[line[0]]
-                metadata_dict[key_name] = line[1]
-            except KeyError:
-                logging.debug("Unexpected key in header: [{}]".format(line[0]))
-        elif section is "reads":
-            metadata_dict["readLengths"].append(line[0])
+    metadata_dict["readLengths"] = sample_sheet.reads
 
     # currently sends just the larger readLengths
     if len(metadata_dict["readLengths"]) > 0:
@@ -99,18 +86,18 @@ def build_sequencing_run_from_samples(sample_sheet_file, metadata):
     logging.debug("Building SequencingRun from parsed data")
 
     # create list of projects and add samples to appropriate project
-    project_list = []
+    # projects are indexed by id so each sample finds its project without searching the list
+    project_dict = OrderedDict()
     for sample in sample_list:
-        project = None
-        for p in project_list:
-            if sample.get('sample_project') == p.id:
-                project = p
+        project_id = sample.get('sample_project')
+        project = project_dict.get(project_id)
         if project is None:
-            project = model.Project(id=sample.get('sample_project'))
-            project_list.append(project)
+            project = model.Project(id=project_id)
+            project_dict[project_id] = project
 
         project.add_sample(sample)
 
+    project_list = list(project_dict.values())
     sequence_run = model.SequencingRun(metadata, project_list)
     logging.debug("SequencingRun built")
     return sequence_run
@@ -130,27 +117,22 @@ def _parse_sample_list(sample_sheet_file):
     data_dir = path.join(partial_data_dir, next(walk(partial_data_dir))[1][0], "Fastq")
     data_dir_file_list = next(walk(data_dir))[2]  # Create a file list of the data directory, only hit the os once
 
+    # Parse every file name once, so each sample can be looked up instead of searching the whole directory
+    file_index = _build_file_index(data_dir_file_list)
+
     for sample in sample_list:
         properties_dict = _parse_out_sequence_file(sample)
-        # this is the Illumina-defined pattern for naming fastq files, from:
-        # http://blog.basespace.illumina.com/2014/08/18/fastq-upload-in-now-available-in-basespace/
-        file_pattern = "{sample_name}_S{sample_number}_L\\d{{3}}_R(\\d+)_\\S+\\.fastq.*$".format(
-            sample_name=re.escape(sample.sample_name), sample_number=sample.sample_number)
-        logging.info("Looking for files with pattern {}".format(file_pattern))
-        regex = re.compile(file_pattern)
-        pf_list = list(filter(regex.search, data_dir_file_list))
-        if not pf_list:
+        sample_files = file_index.get(sample.sample_name, {})
+        pf_entries = sample_files.get(str(sample.sample_number))
+        if not pf_entries:
             # OK. So we didn't find any files using the **correct** file name
             # definition according to Illumina. Let's try again with our deprecated
             # behaviour, where we didn't actually care about the sample number:
-            file_pattern = "{sample_name}_S\\d+_L\\d{{3}}_R(\\d+)_\\S+\\.fastq.*$".format(
-                sample_name=re.escape(sample.sample_name))
-            logging.info("Looking for files with pattern {}".format(file_pattern))
+            logging.info("No files found for sample {} with sample number {}, "
+                         "looking for files with any sample number".format(sample.sample_name, sample.sample_number))
+            pf_entries = [entry for entries in sample_files.values() for entry in entries]
 
-            regex = re.compile(file_pattern)
-            pf_list = list(filter(regex.search, data_dir_file_list))
-
-            if not pf_list:
+            if not pf_entries:
                 # we **still** didn't find anything. It's pretty likely, then that
                 # there aren't any fastq files in the directory that match what
                 # the sample sheet says...
@@ -161,8 +143,9 @@ def _parse_sample_list(sample_sheet_file):
                      "does not generate any FastQ data.").format(
                         sample.sample_name, data_dir))
 
+        pf_list = [file_name for file_name, read in pf_entries]
         # List of files may be invalid if directory searching in has been modified by user
-        if not _validate_pf_list(pf_list):
+        if not _validate_read_list([read for file_name, read in pf_entries]):
             raise exceptions.SequenceFileError(
                 ("The following file list {} found in the directory {} is invalid. "
                  "Please verify the folder containing the sequence files matches the SampleSheet file").format(
@@ -173,11 +156,33 @@ def _parse_sample_list(sample_sheet_file):
             pf_list[i] = path.join(data_dir, pf_list[i])
 
         sq = model.SequenceFile(file_list=pf_list, properties_dict=properties_dict)
-        sample.sequence_file = deepcopy(sq)
+        sample.sequence_file = sq
 
     return sample_list
 
 
+def _build_file_index(file_list):
+    """
+    Parses each file name in file_list with the Illumina-defined pattern for naming fastq files
+    Files that do not follow the pattern are left out
+
+    arguments:
+            file_list -- list of file names in the data directory
+
+    returns:
+            dictionary of sample name -> sample number -> list of (file name, read number),
+            files are kept in the order they appear in file_list
+    """
+    file_index = {}
+    for file_name in file_list:
+        match = ILLUMINA_FILE_PATTERN.match(file_name)
+        if match is None:
+            continue
+        sample_files = file_index.setdefault(match.group("sample_name"), {})
+        sample_files.setdefault(match.group("sample_number"), []).append((file_name, int(match.group("read"))))
+    return file_index
+
+
 def _validate_pf_list(file_list):
     """
     Checks if list of files is valid:
@@ -190,21 +195,35 @@ def _validate_pf_list(file_list):
             True: 2 files in list, where one contains `R1` in the correct position and the other contains `R2`
             False: Number of files <1 or >2, or 2 files do not contain `R1`/`R2` correctly
     """
-    if len(file_list) < 1:  # Invalid
+    read_list = []
+    for file_name in file_list:
+        match = ILLUMINA_FILE_PATTERN.match(file_name)
+        # a file that does not follow the pattern only counts against us when it needs to be paired
+        read_list.append(int(match.group("read")) if match else None)
+    return _validate_read_list(read_list)
+
+
+def _validate_read_list(read_list):
+    """
+    Checks if the read numbers of a group of files are valid:
+
+    arguments:
+            read_list -- list of read numbers (or None when the file name has no read number) of grouped files
+
+    returns:
+            True: 1 file in list
+            True: 2 files in list, where one is read 1 and the other is read 2
+            False: Number of files <1 or >2, or 2 files are not read 1 and read 2
+    """
+    if len(read_list) < 1:  # Invalid
         return False
-    if len(file_list) > 2:  # We should never expect more than 2 files, a forward & backwards read
+    if len(read_list) > 2:  # We should never expect more than 2 files, a forward & backwards read
         return False
-    elif len(file_list) == 1:  # single read, valid
+    elif len(read_list) == 1:  # single read, valid
         return True
     else:
-        try:
-            # check if one file is R1 and other is R2
-            regex_filter = ".*_S\\d+_L\\d{3}_R(\\d+)_\\S+\\.fastq.*$"
-            n1 = int(re.search(regex_filter, file_list[0]).group(1))
-            n2 = int(re.search(regex_filter, file_list[1]).group(1))
-            return (n1 != n2) and (n1 == 1 or n1 == 2) and (n2 == 1 or n2 == 2)
-        except AttributeError:  # Attribute error means the file had invalid text in it
-            return False
+        # check if one file is R1 and other is R2
+        return sorted(read_list, key=str) == [1, 2]
 
 
 def _parse_samples(sample_sheet_file):
@@ -224,7 +243,7 @@ def _parse_samples(sample_sheet_file):
 
     logging.info("Reading data from sample sheet {}".format(sample_sheet_file))
 
-    csv_reader = get_csv_reader(sample_sheet_file)
+    sample_sheet = read_sample_sheet(sample_sheet_file)
     # start with an ordered dictionary so that keys are ordered in the same
     # way that they are inserted.
     sample_dict = OrderedDict()
@@ -239,26 +258,17 @@ def _parse_samples(sample_sheet_file):
     _parse_samples.sample_key_translation_dict = sample_key_translation_dict
 
     # initilize dictionary keys from first line (data headers/attributes)
-    set_attributes = False
-    for line in csv_reader:
-
-        if set_attributes:
-            for item in line:
+    for item in sample_sheet.data_columns:
 
-                if item in sample_key_translation_dict:
-                    key_name = sample_key_translation_dict[item]
-                else:
-                    key_name = item
-
-                sample_dict[key_name] = ""
-
-            break
+        if item in sample_key_translation_dict:
+            key_name = sample_key_translation_dict[item]
+        else:
+            key_name = item
 
-        if "[Data]" in line:
-            set_attributes = True
+        sample_dict[key_name] = ""
 
-    # fill in values for keys. line is currently below the [Data] headers
-    for sample_number, line in enumerate(csv_reader):
+    # fill in values for keys from the lines below the [Data] headers
+    for sample_number, line in enumerate(sample_sheet.data_rows):
 
         if len(sample_dict.keys()) != len(line):
             """
@@ -273,19 +283,19 @@ def _parse_samples(sample_sheet_file):
             (kept this for miniseq for safety)
             """
             if len(sample_dict.keys()) - len(line) == 1:
-                line.append("")
+                line = line + ("",)
             else:
                 raise exceptions.SampleSheetError(
                     ("Your sample sheet is malformed. Expected to find {} "
                      "columns in the [Data] section, but only found {} columns "
-                     "for line {}.".format(len(sample_dict.keys()), len(line), line)),
+                     "for line {}.".format(len(sample_dict.keys()), len(line), list(line))),
                     sample_sheet_file
                 )
 
-        for index, key in enumerate(sample_dict.keys()):
-            sample_dict[key] = line[index].strip()  # assumes values are never empty
-
-        new_sample_dict = deepcopy(sample_dict)
+        # each sample gets its own dict, the values are strings so nothing deeper needs copying
+        # assumes values are never empty
+        new_sample_dict = OrderedDict(
+            (key, line[index].strip()) for index, key in enumerate(sample_dict.keys()))
         new_sample_name = new_sample_dict['sampleName']
 
         sample = model.Sample(
@@ -319,34 +329,3 @@ def _parse_out_sequence_file(sample):
             sequence_file_dict[key] = sample_dict[key]
 
     return sequence_file_dict
-
-
-def get_csv_reader(sample_sheet_file):
-
-    """
-    tries to create a csv.reader object which will be used to
-        parse through the lines in SampleSheet.csv
-    raises an error if:
-            sample_sheet_file is not an existing file
-            sample_sheet_file contains null byte(s)
-
-    arguments:
-            data_dir -- the directory that has SampleSheet.csv in it
-
-    returns a csv.reader object
-    """
-
-    if path.isfile(sample_sheet_file):
-        csv_file = open(sample_sheet_file, "r")
-        # strip any trailing newline characters from the end of the line
-        # including Windows newline characters (\r\n)
-        csv_lines = [x.rstrip('\n') for x in csv_file]
-        csv_lines = [x.rstrip('\r') for x in csv_lines]
-
-        # open and read file in binary then send it to be parsed by csv's reader
-        csv_reader = reader(csv_lines)
-    else:
-        raise exceptions.SampleSheetError("Sample sheet cannot be parsed as a CSV file because it's not a regular file.",
-                                          sample_sheet_file)
-
-    return csv_reader
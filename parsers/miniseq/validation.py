@@ -1,5 +1,7 @@
+from collections import OrderedDict
+
 from .. import exceptions
-from .sample_parser import get_csv_reader
+from ..sample_sheet import read_sample_sheet
 import model
 
 
@@ -17,45 +19,21 @@ def validate_sample_sheet(sample_sheet_file):
     returns ValidationResult object - stores list of string error messages
     """
 
-    csv_reader = get_csv_reader(sample_sheet_file)
+    sample_sheet = read_sample_sheet(sample_sheet_file)
 
     v_res = model.ValidationResult()
 
-    all_data_headers_found = False
-    data_sect_found = False
-    header_sect_found = False
-    reads_sect_found = False
-    check_data_headers = False
+    data_sect_found = sample_sheet.has_section("Data")
+    header_sect_found = sample_sheet.has_section("Header")
+    reads_sect_found = sample_sheet.has_section("Reads")
 
     # status of required data headers
-    found_data_headers = {
-        "Sample_ID": False,
-        "Sample_Name": False,
-        "Sample_Project": False}
-
-    for line in csv_reader:
-
-        if "[Data]" in line:
-            data_sect_found = True
-            check_data_headers = True  # next line contains data headers
-
-        elif "[Header]" in line:
-            header_sect_found = True
-
-        elif "[Reads]" in line:
-            reads_sect_found = True
-
-        elif check_data_headers:
-
-            for data_header in found_data_headers.keys():
-                if data_header in line:
-                    found_data_headers[data_header] = True
-
-            # if all required dataHeaders are found
-            if all(found_data_headers.values()):
-                all_data_headers_found = True
+    found_data_headers = OrderedDict()
+    for data_header in ["Sample_ID", "Sample_Name", "Sample_Project"]:
+        found_data_headers[data_header] = data_header in sample_sheet.data_columns
 
-            check_data_headers = False
+    # if all required dataHeaders are found
+    all_data_headers_found = all(found_data_headers.values())
 
     if not all([header_sect_found, data_sect_found, all_data_headers_found, reads_sect_found]):
 
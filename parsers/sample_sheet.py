@@ -0,0 +1,202 @@
+import logging
+import threading
+from collections import OrderedDict
+from csv import reader, Error as CsvError
+from os import path, stat
+
+from . import exceptions
+
+# number of parsed sample sheets kept in memory
+SAMPLE_SHEET_CACHE_SIZE = 64
+
+_cache_lock = threading.Lock()
+_sample_sheet_cache = OrderedDict()
+
+
+class SampleSheet:
+    """
+    The parsed contents of a sample sheet csv file
+
+    Lines are split into the sections they fall under, e.g. [Header], [Reads], [Settings] and [Data]
+    Lines before the first section are kept as the preamble
+
+    Lines are stored as tuples so a single SampleSheet can be shared by every reader of the file
+    """
+
+    def __init__(self, sample_sheet_file, lines):
+        """
+        :param sample_sheet_file: path to the sample sheet the lines were read from
+        :param lines: iterable of csv lines, each a list of values
+        """
+        self._sample_sheet_file = sample_sheet_file
+        self._lines = tuple(tuple(line) for line in lines)
+
+        preamble = []
+        sections = OrderedDict()
+        section_lines = preamble
+        for line in self._lines:
+            section_name = _get_section_name(line)
+            if section_name is None:
+                section_lines.append(line)
+            else:
+                # a section that appears more than once continues where it left off
+                section_lines = sections.setdefault(section_name, [])
+
+        self._preamble = tuple(preamble)
+        self._sections = OrderedDict((name, tuple(section)) for name, section in sections.items())
+
+    @property
+    def sample_sheet_file(self):
+        return self._sample_sheet_file
+
+    @property
+    def lines(self):
+        """
+        Every line in the file, including section names and blank lines
+        """
+        return self._lines
+
+    @property
+    def preamble(self):
+        """
+        Lines found before the first section
+        """
+        return self._preamble
+
+    @property
+    def section_names(self):
+        return list(self._sections.keys())
+
+    def has_section(self, section_name):
+        return section_name in self._sections
+
+    def get_section(self, section_name):
+        """
+        Returns the lines under a section, blank lines included
+        An empty tuple is returned when the section is not in the file
+
+        :param section_name: name of the section without brackets, e.g. "Header"
+        :return: tuple of lines
+        """
+        return self._sections.get(section_name, ())
+
+    @property
+    def header(self):
+        """
+        key:value pairs under [Header]
+        """
+        return self._get_key_value_section("Header")
+
+    @property
+    def settings(self):
+        """
+        key:value pairs under [Settings]
+        """
+        return self._get_key_value_section("Settings")
+
+    @property
+    def reads(self):
+        """
+        list of read lengths under [Reads]
+        """
+        return [line[0] for line in self.get_section("Reads") if line and line[0]]
+
+    @property
+    def data_columns(self):
+        """
+        The column names on the first line under [Data]
+        """
+        data_section = self.get_section("Data")
+        if not data_section:
+            return ()
+        return data_section[0]
+
+    @property
+    def data_rows(self):
+        """
+        The lines under [Data] after the column names, blank lines are skipped
+        """
+        return tuple(line for line in self.get_section("Data")[1:] if not _is_blank(line))
+
+    def _get_key_value_section(self, section_name):
+        section_dict = OrderedDict()
+        for line in self.get_section(section_name):
+            if not line or not line[0]:
+                continue
+            section_dict[line[0]] = line[1] if len(line) > 1 else ""
+        return section_dict
+
+
+def _get_section_name(line):
+    """
+    Returns the name of the section a line starts, or None if the line is not a section name
+    e.g. ['[Data]', '', ''] -> 'Data'
+    """
+    if not line:
+        return None
+    value = line[0].strip()
+    if value.startswith("[") and value.endswith("]"):
+        return value[1:-1]
+    return None
+
+
+def _is_blank(line):
+    return not any(value.strip() for value in line)
+
+
+def read_sample_sheet(sample_sheet_file):
+    """
+    Returns the parsed SampleSheet for a sample sheet csv file
+    The file is only read again when its modification time or size has changed since it was last parsed
+
+    raises an error if:
+            sample_sheet_file is not an existing file
+            sample_sheet_file cannot be parsed as csv
+
+    arguments:
+            sample_sheet_file -- path to the sample sheet csv file
+
+    returns a SampleSheet object
+    """
+
+    if not path.isfile(sample_sheet_file):
+        raise exceptions.SampleSheetError("Sample sheet cannot be parsed as a CSV file "
+                                          "because it's not a regular file.", sample_sheet_file)
+
+    cache_key = path.abspath(sample_sheet_file)
+    file_stat = stat(sample_sheet_file)
+    file_signature = (file_stat.st_mtime_ns, file_stat.st_size)
+
+    with _cache_lock:
+        cached = _sample_sheet_cache.get(cache_key)
+        if cached is not None and cached[0] == file_signature:
+            _sample_sheet_cache.move_to_end(cache_key)
+            return cached[1]
+
+    logging.debug("Parsing sample sheet {}".format(sample_sheet_file))
+    with open(sample_sheet_file, "r") as csv_file:
+        # strip any trailing newline characters from the end of the line
+        # including Windows newline characters (\r\n)
+        csv_lines = [x.rstrip('\n').rstrip('\r') for x in csv_file]
+
+    try:
+        sample_sheet = SampleSheet(sample_sheet_file, reader(csv_lines))
+    except CsvError as error:
+        raise exceptions.SampleSheetError("Sample sheet cannot be parsed as a CSV file: {}".format(error),
+                                          sample_sheet_file)
+
+    with _cache_lock:
+        _sample_sheet_cache[cache_key] = (file_signature, sample_sheet)
+        _sample_sheet_cache.move_to_end(cache_key)
+        while len(_sample_sheet_cache) > SAMPLE_SHEET_CACHE_SIZE:
+            _sample_sheet_cache.popitem(last=False)
+
+    return sample_sheet
+
+
+def clear_sample_sheet_cache():
+    """
+    Forgets every parsed sample sheet, the next read of each file parses it again
+    """
+    with _cache_lock:
+        _sample_sheet_cache.clear()
@@ -1,2 +1,4 @@
-from .upload_status import get_directory_status, write_directory_status
+from .upload_status import get_directory_status, write_directory_status, write_sample_status, sample_upload_complete, \
+    get_uploaded_file_checksums, initialize_state_store_from_config, get_state_store
+from .state_store import StateStore
 from . import exceptions
@@ -0,0 +1,245 @@
+"""
+This file keeps the upload state of every run in one SQLite database, next to the status file in each run directory
+
+The database has a row for each run directory and for each sample in it, indexed by status and by the time they last
+changed, so the state of thousands of runs can be queried without reading every run directory.
+It is kept in sync by progress.upload_status: each status that is written to a status file is also written to the
+database. Reading a status never writes to it, so runs only appear once the uploader has changed their status.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Field of a sample's progress that is True once it has finished uploading, as in the status file
+COMPLETE_FIELD = "Complete"
+# Seconds to wait for another uploader process that is writing to the database
+BUSY_TIMEOUT = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    directory TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    message TEXT,
+    run_id,
+    irida_instance TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_by_status ON runs (status, updated);
+CREATE INDEX IF NOT EXISTS runs_by_updated ON runs (updated);
+CREATE TABLE IF NOT EXISTS samples (
+    directory TEXT NOT NULL,
+    project_id TEXT NOT NULL,
+    sample_name TEXT NOT NULL,
+    complete INTEGER NOT NULL,
+    progress TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (directory, project_id, sample_name)
+);
+CREATE INDEX IF NOT EXISTS samples_by_complete ON samples (complete, updated);
+"""
+
+# Rows only change (and get a new updated time) when their contents change, so writing a status again that has not
+# changed does not touch the database file
+_UPSERT_RUN = """
+INSERT INTO runs (directory, status, message, run_id, irida_instance, updated) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (directory) DO UPDATE SET
+    status = excluded.status, message = excluded.message, run_id = excluded.run_id,
+    irida_instance = excluded.irida_instance, updated = excluded.updated
+WHERE runs.status IS NOT excluded.status OR runs.message IS NOT excluded.message
+    OR runs.run_id IS NOT excluded.run_id OR runs.irida_instance IS NOT excluded.irida_instance
+"""
+_UPSERT_SAMPLE = """
+INSERT INTO samples (directory, project_id, sample_name, complete, progress, updated) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (directory, project_id, sample_name) DO UPDATE SET
+    complete = excluded.complete, progress = excluded.progress, updated = excluded.updated
+WHERE samples.complete IS NOT excluded.complete OR samples.progress IS NOT excluded.progress
+"""
+
+_RUN_COLUMNS = ("directory", "status", "message", "run_id", "irida_instance", "updated")
+
+
+class StateStore(object):
+    """
+    A SQLite database with the upload state of every run directory, shared by every uploader process that uses
+    the same database file
+
+    Runs are keyed by their absolute directory path. Sample progress is kept as the status file keeps it,
+    {project id: {sample name: {...}}}, with a row per sample.
+    """
+
+    def __init__(self, database_file):
+        """
+        :param database_file: path to the database, it is created (along with its directory) if it does not exist
+        """
+        self._database_file = database_file
+        self._lock = threading.Lock()
+        database_dir = os.path.dirname(os.path.abspath(database_file))
+        if not os.path.isdir(database_dir):
+            os.makedirs(database_dir)
+        # the connection is shared by the upload threads, self._lock makes them use it one at a time
+        self._connection = sqlite3.connect(database_file, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                                           isolation_level=None)
+        with self._lock:
+            # readers do not block the writer, and the other way around (not available on every file system)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(_SCHEMA)
+
+    @property
+    def database_file(self):
+        return self._database_file
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def write_run(self, directory, status, run_id=None, irida_instance=None, sample_status_dict=None, message=None):
+        """
+        Records the state of a run and its samples, replacing what was recorded before
+
+        :param directory: run directory
+        :param status: one of the DirectoryStatus statuses
+        :param run_id: id of the sequencing run on IRIDA, if it has been created
+        :param irida_instance: url of the IRIDA the run is uploaded to
+        :param sample_status_dict: per sample progress as {project id: {sample name: {...}}}, samples that are not
+            in it are removed
+        :param message: optional message, e.g. why the run is invalid
+        :return: None
+        """
+        directory = os.path.abspath(directory)
+        now = time.time()
+        samples = {}
+        for project_id, project_dict in (sample_status_dict or {}).items():
+            for sample_name, sample_dict in project_dict.items():
+                samples[(str(project_id), sample_name)] = sample_dict
+
+        with self._lock, self._transaction() as cursor:
+            cursor.execute(_UPSERT_RUN, (directory, status, message, run_id, irida_instance, now))
+            cursor.execute("SELECT project_id, sample_name FROM samples WHERE directory = ?", (directory,))
+            removed = [key for key in cursor.fetchall() if tuple(key) not in samples]
+            cursor.executemany("DELETE FROM samples WHERE directory = ? AND project_id = ? AND sample_name = ?",
+                               [(directory, project_id, sample_name) for project_id, sample_name in removed])
+            cursor.executemany(_UPSERT_SAMPLE, [
+                (directory, project_id, sample_name, bool(sample_dict.get(COMPLETE_FIELD, False)),
+                 json.dumps(sample_dict, sort_keys=True), now)
+                for (project_id, sample_name), sample_dict in samples.items()])
+
+    def get_run(self, directory):
+        """
+        :param directory: run directory
+        :return: dictionary with the directory, status, message, run_id, irida_instance, the time the run last
+            changed as updated, and its samples as sample_status_dict. None when the run has not been recorded
+        """
+        directory = os.path.abspath(directory)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT {} FROM runs WHERE directory = ?".format(", ".join(_RUN_COLUMNS)), (directory,)).fetchone()
+            if row is None:
+                return None
+            sample_rows = self._connection.execute(
+                "SELECT project_id, sample_name, progress FROM samples WHERE directory = ?", (directory,)).fetchall()
+
+        run = dict(zip(_RUN_COLUMNS, row))
+        run["sample_status_dict"] = {}
+        for project_id, sample_name, sample_progress in sample_rows:
+            run["sample_status_dict"].setdefault(project_id, {})[sample_name] = json.loads(sample_progress)
+        return run
+
+    def find_runs(self, status_list=None, parent_directory=None, updated_since=None):
+        """
+        Finds recorded runs, the least recently changed first
+
+        :param status_list: optional, only runs with one of these statuses
+        :param parent_directory: optional, only runs in this directory or below it
+        :param updated_since: optional, only runs that changed at or after this time (seconds since the epoch)
+        :return: list of dictionaries with the directory, status, message, run_id, irida_instance and updated time
+        """
+        conditions = []
+        parameters = []
+        if status_list is not None:
+            conditions.append("status IN ({})".format(", ".join("?" * len(status_list))))
+            parameters.extend(status_list)
+        if parent_directory is not None:
+            # a range rather than LIKE, so the primary key index is used and no characters need escaping
+            prefix = os.path.join(os.path.abspath(parent_directory), "")
+            conditions.append("directory >= ? AND directory < ?")
+            parameters.extend([prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)])
+        if updated_since is not None:
+            conditions.append("updated >= ?")
+            parameters.append(updated_since)
+
+        query = "SELECT {} FROM runs".format(", ".join(_RUN_COLUMNS))
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY updated"
+        with self._lock:
+            rows = self._connection.execute(query, parameters).fetchall()
+        return [dict(zip(_RUN_COLUMNS, row)) for row in rows]
+
+    def find_samples(self, complete=None, directory=None, updated_since=None):
+        """
+        Finds recorded samples, the least recently changed first
+
+        :param complete: optional, True for only samples that finished uploading, False for only those that did not
+        :param directory: optional, only samples of this run directory
+        :param updated_since: optional, only samples that changed at or after this time (seconds since the epoch)
+        :return: list of dictionaries with the directory, project_id, sample_name, complete and updated time
+        """
+        conditions = []
+        parameters = []
+        if complete is not None:
+            conditions.append("complete = ?")
+            parameters.append(bool(complete))
+        if directory is not None:
+            conditions.append("directory = ?")
+            parameters.append(os.path.abspath(directory))
+        if updated_since is not None:
+            conditions.append("updated >= ?")
+            parameters.append(updated_since)
+
+        query = "SELECT directory, project_id, sample_name, complete, updated FROM samples"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY updated"
+        with self._lock:
+            rows = self._connection.execute(query, parameters).fetchall()
+        return [{"directory": row[0], "project_id": row[1], "sample_name": row[2], "complete": bool(row[3]),
+                 "updated": row[4]} for row in rows]
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Runs statements in one write transaction, committed when the block ends without an error
+        Expects the caller to hold self._lock
+        """
+        cursor = self._connection.cursor()
+        # take the write lock up front, so waiting for another process happens here and not half way through
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            yield cursor
+            cursor.execute("COMMIT")
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.close()
+
+
+def open_state_store(database_file):
+    """
+    Opens the database, the state store never stops an upload: when it can not be opened, None is returned
+    and the status files are used on their own
+
+    :param database_file: path to the database
+    :return: StateStore or None
+    """
+    try:
+        return StateStore(database_file)
+    except (sqlite3.Error, OSError) as e:
+        logging.warning("Could not open the state database {}, only the status files in the run directories "
+                        "are used: {}".format(database_file, e))
+        return None
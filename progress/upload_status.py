@@ -1,14 +1,22 @@
+import hashlib
 import json
+import logging
+import sqlite3
+import threading
 import time
 import os
 
+from appdirs import user_cache_dir
+
 import config
 from model.directory_status import DirectoryStatus
 
 try:
     from . import exceptions
+    from .state_store import open_state_store
 except:
     import exceptions
+    from state_store import open_state_store
 
 
 # Module level Constants
@@ -22,6 +30,50 @@ STATUS_FIELD = "Upload Status"
 DATE_TIME_FIELD = "Date Time"
 RUN_ID_FIELD = "Run ID"
 IRIDA_INSTANCE_FIELD = "IRIDA Instance"
+# Per sample progress, nested as {project id: {sample name: {...}}}
+# A sample is only added once IRIDA has accepted all of its files, so Bytes Sent is the size of a file that was sent
+# in full. Files of a sample are sent in one request, a sample that stopped part way is sent again from the start
+SAMPLES_FIELD = "Samples"
+FILES_FIELD = "Files"
+BYTES_SENT_FIELD = "Bytes Sent"
+MD5_FIELD = "MD5"
+SHA256_FIELD = "SHA-256"
+COMPLETE_FIELD = "Complete"
+
+# Samples finish uploading on several threads, writes to the status file are done one at a time
+_status_file_lock = threading.RLock()
+
+# Optional StateStore every status is also written to, see initialize_state_store_from_config
+_state_store = None
+_state_store_lock = threading.Lock()
+
+
+def initialize_state_store_from_config():
+    """
+    Opens the state database set as `state_database` in the config file, or stops using one when it is not set
+    The current database is kept when the setting has not changed
+
+    :return: the StateStore, or None when there is none
+    """
+    global _state_store
+    database_file = config.read_config_option("state_database", default_value="")
+    if database_file:
+        database_file = os.path.expanduser(database_file)
+
+    with _state_store_lock:
+        if _state_store is not None and _state_store.database_file == database_file:
+            return _state_store
+        if _state_store is not None:
+            _state_store.close()
+        _state_store = open_state_store(database_file) if database_file else None
+        return _state_store
+
+
+def get_state_store():
+    """
+    :return: the StateStore statuses are written to, or None when there is none
+    """
+    return _state_store
 
 
 def get_directory_status(directory, required_file_list):
@@ -56,15 +108,19 @@ def get_directory_status(directory, required_file_list):
 
     # Must check status of upload to determine if upload is completed
     uploader_info_file = os.path.join(directory, STATUS_FILE_NAME)
-    with open(uploader_info_file, "rb") as reader:
-        data = reader.read().decode()
-    info_file = json.loads(data)
+    info_file = None
+    if not os.access(uploader_info_file, os.W_OK):
+        # the status can not be written to a read only status file, it is kept somewhere else
+        info_file = _read_status_elsewhere(directory)
+    if info_file is None:
+        info_file = _read_status_file(uploader_info_file)
     status = info_file[STATUS_FIELD]
     if status in DirectoryStatus.VALID_STATUS_LIST:
         result.status = status
     else:  # the status found in the file is not in the defined list
         raise exceptions.DirectoryError("Invalid Status in status file", directory)
-
+    result.run_id = info_file.get(RUN_ID_FIELD)
+    result.sample_status_dict = info_file.get(SAMPLES_FIELD, {})
     return result
 
 
@@ -74,31 +130,184 @@ def write_directory_status(directory_status, run_id=None):
     Overwrites anything that is in the file
 
     Writes a timestamp to the time of last written
+    The run id and the progress of each sample on the DirectoryStatus object are written along with the status,
+    the whole file is written again each time
+    The status is also written to the state database, when there is one. A read only status file is left as it is,
+    the status is then only kept in the state database, or in a status file for the run in the user's cache directory
 
     :param directory_status: DirectoryStatus object containing status to write to directory
-    :param run_id: optional, when used, the run id will be included in the status file,
-        along with the irida instance the run is uploaded to.
+    :param run_id: optional, when used, the run id will be set on the directory status and included in the status
+        file, along with the irida instance the run is uploaded to.
     :return: None
     """
 
     if not os.access(directory_status.directory, os.W_OK):  # Cannot access upload directory
         raise exceptions.DirectoryError("Cannot access directory", directory_status.directory)
 
-    uploader_info_file = os.path.join(directory_status.directory, STATUS_FILE_NAME)
-    if not os.access(uploader_info_file, os.W_OK):  # Cannot access upload directory
-        uploader_info_file = os.path.join('/tmp/', STATUS_FILE_NAME)
-    if run_id:
-        json_data = {STATUS_FIELD: directory_status.status,
-                     DATE_TIME_FIELD: _get_date_time_field(),
-                     RUN_ID_FIELD: run_id,
-                     IRIDA_INSTANCE_FIELD: config.read_config_option('base_url')}
-    else:
+    with _status_file_lock:
+        if run_id:
+            directory_status.run_id = run_id
+
         json_data = {STATUS_FIELD: directory_status.status,
                      DATE_TIME_FIELD: _get_date_time_field()}
+        if directory_status.run_id:
+            json_data[RUN_ID_FIELD] = directory_status.run_id
+            json_data[IRIDA_INSTANCE_FIELD] = config.read_config_option('base_url')
+        if directory_status.sample_status_dict:
+            json_data[SAMPLES_FIELD] = directory_status.sample_status_dict
+        written_to_state_store = _write_state_store(directory_status, json_data.get(IRIDA_INSTANCE_FIELD))
+
+        uploader_info_file = os.path.join(directory_status.directory, STATUS_FILE_NAME)
+        # an existing status file can be read only even though the directory is not
+        if os.path.exists(uploader_info_file) and not os.access(uploader_info_file, os.W_OK):
+            if written_to_state_store:
+                return
+            uploader_info_file = _get_fallback_status_file(directory_status.directory)
+            logging.warning("Status file in {} is read only, writing the status to {} instead".format(
+                directory_status.directory, uploader_info_file))
+
+        with open(uploader_info_file, "w") as json_file:
+            json.dump(json_data, json_file, indent=4, sort_keys=True)
+            json_file.write("\n")
+
+
+def write_sample_status(directory_status, run_id, project_id, sample, file_checksums=None):
+    """
+    Marks a sample and each of its files as completely uploaded in the status file
+    Called once IRIDA has accepted the sample, progress within a sample is not recorded, so resuming a run skips
+    the samples that finished and sends the others in full
+
+    :param directory_status: DirectoryStatus object of the run the sample is in
+    :param run_id: id of the sequencing run on IRIDA the sample was uploaded to
+    :param project_id: project the sample was uploaded to
+    :param sample: Sample object that finished uploading
+    :param file_checksums: optional, {file name: {"size", "md5", "sha256"}} computed while the files were sent
+    :return: None
+    """
+    if file_checksums is None:
+        file_checksums = {}
+    file_dict = {}
+    for file_name in sample.sequence_file.file_list:
+        checksums = file_checksums.get(file_name)
+        if checksums is None:
+            file_size = sum(os.path.getsize(part) for part in sample.sequence_file.get_file_parts(file_name))
+            file_dict[file_name] = {BYTES_SENT_FIELD: file_size,
+                                    COMPLETE_FIELD: True}
+        else:
+            file_dict[file_name] = {BYTES_SENT_FIELD: checksums["size"],
+                                    MD5_FIELD: checksums["md5"],
+                                    SHA256_FIELD: checksums["sha256"],
+                                    COMPLETE_FIELD: True}
+
+    with _status_file_lock:
+        project_dict = directory_status.sample_status_dict.setdefault(str(project_id), {})
+        project_dict[sample.sample_name] = {COMPLETE_FIELD: True,
+                                            FILES_FIELD: file_dict}
+        write_directory_status(directory_status, run_id=run_id)
+
 
-    with open(uploader_info_file, "w") as json_file:
-        json.dump(json_data, json_file, indent=4, sort_keys=True)
-        json_file.write("\n")
+def sample_upload_complete(directory_status, project_id, sample_name):
+    """
+    Checks the progress on a DirectoryStatus object to see if a sample has already been uploaded
+
+    :param directory_status: DirectoryStatus object of the run the sample is in
+    :param project_id: project the sample is uploaded to
+    :param sample_name: name of the sample to check
+    :return: True if the sample and all of its files finished uploading
+    """
+    sample_dict = directory_status.sample_status_dict.get(str(project_id), {}).get(sample_name, {})
+    return sample_dict.get(COMPLETE_FIELD, False)
+
+
+def get_uploaded_file_checksums(directory_status):
+    """
+    Gets the size and checksums recorded for the files of every sample that finished uploading
+
+    :param directory_status: DirectoryStatus object read from a status file
+    :return: dictionary of (project_id, sample_name) to {file name: {"size", "md5", "sha256"}},
+        md5 and sha256 are None for files uploaded before checksums were recorded
+    """
+    uploaded_files = {}
+    for project_id, project_dict in directory_status.sample_status_dict.items():
+        for sample_name, sample_dict in project_dict.items():
+            if not sample_dict.get(COMPLETE_FIELD, False):
+                continue
+            uploaded_files[(project_id, sample_name)] = {
+                file_name: {"size": file_dict.get(BYTES_SENT_FIELD),
+                            "md5": file_dict.get(MD5_FIELD),
+                            "sha256": file_dict.get(SHA256_FIELD)}
+                for file_name, file_dict in sample_dict.get(FILES_FIELD, {}).items()}
+    return uploaded_files
+
+
+def _read_status_file(status_file):
+    with open(status_file, "rb") as reader:
+        data = reader.read().decode()
+    return json.loads(data)
+
+
+def _get_fallback_status_file(directory):
+    """
+    Returns the file the status of a run with a read only status file is written to when there is no state database
+    Each run directory has its own file, in the user's cache directory
+
+    :param directory: run directory
+    :return: path to the file, its directory is created if it does not exist
+    """
+    status_dir = os.path.join(user_cache_dir("irida-uploader"), "status")
+    if not os.path.isdir(status_dir):
+        os.makedirs(status_dir)
+    directory_hash = hashlib.sha256(os.path.abspath(directory).encode("utf-8")).hexdigest()
+    return os.path.join(status_dir, directory_hash + ".info")
+
+
+def _read_status_elsewhere(directory):
+    """
+    Reads the status of a run with a read only status file, from the state database or else the fallback status file
+
+    :param directory: run directory
+    :return: the status in the same form as a status file, or None when it was not written anywhere else
+    """
+    if _state_store is not None:
+        try:
+            run = _state_store.get_run(directory)
+        except sqlite3.Error as e:
+            logging.warning("Could not read the status of {} from the state database: {}".format(directory, e))
+            run = None
+        if run is not None:
+            info = {STATUS_FIELD: run["status"], SAMPLES_FIELD: run["sample_status_dict"]}
+            if run["run_id"]:
+                info[RUN_ID_FIELD] = run["run_id"]
+                info[IRIDA_INSTANCE_FIELD] = run["irida_instance"]
+            return info
+
+    fallback_status_file = _get_fallback_status_file(directory)
+    if os.path.exists(fallback_status_file):
+        return _read_status_file(fallback_status_file)
+    return None
+
+
+def _write_state_store(directory_status, irida_instance=None):
+    """
+    Writes the status of a run to the state database, when there is one
+    A failure is logged and does not stop the upload, the status file is still written
+
+    :param directory_status: DirectoryStatus to write
+    :param irida_instance: url of the IRIDA the run is uploaded to
+    :return: True when the status was written to the state database
+    """
+    if _state_store is None:
+        return False
+    try:
+        _state_store.write_run(directory_status.directory, directory_status.status, run_id=directory_status.run_id,
+                               irida_instance=irida_instance,
+                               sample_status_dict=directory_status.sample_status_dict,
+                               message=directory_status.message)
+    except sqlite3.Error as e:
+        logging.warning("Could not write the status of {} to the state database: {}".format(
+            directory_status.directory, e))
+        return False
+    return True
 
 
 def _get_date_time_field():
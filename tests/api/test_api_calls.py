@@ -0,0 +1,354 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch, MagicMock, PropertyMock
+from http import HTTPStatus
+
+import requests
+
+import model
+
+from api import ApiCalls
+from api.exceptions import IridaConnectionError, IridaKeyError
+
+
+def _make_response(links=None, resources=None):
+    """
+    Creates a stub response object with a HAL json body
+    """
+    response = MagicMock()
+    response.status_code = HTTPStatus.OK
+    resource = {}
+    if links is not None:
+        resource["links"] = links
+    if resources is not None:
+        resource["resources"] = resources
+    response.json.return_value = {"resource": resource}
+    return response
+
+
+class TestLinkCache(unittest.TestCase):
+    """
+    Tests the hypermedia link cache used by ApiCalls._get_link
+    """
+
+    base_url = "http://irida/api/"
+    projects_url = "http://irida/api/projects"
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+        patcher = patch.object(ApiCalls, "_create_session")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        session_patcher = patch.object(ApiCalls, "_session", new_callable=PropertyMock)
+        self.mock_session_property = session_patcher.start()
+        self.addCleanup(session_patcher.stop)
+        self.mock_session = MagicMock()
+        self.mock_session_property.return_value = self.mock_session
+
+    def _make_api(self, link_cache_ttl=300):
+        return ApiCalls("client", "secret", self.base_url, "user", "password", link_cache_ttl=link_cache_ttl)
+
+    def _projects_response(self):
+        return _make_response(resources=[
+            {"identifier": "1", "links": [{"rel": "project/samples", "href": self.projects_url + "/1/samples"}]},
+            {"identifier": "2", "links": [{"rel": "project/samples", "href": self.projects_url + "/2/samples"}]},
+        ])
+
+    def test_repeat_lookup_uses_cache(self):
+        """
+        Resolving the same link twice should only hit the server for the first lookup
+        """
+        api_instance = self._make_api()
+        self.mock_session.get.return_value = _make_response(
+            links=[{"rel": "projects", "href": self.projects_url}])
+
+        self.assertEqual(api_instance._get_link(self.base_url, "projects"), self.projects_url)
+        calls_after_first_lookup = self.mock_session.get.call_count
+        self.assertEqual(api_instance._get_link(self.base_url, "projects"), self.projects_url)
+
+        self.assertEqual(self.mock_session.get.call_count, calls_after_first_lookup)
+
+    def test_target_dict_lookup(self):
+        """
+        Links found by a target value should be the link of the resource with that value
+        """
+        api_instance = self._make_api()
+        self.mock_session.get.return_value = self._projects_response()
+
+        url = api_instance._get_link(self.projects_url, "project/samples",
+                                     target_dict={"key": "identifier", "value": "2"})
+
+        self.assertEqual(url, self.projects_url + "/2/samples")
+
+    def test_clear_link_cache(self):
+        """
+        Links should be fetched from the server again after the cache is cleared for their source url
+        """
+        api_instance = self._make_api()
+        self.mock_session.get.return_value = self._projects_response()
+        target_dict = {"key": "identifier", "value": "1"}
+
+        api_instance._get_link(self.projects_url, "project/samples", target_dict=target_dict)
+        calls_after_first_lookup = self.mock_session.get.call_count
+        api_instance.clear_link_cache(self.projects_url)
+        api_instance._get_link(self.projects_url, "project/samples", target_dict=target_dict)
+
+        self.assertGreater(self.mock_session.get.call_count, calls_after_first_lookup)
+
+    def test_expired_links_are_fetched_again(self):
+        """
+        Links older than the cache ttl should not be reused
+        """
+        api_instance = self._make_api(link_cache_ttl=-1)
+        self.mock_session.get.return_value = _make_response(
+            links=[{"rel": "projects", "href": self.projects_url}])
+
+        api_instance._get_link(self.base_url, "projects")
+        calls_after_first_lookup = self.mock_session.get.call_count
+        api_instance._get_link(self.base_url, "projects")
+
+        self.assertGreater(self.mock_session.get.call_count, calls_after_first_lookup)
+
+    def test_link_resolved_with_single_get(self):
+        """
+        An uncached link should be resolved by fetching its source url exactly once
+        """
+        api_instance = self._make_api()
+        self.mock_session.get.return_value = self._projects_response()
+
+        api_instance._get_link(self.projects_url, "project/samples",
+                               target_dict={"key": "identifier", "value": "1"})
+
+        self.mock_session.get.assert_called_once_with(self.projects_url)
+        self.assertEqual(api_instance.round_trip_count, 1)
+
+    def test_other_target_value_uses_index(self):
+        """
+        Finding another resource in a listing that was already fetched should not fetch it again
+        """
+        api_instance = self._make_api()
+        self.mock_session.get.return_value = self._projects_response()
+
+        api_instance._get_link(self.projects_url, "project/samples", target_dict={"key": "identifier", "value": "1"})
+        url = api_instance._get_link(self.projects_url, "project/samples",
+                                     target_dict={"key": "identifier", "value": 2})
+
+        self.assertEqual(url, self.projects_url + "/2/samples")
+        self.assertEqual(api_instance.round_trip_count, 1)
+        with self.assertRaises(IridaKeyError):
+            api_instance._get_link(self.projects_url, "project/samples",
+                                   target_dict={"key": "identifier", "value": "3"})
+        self.assertEqual(api_instance.round_trip_count, 1)
+
+    def test_missing_target_key_raises(self):
+        api_instance = self._make_api()
+        self.mock_session.get.return_value = self._projects_response()
+
+        with self.assertRaises(IridaKeyError):
+            api_instance._get_link(self.projects_url, "project/samples", target_dict={"key": "name", "value": "1"})
+
+    def test_error_status_raises(self):
+        """
+        A non OK response while traversing links should raise an IridaConnectionError
+        """
+        api_instance = self._make_api()
+        response = _make_response()
+        response.status_code = HTTPStatus.NOT_FOUND
+        self.mock_session.get.return_value = response
+
+        with self.assertRaises(IridaConnectionError):
+            api_instance._get_link(self.base_url, "projects")
+
+
+class TestSessionToken(unittest.TestCase):
+    """
+    Tests how ApiCalls keeps its access token alive without probing the server
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+        patcher = patch.object(ApiCalls, "_create_session")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.api_instance = ApiCalls("client", "secret", "http://irida/api/", "user", "password")
+        self.api_instance._session_instance = MagicMock()
+        self.api_instance._session_instance.access_token = "old_token"
+
+    def test_session_does_not_probe_server(self):
+        """
+        Getting the session with a valid token should not send any request
+        """
+        self.api_instance._token_expires_at = time.monotonic() + 3600
+
+        session = self.api_instance._session
+
+        self.assertEqual(session, self.api_instance._session_instance)
+        session.options.assert_not_called()
+        session.get.assert_not_called()
+
+    @patch.object(ApiCalls, "_get_oauth_service")
+    @patch.object(ApiCalls, "_get_access_token")
+    def test_token_refreshed_ahead_of_expiry(self, mock_get_access_token, mock_get_oauth_service):
+        """
+        A token that expires within the refresh margin should be replaced before the session is returned
+        """
+        self.api_instance._token_expires_at = time.monotonic() + ApiCalls.TOKEN_REFRESH_MARGIN - 1
+        mock_get_access_token.side_effect = ["new_token"]
+
+        session = self.api_instance._session
+
+        self.assertEqual(session.access_token, "new_token")
+        mock_get_access_token.assert_called_once_with(mock_get_oauth_service.return_value)
+
+    @patch.object(ApiCalls, "_refresh_access_token")
+    def test_unauthorized_request_retried_once(self, mock_refresh_access_token):
+        """
+        A request rejected with 401 should be sent again with a new token
+        """
+        def refresh(rejected_token=None):
+            self.api_instance._session_instance.access_token = "new_token"
+        mock_refresh_access_token.side_effect = refresh
+
+        request = requests.Request("GET", "http://irida/api/projects",
+                                   headers={"Authorization": "Bearer old_token"}).prepare()
+        response = MagicMock()
+        response.status_code = HTTPStatus.UNAUTHORIZED
+        response.request = request
+        retried_response = MagicMock()
+        self.api_instance._session_instance.send.side_effect = [retried_response]
+
+        result = self.api_instance._retry_unauthorized(response, timeout=10)
+
+        self.assertEqual(result, retried_response)
+        mock_refresh_access_token.assert_called_once_with(rejected_token="old_token")
+        sent_request = self.api_instance._session_instance.send.call_args[0][0]
+        self.assertEqual(sent_request.headers["Authorization"], "Bearer new_token")
+        self.assertTrue(sent_request.token_retried)
+
+    @patch.object(ApiCalls, "_refresh_access_token")
+    def test_streamed_upload_not_retried(self, mock_refresh_access_token):
+        """
+        A rejected request with a streamed body can not be sent again
+        """
+        request = MagicMock()
+        request.token_retried = False
+        request.body = iter([b"data"])
+        response = MagicMock()
+        response.status_code = HTTPStatus.UNAUTHORIZED
+        response.request = request
+
+        result = self.api_instance._retry_unauthorized(response)
+
+        self.assertEqual(result, response)
+        mock_refresh_access_token.assert_not_called()
+
+
+class TestExistenceChecks(unittest.TestCase):
+    """
+    Tests ApiCalls.project_exists and ApiCalls.sample_exists
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+        patcher = patch.object(ApiCalls, "_create_session")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.api_instance = ApiCalls("client", "secret", "http://irida/api/", "user", "password")
+
+    @patch.object(ApiCalls, "get_projects")
+    def test_project_exists(self, mock_get_projects):
+        mock_get_projects.return_value = [model.Project(id="1"), model.Project(id="2")]
+
+        self.assertTrue(self.api_instance.project_exists(2))
+        self.assertTrue(self.api_instance.project_exists("1"))
+        self.assertFalse(self.api_instance.project_exists(3))
+
+    @patch.object(ApiCalls, "get_samples")
+    def test_sample_exists_ignores_case(self, mock_get_samples):
+        mock_get_samples.return_value = [model.Sample("Sample1"), model.Sample("sample2")]
+
+        self.assertTrue(self.api_instance.sample_exists("SAMPLE1", 1))
+        self.assertTrue(self.api_instance.sample_exists("sample2", 1))
+        self.assertFalse(self.api_instance.sample_exists("sample3", 1))
+
+    @patch.object(ApiCalls, "get_samples")
+    def test_sample_index_follows_cache(self, mock_get_samples):
+        """
+        The index should be rebuilt when the sample list is fetched again, e.g. after a sample was sent
+        """
+        mock_get_samples.side_effect = [[model.Sample("sample1")],
+                                        [model.Sample("sample1")],
+                                        [model.Sample("sample1"), model.Sample("sample2")]]
+
+        self.assertFalse(self.api_instance.sample_exists("sample2", 1))
+        self.assertTrue(self.api_instance.sample_exists("sample1", 1))
+        self.assertTrue(self.api_instance.sample_exists("sample2", 1))
+
+    def test_send_sample_keeps_other_projects(self):
+        self.api_instance.cached_samples = {1: [model.Sample("sample1")], 2: [model.Sample("sample2")]}
+        self.api_instance.cached_projects = [model.Project(id="1")]
+
+        session = MagicMock()
+        session.post.return_value.status_code = HTTPStatus.CREATED
+        session.post.return_value.text = "{}"
+        with patch.object(ApiCalls, "_get_link", return_value="http://irida/api/projects/1/samples"), \
+                patch.object(ApiCalls, "_session", session):
+            self.api_instance.send_sample(model.Sample("sample3"), 1)
+
+        self.assertNotIn(1, self.api_instance.cached_samples)
+        self.assertIn(2, self.api_instance.cached_samples)
+        self.assertIsNotNone(self.api_instance.cached_projects)
+
+    def test_clear_caches(self):
+        """
+        Projects and samples created on IRIDA after they were listed should be found once the caches are cleared
+        """
+        self.api_instance.cached_samples = {1: [model.Sample("sample1")]}
+        self.api_instance.cached_projects = [model.Project(id="1")]
+        self.api_instance._link_cache.put(("http://irida/api/", "projects", None, None), "http://irida/api/projects")
+
+        self.api_instance.clear_caches()
+
+        self.assertIsNone(self.api_instance.cached_projects)
+        self.assertEqual(self.api_instance.cached_samples, {})
+        self.assertIsNone(self.api_instance._link_cache.get(("http://irida/api/", "projects", None, None)))
+
+    def test_send_sample_while_samples_listed(self):
+        """
+        A sample list fetched by another thread while a sample is being created should not be kept, and looking up
+        samples while the cache is reset should not fail
+        """
+        listing_started = threading.Event()
+        sample_sent = threading.Event()
+        responses = [[], [{"sampleName": "sample1", "description": "", "links": []}]]
+
+        def _get_resource(url):
+            if url.endswith("/samples"):
+                listing_started.set()
+                sample_sent.wait(5)
+                return {"resource": {"resources": responses.pop(0)}}
+            raise AssertionError(url)
+
+        def _post(url, json_obj, **kwargs):
+            sample_sent.set()
+            return MagicMock(status_code=HTTPStatus.CREATED, text="{}")
+
+        session = MagicMock()
+        session.post.side_effect = _post
+        with patch.object(ApiCalls, "_get_link", return_value="http://irida/api/projects/1/samples"), \
+                patch.object(ApiCalls, "_get_resource", side_effect=_get_resource), \
+                patch.object(ApiCalls, "_session", session):
+            lister = threading.Thread(target=self.api_instance.get_samples, args=(1,))
+            lister.start()
+            listing_started.wait(5)
+            self.api_instance.send_sample(model.Sample("sample1"), 1)
+            lister.join()
+
+            self.assertTrue(self.api_instance.sample_exists("sample1", 1))
@@ -0,0 +1,106 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from api.bandwidth_limiter import BandwidthLimiter, parse_schedule
+
+
+class TestParseSchedule(unittest.TestCase):
+    """
+    Tests reading bandwidth schedules from the config
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+    def test_parse(self):
+        self.assertEqual(parse_schedule("08:00-18:00=1000000, 22:30-6:00=0"),
+                         [(480, 1080, 1000000), (1350, 360, 0)])
+        self.assertEqual(parse_schedule(""), [])
+
+    def test_invalid(self):
+        for schedule in ["08:00-18:00", "8-18=100", "25:00-18:00=100", "08:00-18:00=fast"]:
+            with self.assertRaises(ValueError):
+                parse_schedule(schedule)
+
+
+class TestBandwidthLimiter(unittest.TestCase):
+    """
+    Tests limiting the upload rate with BandwidthLimiter
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+        self.now = 1000.0
+        self.sleeps = []
+
+        def sleep(seconds):
+            self.sleeps.append(seconds)
+            self.now += seconds
+
+        patcher = patch("api.bandwidth_limiter.time")
+        mock_time = patcher.start()
+        self.addCleanup(patcher.stop)
+        mock_time.monotonic.side_effect = lambda: self.now
+        mock_time.sleep.side_effect = sleep
+        # 12:00
+        mock_time.localtime.return_value = time.struct_time((2020, 1, 1, 12, 0, 0, 2, 1, 0))
+
+    def test_no_limit(self):
+        limiter = BandwidthLimiter()
+
+        limiter.consume(10 ** 9)
+
+        self.assertEqual(self.sleeps, [])
+
+    def test_rate_limited(self):
+        limiter = BandwidthLimiter(rate=1000, burst_seconds=1.0)
+        self.now += 10
+
+        # the first second worth is the burst, the rest is paced at the rate
+        for _ in range(5):
+            limiter.consume(500)
+
+        self.assertEqual(self.sleeps, [0.5, 0.5, 0.5])
+        self.assertEqual(self.now, 1011.5)
+
+    def test_schedule(self):
+        limiter = BandwidthLimiter(rate=1000, schedule=parse_schedule("11:00-13:00=100, 23:00-01:00=0"))
+        self.assertEqual(limiter.current_rate(), 100)
+
+        limiter.set_limits(rate=1000, schedule=parse_schedule("13:00-11:00=100"))
+        self.assertEqual(limiter.current_rate(), 1000)
+
+        limiter.set_limits(rate=0, schedule=parse_schedule("22:00-13:00=100"))
+        self.assertEqual(limiter.current_rate(), 100)
+
+        limiter.set_limits()
+        self.assertIsNone(limiter.current_rate())
+
+    def test_limits_reloaded_while_uploading(self):
+        limiter = BandwidthLimiter(reload_limits=lambda: limiter.set_limits(rate=1000), reload_seconds=30)
+
+        # not checked again until reload_seconds have passed
+        limiter.consume(1000)
+        self.assertIsNone(limiter.current_rate())
+
+        self.now += 30
+        limiter.consume(1000)
+        self.assertEqual(limiter.current_rate(), 1000)
+        # the burst second went to the previous 1000 bytes
+        limiter.consume(2000)
+        self.assertEqual(self.sleeps, [2.0])
+
+    def test_failed_reload_keeps_limits(self):
+        reload_limits = unittest.mock.MagicMock(side_effect=ValueError("Config file is not valid"))
+        limiter = BandwidthLimiter(rate=1000, reload_limits=reload_limits, reload_seconds=30)
+        self.now += 30
+
+        with self.assertLogs(level="WARNING"):
+            limiter.consume(500)
+
+        self.assertEqual(limiter.current_rate(), 1000)
+        # the next check waits another reload_seconds
+        limiter.consume(500)
+        reload_limits.assert_called_once()
@@ -0,0 +1,227 @@
+import hashlib
+import io
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from api.exceptions import FileError, IridaUploadCanceledException
+from api import multipart_body
+from api.multipart_body import MultipartBody, MIN_CHUNK_SIZE
+
+
+class TestMultipartBody(unittest.TestCase):
+    """
+    Tests the multipart/form-data body used to upload sequence files
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.file_name = os.path.join(self.temp_dir, "sample_R1.fastq")
+        self.contents = os.urandom(10000)
+        with open(self.file_name, "wb") as fastq_file:
+            fastq_file.write(self.contents)
+
+    def _make_body(self, should_stop=None):
+        # 64 KiB chunks, so the 10000 byte test file is read in one chunk
+        body = MultipartBody("B0undary", buffer_memory=4 * MIN_CHUNK_SIZE, should_stop=should_stop)
+        body.add_file("file", self.file_name)
+        body.add_parameters("parameters", '{"miseqRunId": "1"}')
+        body.finish()
+        return body
+
+    def test_body_contents(self):
+        body = self._make_body()
+
+        data = b"".join(bytes(part) for part in body)
+
+        expected = (("\r\n--B0undary\r\nContent-Disposition: form-data; name=\"file\"; "
+                     "filename=\"{}\"\r\n\r\n").format(self.file_name).encode() + self.contents +
+                    b"\r\n--B0undary\r\nContent-Disposition: form-data; name=\"parameters\"\r\n"
+                    b"Content-Type: application/json\r\n\r\n{\"miseqRunId\": \"1\"}\r\n--B0undary--")
+        self.assertEqual(data, expected)
+        self.assertEqual(len(body), len(expected))
+        # the body can be sent again
+        self.assertEqual(b"".join(bytes(part) for part in body), expected)
+        self.assertEqual(body.checksums, {self.file_name: {"size": len(self.contents),
+                                                           "md5": hashlib.md5(self.contents).hexdigest(),
+                                                           "sha256": hashlib.sha256(self.contents).hexdigest()}})
+
+    def test_progress_logged(self):
+        """
+        Progress should be logged, not printed, so concurrent uploads do not share one console line
+        :return:
+        """
+        body = MultipartBody("B0undary", buffer_memory=4 * MIN_CHUNK_SIZE)
+        with open(self.file_name, "wb") as fastq_file:
+            fastq_file.write(os.urandom(3 * MIN_CHUNK_SIZE))
+        body.add_file("file", self.file_name)
+        body.finish()
+
+        with patch("api.multipart_body.PROGRESS_LOG_SECONDS", 0), \
+                patch("sys.stdout", new_callable=io.StringIO) as stdout, \
+                self.assertLogs(level=logging.INFO) as logs:
+            for _ in body:
+                pass
+
+        self.assertEqual(stdout.getvalue(), "")
+        progress_logs = [line for line in logs.output if "Sent " in line]
+        self.assertEqual(len(progress_logs), 3)
+        self.assertIn("Sent {0} of {0} bytes (100.0%)".format(3 * MIN_CHUNK_SIZE), progress_logs[-1])
+
+    def test_request_not_chunked(self):
+        body = self._make_body()
+
+        request = requests.Request("POST", "http://irida/api/", data=body).prepare()
+
+        self.assertEqual(request.headers["Content-Length"], str(len(body)))
+        self.assertNotIn("Transfer-Encoding", request.headers)
+
+    def test_missing_file(self):
+        body = MultipartBody("B0undary")
+
+        with self.assertRaises(FileError):
+            body.add_file("file", os.path.join(self.temp_dir, "missing.fastq"))
+
+    def test_file_changed(self):
+        body = self._make_body()
+        with open(self.file_name, "wb") as fastq_file:
+            fastq_file.write(self.contents[:100])
+
+        with self.assertRaises(FileError):
+            list(body)
+
+    def test_stop_upload(self):
+        stop = []
+        body = self._make_body(should_stop=lambda: bool(stop))
+        parts = iter(body)
+        # the header of the file part
+        next(parts)
+        stop.append(True)
+
+        with self.assertRaises(IridaUploadCanceledException):
+            next(parts)
+
+    def test_file_parts(self):
+        """
+        The parts of a file are sent back to back, as one file
+        """
+        second_part = os.path.join(self.temp_dir, "sample_L002_R1.fastq")
+        second_contents = os.urandom(MIN_CHUNK_SIZE + 100)
+        with open(second_part, "wb") as fastq_file:
+            fastq_file.write(second_contents)
+        body = MultipartBody("B0undary", buffer_memory=4 * MIN_CHUNK_SIZE)
+        body.add_file("file", "sample_R1.fastq", parts=[self.file_name, second_part])
+        body.finish()
+
+        data = b"".join(bytes(part) for part in body)
+
+        expected = (b"\r\n--B0undary\r\nContent-Disposition: form-data; name=\"file\"; "
+                    b"filename=\"sample_R1.fastq\"\r\n\r\n" + self.contents + second_contents + b"--B0undary--")
+        self.assertEqual(data, expected)
+        self.assertEqual(len(body), len(expected))
+        self.assertEqual(body.checksums["sample_R1.fastq"]["sha256"],
+                         hashlib.sha256(self.contents + second_contents).hexdigest())
+
+    def test_missing_file_part(self):
+        body = MultipartBody("B0undary")
+
+        with self.assertRaises(FileError):
+            body.add_file("file", "sample_R1.fastq", parts=[self.file_name, os.path.join(self.temp_dir, "missing")])
+
+    def test_missing_file_while_sending(self):
+        body = self._make_body()
+        os.remove(self.file_name)
+
+        with self.assertRaises(FileError):
+            list(body)
+
+
+class TestReadAhead(unittest.TestCase):
+    """
+    Tests reading files ahead of sending them
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.file_name = os.path.join(self.temp_dir, "sample_R1.fastq")
+        self.contents = os.urandom(5 * MIN_CHUNK_SIZE + 123)
+        with open(self.file_name, "wb") as fastq_file:
+            fastq_file.write(self.contents)
+
+    def test_limited_upload_sent_in_pieces(self):
+        """
+        When the rate is limited, each chunk should be sent in pieces that each wait for the limiter
+        :return:
+        """
+        self.contents = os.urandom(2 * multipart_body.LIMITED_PIECE_SIZE + 1000)
+        with open(self.file_name, "wb") as fastq_file:
+            fastq_file.write(self.contents)
+        limiter = unittest.mock.MagicMock()
+        body = MultipartBody("B0undary", buffer_memory=4 * len(self.contents), bandwidth_limiter=limiter)
+        body.add_file("file", self.file_name)
+        body.finish()
+
+        data = b"".join(bytes(part) for part in body)
+
+        self.assertIn(self.contents, data)
+        consumed = [call.args[0] for call in limiter.consume.call_args_list]
+        self.assertEqual(sum(consumed), len(self.contents))
+        self.assertTrue(all(size <= multipart_body.LIMITED_PIECE_SIZE for size in consumed))
+
+    def test_file_read_in_chunks(self):
+        read_ahead = multipart_body._ReadAhead([self.file_name], len(self.contents), MIN_CHUNK_SIZE)
+
+        chunks = [bytes(chunk) for chunk in read_ahead]
+        read_ahead.close()
+
+        self.assertEqual(b"".join(chunks), self.contents)
+        self.assertEqual(len(chunks), 6)
+        self.assertTrue(all(len(chunk) <= MIN_CHUNK_SIZE for chunk in chunks))
+        self.assertEqual(read_ahead.checksums(), {"size": len(self.contents),
+                                                  "md5": hashlib.md5(self.contents).hexdigest(),
+                                                  "sha256": hashlib.sha256(self.contents).hexdigest()})
+
+    def test_stopped_early(self):
+        read_ahead = multipart_body._ReadAhead([self.file_name], len(self.contents), MIN_CHUNK_SIZE)
+        chunks = iter(read_ahead)
+        next(chunks)
+
+        read_ahead.close()
+
+        self.assertFalse(read_ahead._thread.is_alive())
+
+    def test_chunk_size_follows_slower_side(self):
+        read_ahead = multipart_body._ReadAhead([self.file_name], 100 * 1024 * 1024, 8 * 1024 * 1024)
+        self.assertEqual(read_ahead.chunk_size, multipart_body.INITIAL_CHUNK_SIZE)
+
+        # fast reads, sending at 4 MiB/s should settle on 1 MiB chunks (0.25 seconds)
+        read_ahead._read_rate = 500 * 1024 * 1024
+        read_ahead._send_rate = 4 * 1024 * 1024
+        for _ in range(10):
+            read_ahead._adapt_chunk_size()
+        self.assertEqual(read_ahead.chunk_size, 1024 * 1024)
+
+        # a fast network grows the chunk size a step at a time, up to the memory cap
+        read_ahead._send_rate = 500 * 1024 * 1024
+        read_ahead._adapt_chunk_size()
+        self.assertEqual(read_ahead.chunk_size, 2 * 1024 * 1024)
+        for _ in range(10):
+            read_ahead._adapt_chunk_size()
+        self.assertEqual(read_ahead.chunk_size, 8 * 1024 * 1024)
+
+        # a slow disk shrinks it again, down to the minimum
+        read_ahead._read_rate = 1024
+        for _ in range(20):
+            read_ahead._adapt_chunk_size()
+        self.assertEqual(read_ahead.chunk_size, MIN_CHUNK_SIZE)
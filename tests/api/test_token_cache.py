@@ -0,0 +1,117 @@
+import os
+import shutil
+import stat
+import tempfile
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+from api import ApiCalls, TokenCache
+
+BASE_URL = "http://irida/api/"
+
+
+class TestTokenCache(unittest.TestCase):
+    """
+    Tests storing access tokens on disk with TokenCache
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.cache_file = os.path.join(self.cache_dir, "irida-uploader", "tokens.json")
+        self.token_cache = TokenCache(self.cache_file)
+
+    def test_put_and_get(self):
+        self.token_cache.put(BASE_URL, "client", "user", "token", 3600)
+
+        access_token, expires_in = self.token_cache.get(BASE_URL, "client", "user")
+
+        self.assertEqual(access_token, "token")
+        self.assertTrue(3590 < expires_in <= 3600)
+        # tokens are only shared for the same server, client and user
+        self.assertIsNone(self.token_cache.get(BASE_URL, "client", "other_user"))
+        self.assertIsNone(self.token_cache.get("http://other/api/", "client", "user"))
+
+    def test_cache_file_private(self):
+        self.token_cache.put(BASE_URL, "client", "user", "token", 3600)
+
+        self.assertEqual(stat.S_IMODE(os.stat(self.cache_file).st_mode), 0o600)
+        with open(self.cache_file) as cache_file:
+            contents = cache_file.read()
+        self.assertNotIn("user", contents)
+        self.assertNotIn(BASE_URL, contents)
+
+    def test_expired_token_not_used(self):
+        self.token_cache.put(BASE_URL, "client", "user", "token", 60)
+
+        self.assertIsNone(self.token_cache.get(BASE_URL, "client", "user", min_lifetime=120))
+        with patch("api.token_cache.time.time", return_value=time.time() + 120):
+            self.assertIsNone(self.token_cache.get(BASE_URL, "client", "user"))
+
+    def test_discard_only_rejected_token(self):
+        self.token_cache.put(BASE_URL, "client", "user", "newer_token", 3600)
+
+        self.token_cache.discard(BASE_URL, "client", "user", "old_token")
+        self.assertEqual(self.token_cache.get(BASE_URL, "client", "user")[0], "newer_token")
+
+        self.token_cache.discard(BASE_URL, "client", "user", "newer_token")
+        self.assertIsNone(self.token_cache.get(BASE_URL, "client", "user"))
+
+    def test_invalid_cache_file_ignored(self):
+        os.makedirs(os.path.dirname(self.cache_file))
+        with open(self.cache_file, "w") as cache_file:
+            cache_file.write("not json")
+
+        self.assertIsNone(self.token_cache.get(BASE_URL, "client", "user"))
+        self.token_cache.put(BASE_URL, "client", "user", "token", 3600)
+        self.assertEqual(self.token_cache.get(BASE_URL, "client", "user")[0], "token")
+
+
+class TestApiCallsTokenCache(unittest.TestCase):
+    """
+    Tests that ApiCalls shares its access tokens through a TokenCache
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+        patcher = patch.object(ApiCalls, "_create_session")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.token_cache = MagicMock()
+        self.api_instance = ApiCalls("client", "secret", BASE_URL, "user", "password", token_cache=self.token_cache)
+
+    def test_cached_token_used(self):
+        self.token_cache.get.side_effect = [("cached_token", 3600)]
+        oauth_service = MagicMock()
+
+        access_token = self.api_instance._get_access_token(oauth_service)
+
+        self.assertEqual(access_token, "cached_token")
+        oauth_service.get_raw_access_token.assert_not_called()
+        self.assertTrue(self.api_instance._token_expires_at > time.monotonic() + 3500)
+
+    def test_new_token_cached(self):
+        self.token_cache.get.side_effect = [None]
+        oauth_service = MagicMock()
+        oauth_service.get_raw_access_token.return_value.content = \
+            b"{'access_token': 'new_token', 'expires_in': 3600}"
+
+        access_token = self.api_instance._get_access_token(oauth_service)
+
+        self.assertEqual(access_token, "new_token")
+        self.token_cache.put.assert_called_once_with(BASE_URL, "client", "user", "new_token", 3600)
+
+    @patch.object(ApiCalls, "_get_oauth_service")
+    def test_rejected_token_discarded(self, mock_get_oauth_service):
+        self.token_cache.get.side_effect = [("newer_token", 3600)]
+        self.api_instance._session_instance = MagicMock()
+
+        self.api_instance._refresh_access_token(rejected_token="old_token")
+
+        self.token_cache.discard.assert_called_once_with(BASE_URL, "client", "user", "old_token")
+        self.assertEqual(self.api_instance._session_instance.access_token, "newer_token")
@@ -71,6 +71,9 @@ class TestConfig(unittest.TestCase):
         self.assertEqual(config.read_config_option('password'), 'password1')
         self.assertEqual(config.read_config_option('base_url'), 'http://localhost:8080/irida-latest/api/')
         self.assertEqual(config.read_config_option('parser'), 'miseq')
+        # defaults are returned for options the file does not have, even when they are falsy
+        self.assertEqual(config.read_config_option('upload_bandwidth_limit', expected_type=int, default_value=0), 0)
+        self.assertEqual(config.read_config_option('upload_bandwidth_schedule', default_value=""), "")
 
     @patch("config.config.user_config_dir")
     def test_write_config_option(self, mock_user_config_dir):
@@ -88,3 +91,28 @@ class TestConfig(unittest.TestCase):
         config.write_config_option('client_id', "new_id")
 
         self.assertEqual(config.read_config_option('client_id'), "new_id")
+
+    @patch("config.config.user_config_dir")
+    def test_reload_if_changed(self, mock_user_config_dir):
+        """
+        Makes sure the config file is read again once it has been changed, and only then
+        :param mock_user_config_dir:
+        :return:
+        """
+        mock_user_config_dir.side_effect = [test_config_file_dir]
+        config.setup()
+        config_file = os.path.join(test_config_file_dir, "config.conf")
+
+        self.assertFalse(config.reload_if_changed())
+
+        with open(config_file, "r") as conf:
+            settings = conf.read()
+        with open(config_file, "w") as conf:
+            conf.write(settings.replace("upload_bandwidth_limit = 0", "upload_bandwidth_limit = 1000"))
+        # make sure the modification time changes, even on file systems with coarse timestamps
+        stat = os.stat(config_file)
+        os.utime(config_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        self.assertTrue(config.reload_if_changed())
+        self.assertEqual(config.read_config_option("upload_bandwidth_limit", expected_type=int), 1000)
+        self.assertFalse(config.reload_if_changed())
@@ -1,11 +1,19 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
-from unittest.mock import patch
+from unittest.mock import patch, ANY
 from os import path
 
+import config
+import global_settings
+import model
 from core import api_handler
 
 from parsers.miseq.parser import Parser
-from api.exceptions import IridaResourceError
+from api.exceptions import IridaResourceError, IridaUploadCanceledException, FileError
 from model.exceptions import ModelValidationError
 
 path_to_module = path.abspath(path.dirname(__file__))
@@ -142,6 +150,40 @@ class TestPrepareAndValidateForUpload(unittest.TestCase):
         self.assertEqual(res.error_count(), 1)
         self.assertEqual(type(res.error_list[0]), IridaResourceError)
 
+    @patch("core.api_handler._get_api_instance")
+    def test_many_projects_and_new_samples(self, mock_api_instance):
+        """
+        Makes sure every project is checked and every missing sample is created and verified,
+            with errors collected in sample order
+        :return:
+        """
+        projects = [model.Project(id=str(project_id), sample_list=[
+            model.Sample("sample-{}-{}".format(project_id, i)) for i in range(5)]) for project_id in range(4)]
+        run = model.SequencingRun({"layoutType": "PAIRED_END"}, projects)
+
+        stub_api_instance = unittest.mock.MagicMock()
+        stub_api_instance.project_exists.side_effect = lambda project_id: project_id != "2"
+        sent_samples = set()
+        # samples ending in 0 and 1 exist, samples ending in 4 can not be created
+        existing_samples = {"sample-{}-{}".format(p, i) for p in range(4) for i in (0, 1)}
+
+        def send_sample(sample, project_id):
+            if sample.sample_name.endswith("4"):
+                raise IridaResourceError("BOOM", sample.sample_name)
+            sent_samples.add(sample.sample_name)
+
+        stub_api_instance.sample_exists.side_effect = lambda sample_name, project_id: \
+            sample_name in existing_samples or sample_name in sent_samples
+        stub_api_instance.send_sample.side_effect = send_sample
+        mock_api_instance.side_effect = [stub_api_instance]
+
+        res = api_handler.prepare_and_validate_for_upload(run)
+
+        self.assertEqual(stub_api_instance.project_exists.call_count, 4)
+        self.assertEqual(stub_api_instance.send_sample.call_count, 9)
+        self.assertEqual(sent_samples, {"sample-{}-{}".format(p, i) for p in (0, 1, 3) for i in (2, 3)})
+        self.assertEqual([e.args[-1] for e in res.error_list], ["2", "sample-0-4", "sample-1-4", "sample-3-4"])
+
 
 class TestUploadSequencingRun(unittest.TestCase):
     """
@@ -190,9 +232,12 @@ class TestUploadSequencingRun(unittest.TestCase):
         stub_api_instance.create_seq_run.assert_called_once_with(sequencing_run.metadata)
         stub_api_instance.set_seq_run_uploading.assert_called_once_with(mock_sequence_run_id)
         stub_api_instance.send_sequence_files.assert_has_calls([
-            unittest.mock.call(project_id='6', sample_name='01-1111', sequence_file='mock_sample', upload_id=55),
-            unittest.mock.call(project_id='6', sample_name='02-2222', sequence_file='mock_sample', upload_id=55),
-            unittest.mock.call(project_id='6', sample_name='03-3333', sequence_file='mock_sample', upload_id=55)
+            unittest.mock.call(project_id='6', sample_name='01-1111', sequence_file='mock_sample', upload_id=55,
+                               checksums={}, should_stop=ANY),
+            unittest.mock.call(project_id='6', sample_name='02-2222', sequence_file='mock_sample', upload_id=55,
+                               checksums={}, should_stop=ANY),
+            unittest.mock.call(project_id='6', sample_name='03-3333', sequence_file='mock_sample', upload_id=55,
+                               checksums={}, should_stop=ANY)
         ])
         stub_api_instance.set_seq_run_complete.assert_called_once_with(mock_sequence_run_id)
 
@@ -226,6 +271,297 @@ class TestUploadSequencingRun(unittest.TestCase):
         stub_api_instance.set_seq_run_uploading.assert_called_once_with(mock_sequence_run_id)
         stub_api_instance.set_seq_run_error.assert_called_once_with(mock_sequence_run_id)
 
+    @patch("core.api_handler._max_concurrent_uploads", 3)
+    @patch("core.api_handler._get_api_instance")
+    def test_valid_concurrent_upload(self, mock_api_instance):
+        """
+        Makes sure every sample is uploaded and the run is completed when uploading with several workers
+        :return:
+        """
+        global sequencing_run
+
+        for samp in sequencing_run.project_list[0].sample_list:
+            samp.sequence_file = "mock_sample"
+
+        mock_sequence_run_id = 55
+
+        stub_api_instance = unittest.mock.MagicMock()
+        stub_api_instance.create_seq_run.side_effect = [mock_sequence_run_id]
+        stub_api_instance.send_sequence_files.return_value = True
+
+        mock_api_instance.side_effect = [stub_api_instance]
+
+        api_handler.upload_sequencing_run(sequencing_run)
+
+        stub_api_instance.send_sequence_files.assert_has_calls([
+            unittest.mock.call(project_id='6', sample_name='01-1111', sequence_file='mock_sample', upload_id=55,
+                               checksums={}, should_stop=ANY),
+            unittest.mock.call(project_id='6', sample_name='02-2222', sequence_file='mock_sample', upload_id=55,
+                               checksums={}, should_stop=ANY),
+            unittest.mock.call(project_id='6', sample_name='03-3333', sequence_file='mock_sample', upload_id=55,
+                               checksums={}, should_stop=ANY)
+        ], any_order=True)
+        stub_api_instance.set_seq_run_complete.assert_called_once_with(mock_sequence_run_id)
+        stub_api_instance.set_seq_run_error.assert_not_called()
+
+    @patch("core.api_handler._get_api_instance")
+    def test_invalid_sample_upload_stops_remaining_samples(self, mock_api_instance):
+        """
+        Makes sure samples that have not started are not uploaded after a sample fails,
+            and the run is set to error instead of complete
+        :return:
+        """
+        global sequencing_run
+
+        for samp in sequencing_run.project_list[0].sample_list:
+            samp.sequence_file = "mock_sample"
+
+        mock_sequence_run_id = 55
+
+        stub_api_instance = unittest.mock.MagicMock()
+        stub_api_instance.create_seq_run.side_effect = [mock_sequence_run_id]
+        stub_api_instance.send_sequence_files.side_effect = FileError("Boom")
+
+        mock_api_instance.side_effect = [stub_api_instance]
+
+        with self.assertRaises(FileError):
+            api_handler.upload_sequencing_run(sequencing_run)
+
+        stub_api_instance.send_sequence_files.assert_called_once_with(
+            project_id='6', sample_name='01-1111', sequence_file='mock_sample', upload_id=55,
+            checksums={}, should_stop=ANY)
+        stub_api_instance.set_seq_run_error.assert_called_once_with(mock_sequence_run_id)
+        stub_api_instance.set_seq_run_complete.assert_not_called()
+
+    @patch("core.api_handler._max_concurrent_uploads", 2)
+    @patch("core.api_handler._get_api_instance")
+    def test_invalid_sample_upload_stops_uploads_in_progress(self, mock_api_instance):
+        """
+        Makes sure an upload in progress is stopped when another sample fails,
+            and the error of the failed sample is raised rather than the cancellation
+        :return:
+        """
+        global sequencing_run
+
+        for samp in sequencing_run.project_list[0].sample_list:
+            samp.sequence_file = "mock_sample"
+
+        first_upload_started = threading.Event()
+
+        def _send_sequence_files(sample_name, should_stop, **kwargs):
+            if sample_name == '01-1111':
+                first_upload_started.set()
+                deadline = time.monotonic() + 5
+                while not should_stop() and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                raise IridaUploadCanceledException("Upload halted on user request.")
+            first_upload_started.wait(5)
+            raise FileError("Boom")
+
+        stub_api_instance = unittest.mock.MagicMock()
+        stub_api_instance.create_seq_run.side_effect = [55]
+        stub_api_instance.send_sequence_files.side_effect = _send_sequence_files
+
+        mock_api_instance.side_effect = [stub_api_instance]
+
+        with self.assertRaises(FileError):
+            api_handler.upload_sequencing_run(sequencing_run)
+
+        self.assertEqual(stub_api_instance.send_sequence_files.call_count, 2)
+        stub_api_instance.set_seq_run_error.assert_called_once_with(55)
+        stub_api_instance.set_seq_run_complete.assert_not_called()
+
+    @patch("core.api_handler._get_api_instance")
+    def test_valid_resume_existing_run(self, mock_api_instance):
+        """
+        Makes sure no new sequencing run is created when uploading to an existing run id,
+            and that each finished sample is reported
+        :return:
+        """
+        global sequencing_run
+
+        for samp in sequencing_run.project_list[0].sample_list:
+            samp.sequence_file = "mock_sample"
+
+        stub_api_instance = unittest.mock.MagicMock()
+        mock_api_instance.side_effect = [stub_api_instance]
+        on_run_created = unittest.mock.MagicMock()
+        on_sample_uploaded = unittest.mock.MagicMock()
+
+        run_id = api_handler.upload_sequencing_run(sequencing_run, run_id=55, on_run_created=on_run_created,
+                                                   on_sample_uploaded=on_sample_uploaded)
+
+        self.assertEqual(run_id, 55)
+        stub_api_instance.create_seq_run.assert_not_called()
+        on_run_created.assert_not_called()
+        stub_api_instance.set_seq_run_uploading.assert_called_once_with(55)
+        self.assertEqual(on_sample_uploaded.call_count, 3)
+        on_sample_uploaded.assert_any_call(55, '6', sequencing_run.project_list[0].sample_list[0], {})
+        stub_api_instance.set_seq_run_complete.assert_called_once_with(55)
+
+
+class TestSampleUploadPool(unittest.TestCase):
+    """
+    Tests the core.api_handler._SampleUploadPool class
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+    @patch("core.api_handler._max_concurrent_uploads", 2)
+    def test_runs_share_upload_streams(self):
+        """
+        Makes sure runs uploaded at the same time together send no more than max_concurrent_uploads samples at once
+        :return:
+        """
+        lock = threading.Lock()
+        uploading = [0]
+        most_uploading = [0]
+
+        def _send_sequence_files(**kwargs):
+            with lock:
+                uploading[0] += 1
+                most_uploading[0] = max(most_uploading[0], uploading[0])
+            time.sleep(0.05)
+            with lock:
+                uploading[0] -= 1
+
+        stub_api_instance = unittest.mock.MagicMock()
+        stub_api_instance.send_sequence_files.side_effect = _send_sequence_files
+
+        pools = [api_handler._SampleUploadPool(stub_api_instance, run_id) for run_id in (1, 2)]
+        for pool in pools:
+            for sample_name in ("a", "b", "c"):
+                pool.submit(model.Sample(sample_name), "1")
+        outcomes = [pool.finish() for pool in pools]
+
+        self.assertEqual(stub_api_instance.send_sequence_files.call_count, 6)
+        self.assertEqual(most_uploading[0], 2)
+        for outcome in outcomes:
+            self.assertEqual(set(outcome.values()), {api_handler.SAMPLE_UPLOAD_COMPLETE})
+
+
+class TestPrepareAndUploadSequencingRun(unittest.TestCase):
+    """
+    Tests the core.api_handler.prepare_and_upload_sequencing_run function
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+    @staticmethod
+    def _make_run(project_count, sample_count):
+        projects = [model.Project(id=str(project_id), sample_list=[
+            model.Sample("sample-{}-{}".format(project_id, i)) for i in range(sample_count)])
+            for project_id in range(project_count)]
+        return model.SequencingRun({"layoutType": "PAIRED_END"}, projects)
+
+    @patch("core.api_handler._max_concurrent_uploads", 2)
+    @patch("core.api_handler._get_api_instance")
+    def test_valid_samples_uploaded_as_prepared(self, mock_api_instance):
+        """
+        Makes sure existing and created samples are all uploaded and the run is completed
+        :return:
+        """
+        run = self._make_run(2, 3)
+        created_samples = set()
+
+        stub_api_instance = unittest.mock.MagicMock()
+        stub_api_instance.create_seq_run.side_effect = [55]
+        stub_api_instance.project_exists.return_value = True
+        # the first sample of each project has to be created
+        stub_api_instance.sample_exists.side_effect = lambda sample_name, project_id: \
+            not sample_name.endswith("-0") or sample_name in created_samples
+        stub_api_instance.send_sample.side_effect = lambda sample, project_id: created_samples.add(sample.sample_name)
+        mock_api_instance.side_effect = [stub_api_instance]
+        uploaded_samples = []
+
+        run_id, res = api_handler.prepare_and_upload_sequencing_run(
+            run, on_sample_uploaded=lambda upload_run_id, project_id, sample, checksums: uploaded_samples.append(
+                sample.sample_name))
+
+        self.assertEqual(run_id, 55)
+        self.assertTrue(res.is_valid())
+        self.assertEqual(created_samples, {"sample-0-0", "sample-1-0"})
+        self.assertEqual(sorted(uploaded_samples), sorted(s.sample_name for p in run.project_list
+                                                          for s in p.sample_list))
+        stub_api_instance.set_seq_run_uploading.assert_called_once_with(55)
+        stub_api_instance.set_seq_run_complete.assert_called_once_with(55)
+        stub_api_instance.set_seq_run_error.assert_not_called()
+
+    @patch("core.api_handler._get_api_instance")
+    def test_created_samples_verified_together(self, mock_api_instance):
+        """
+        Makes sure created samples are verified once all of them have been sent, so the samples of a project are
+        not listed again after every sample that is created
+        :return:
+        """
+        run = self._make_run(1, 4)
+        calls = []
+
+        stub_api_instance = unittest.mock.MagicMock()
+        stub_api_instance.create_seq_run.side_effect = [55]
+        stub_api_instance.project_exists.return_value = True
+        stub_api_instance.sample_exists.side_effect = lambda sample_name, project_id: \
+            calls.append(("exists", sample_name)) or ("send", sample_name) in calls
+        stub_api_instance.send_sample.side_effect = lambda sample, project_id: \
+            calls.append(("send", sample.sample_name))
+        mock_api_instance.side_effect = [stub_api_instance]
+
+        run_id, res = api_handler.prepare_and_upload_sequencing_run(run)
+
+        self.assertTrue(res.is_valid())
+        verify_calls = calls[[call[0] for call in calls].index("send"):]
+        self.assertEqual([call[0] for call in verify_calls], ["send"] * 4 + ["exists"] * 4)
+        self.assertEqual(stub_api_instance.send_sequence_files.call_count, 4)
+
+    @patch("core.api_handler._get_api_instance")
+    def test_invalid_project_sets_run_error(self, mock_api_instance):
+        """
+        Makes sure the run is set to error instead of complete when a project does not exist
+        :return:
+        """
+        run = self._make_run(2, 2)
+
+        stub_api_instance = unittest.mock.MagicMock()
+        stub_api_instance.create_seq_run.side_effect = [55]
+        stub_api_instance.project_exists.side_effect = lambda project_id: project_id == "0"
+        stub_api_instance.sample_exists.return_value = True
+        mock_api_instance.side_effect = [stub_api_instance]
+
+        run_id, res = api_handler.prepare_and_upload_sequencing_run(run, run_id=42)
+
+        self.assertEqual(run_id, 42)
+        self.assertFalse(res.is_valid())
+        self.assertEqual(res.error_count(), 1)
+        self.assertEqual(type(res.error_list[0]), IridaResourceError)
+        stub_api_instance.create_seq_run.assert_not_called()
+        for call in stub_api_instance.send_sequence_files.call_args_list:
+            self.assertEqual(call[1]["project_id"], "0")
+        stub_api_instance.set_seq_run_error.assert_called_once_with(42)
+        stub_api_instance.set_seq_run_complete.assert_not_called()
+
+    @patch("core.api_handler._get_api_instance")
+    def test_invalid_upload_error_raised(self, mock_api_instance):
+        """
+        Makes sure an upload that fails while samples are being prepared sets the run to error
+        :return:
+        """
+        run = self._make_run(1, 3)
+
+        stub_api_instance = unittest.mock.MagicMock()
+        stub_api_instance.create_seq_run.side_effect = [55]
+        stub_api_instance.project_exists.return_value = True
+        stub_api_instance.sample_exists.return_value = True
+        stub_api_instance.send_sequence_files.side_effect = FileError("Boom")
+        mock_api_instance.side_effect = [stub_api_instance]
+
+        with self.assertRaises(FileError):
+            api_handler.prepare_and_upload_sequencing_run(run)
+
+        stub_api_instance.set_seq_run_error.assert_called_once_with(55)
+        stub_api_instance.set_seq_run_complete.assert_not_called()
+
 
 class TestSendProject(unittest.TestCase):
     """
@@ -301,3 +637,254 @@ class TestSendProject(unittest.TestCase):
 
         with self.assertRaises(IridaResourceError):
             api_handler.send_project(mock_project)
+
+
+class TestInitializeApiFromConfig(unittest.TestCase):
+    """
+    Tests that core.api_handler keeps one api instance per process
+    """
+
+    settings = {
+        "client_id": "client",
+        "client_secret": "secret",
+        "base_url": "http://irida/api/",
+        "username": "user",
+        "password": "password",
+        "max_concurrent_uploads": 1,
+        "cache_access_token": False,
+        "upload_buffer_mb": 16,
+        "upload_bandwidth_limit": 0,
+        "upload_bandwidth_schedule": "",
+    }
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+        patcher = patch("core.api_handler.config.read_config_option", side_effect=self.read_config_option)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.config_settings = dict(self.settings)
+
+        api_handler._api_instance = None
+        api_handler._api_settings = None
+        self.addCleanup(setattr, api_handler, "_api_instance", None)
+        self.addCleanup(setattr, api_handler, "_api_settings", None)
+
+    def read_config_option(self, key, expected_type=None, default_value=None):
+        return self.config_settings[key]
+
+    @patch("core.api_handler.api.ApiCalls")
+    def test_instance_reused(self, mock_api_calls):
+        mock_api_calls.side_effect = [unittest.mock.MagicMock()]
+
+        api_instance = api_handler.get_api_instance()
+
+        self.assertEqual(api_handler.initialize_api_from_config(), api_instance)
+        self.assertEqual(api_handler.get_api_instance(), api_instance)
+        self.assertEqual(api_handler._get_api_instance(), api_instance)
+        # initializing again starts a new run, which should not see listings cached by the run before
+        api_instance.clear_caches.assert_called_once_with()
+        mock_api_calls.assert_called_once_with("client", "secret", "http://irida/api/", "user", "password", 20,
+                                               token_cache=None, upload_buffer_memory=16 * 1024 * 1024,
+                                               bandwidth_limiter=api_handler._bandwidth_limiter)
+
+    @patch("core.api_handler.api.ApiCalls")
+    def test_config_change_creates_new_instance(self, mock_api_calls):
+        first_instance = unittest.mock.MagicMock()
+        second_instance = unittest.mock.MagicMock()
+        mock_api_calls.side_effect = [first_instance, second_instance]
+
+        self.assertEqual(api_handler.initialize_api_from_config(), first_instance)
+        self.config_settings["base_url"] = "http://other/api/"
+
+        self.assertEqual(api_handler.initialize_api_from_config(), second_instance)
+        self.assertEqual(api_handler.get_api_instance(), second_instance)
+
+    @patch("core.api_handler._bandwidth_limiter")
+    @patch("core.api_handler.api.ApiCalls")
+    def test_bandwidth_limits_updated(self, mock_api_calls, mock_bandwidth_limiter):
+        """
+        The bandwidth limits should follow the config, even when the api instance is reused
+        :return:
+        """
+        mock_api_calls.side_effect = [unittest.mock.MagicMock()]
+
+        api_handler.initialize_api_from_config()
+        mock_bandwidth_limiter.set_limits.assert_called_with(0, [])
+
+        self.config_settings["upload_bandwidth_limit"] = 1000
+        self.config_settings["upload_bandwidth_schedule"] = "08:00-18:00=500"
+        api_handler.initialize_api_from_config()
+        mock_bandwidth_limiter.set_limits.assert_called_with(1000, [(480, 1080, 500)])
+
+        # an invalid schedule is ignored
+        self.config_settings["upload_bandwidth_schedule"] = "working hours"
+        api_handler.initialize_api_from_config()
+        mock_bandwidth_limiter.set_limits.assert_called_with(1000, [])
+        mock_api_calls.assert_called_once()
+
+
+class TestBandwidthLimitsFromConfigFile(unittest.TestCase):
+    """
+    Tests that changes to the bandwidth limits in the config file apply to the next upload, without a restart
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+        self.temp_dir = tempfile.mkdtemp()
+        self.config_file = path.join(self.temp_dir, "config.conf")
+        self.config_mtime = time.time_ns() - 10 ** 10
+        self._write_config("upload_bandwidth_limit = 0\nupload_bandwidth_schedule = \n")
+
+        global_settings.config_file = self.config_file
+        config.setup()
+
+        api_handler._api_instance = None
+        api_handler._api_settings = None
+        self.addCleanup(setattr, api_handler, "_api_instance", None)
+        self.addCleanup(setattr, api_handler, "_api_settings", None)
+
+    def tearDown(self):
+        config.config.conf_parser = None
+        config.config.user_config_file = None
+        global_settings.config_file = None
+        shutil.rmtree(self.temp_dir)
+
+    def _write_config(self, bandwidth_settings):
+        with open(self.config_file, "w") as config_file:
+            config_file.write("[Settings]\nbase_url = http://irida/api/\ncache_access_token = False\n" +
+                              bandwidth_settings)
+        # every write gets a later modification time, even on file systems with coarse timestamps
+        self.config_mtime += 10 ** 9
+        os.utime(self.config_file, ns=(self.config_mtime, self.config_mtime))
+
+    @patch("core.api_handler._bandwidth_limiter")
+    @patch("core.api_handler.api.ApiCalls")
+    def test_config_file_edited_between_uploads(self, mock_api_calls, mock_bandwidth_limiter):
+        mock_api_calls.side_effect = [unittest.mock.MagicMock()]
+
+        # each upload initializes the api from the config
+        api_handler.initialize_api_from_config()
+        mock_bandwidth_limiter.set_limits.assert_called_with(0, [])
+
+        self._write_config("upload_bandwidth_limit = 1000\nupload_bandwidth_schedule = 08:00-18:00=500\n")
+        api_handler.initialize_api_from_config()
+        mock_bandwidth_limiter.set_limits.assert_called_with(1000, [(480, 1080, 500)])
+        mock_api_calls.assert_called_once()
+
+    @patch("core.api_handler._bandwidth_limiter")
+    def test_config_file_edited_during_upload(self, mock_bandwidth_limiter):
+        """
+        The limiter checks the config file while files upload, the limits are only set again when it changed
+        :return:
+        """
+        api_handler._reload_bandwidth_limits()
+        mock_bandwidth_limiter.set_limits.assert_not_called()
+
+        self._write_config("upload_bandwidth_limit = 1000\nupload_bandwidth_schedule = \n")
+        api_handler._reload_bandwidth_limits()
+        mock_bandwidth_limiter.set_limits.assert_called_once_with(1000, [])
+
+
+class TestGetUploadedFiles(unittest.TestCase):
+    """
+    Tests the core.api_handler.get_uploaded_files function
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+    @patch("core.api_handler.get_api_instance")
+    def test_projects_listed_once(self, mock_api_instance):
+        """
+        Each project should be listed once, and sequence files only fetched for samples that exist
+        :return:
+        """
+        stub_api_instance = unittest.mock.MagicMock()
+        existing_sample = unittest.mock.MagicMock()
+        existing_sample.sample_name = "sample1"
+        stub_api_instance.get_samples.side_effect = lambda project_id: [existing_sample] if project_id == 1 else []
+        stub_api_instance.get_sequence_files.side_effect = [[{"fileName": "sample1_R1.fastq"},
+                                                             {"fileName": "sample1_R2.fastq"}]]
+        mock_api_instance.side_effect = [stub_api_instance]
+
+        uploaded_files = api_handler.get_uploaded_files([(1, "sample1"), (1, "sample2"), (1, "sample1"),
+                                                         (2, "sample3")])
+
+        self.assertEqual(uploaded_files, {(1, "sample1", "sample1_R1.fastq"), (1, "sample1", "sample1_R2.fastq")})
+        self.assertEqual(stub_api_instance.get_samples.call_args_list,
+                         [unittest.mock.call(1), unittest.mock.call(2)])
+        stub_api_instance.get_sequence_files.assert_called_once_with(1, "sample1")
+
+    @patch("core.api_handler.get_api_instance")
+    def test_no_existing_samples(self, mock_api_instance):
+        stub_api_instance = unittest.mock.MagicMock()
+        stub_api_instance.get_samples.side_effect = [[]]
+        mock_api_instance.side_effect = [stub_api_instance]
+
+        self.assertEqual(api_handler.get_uploaded_files([(1, "sample1")]), set())
+        stub_api_instance.get_sequence_files.assert_not_called()
+
+
+class TestVerifyUploadedFiles(unittest.TestCase):
+    """
+    Tests the core.api_handler.verify_uploaded_files function
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+        self.file_checksums = {
+            ("1", "sample1"): {"/run/sample1_R1.fastq": {"size": 100, "md5": "aa", "sha256": "bb"},
+                               "/run/sample1_R2.fastq": {"size": 200, "md5": "cc", "sha256": "dd"}},
+            ("1", "sample2"): {"/run/sample2_R1.fastq": {"size": 300, "md5": "ee", "sha256": "ff"}},
+        }
+
+    def _stub_api_instance(self, sequence_files):
+        stub_api_instance = unittest.mock.MagicMock()
+
+        def _get_sequence_files(project_id, sample_name):
+            if sample_name not in sequence_files:
+                raise IridaResourceError("The given sample ID doesn't exist", sample_name)
+            return sequence_files[sample_name]
+
+        stub_api_instance.get_sequence_files.side_effect = _get_sequence_files
+        return stub_api_instance
+
+    @patch("core.api_handler.get_api_instance")
+    def test_files_match(self, mock_api_instance):
+        mock_api_instance.return_value = self._stub_api_instance({
+            "sample1": [{"fileName": "sample1_R1.fastq", "uploadSha256": "BB", "fileSize": "100 B"},
+                        {"fileName": "sample1_R2.fastq", "uploadSha256": "dd", "fileSizeBytes": 200}],
+            # older IRIDA versions do not report a checksum
+            "sample2": [{"fileName": "sample2_R1.fastq"}],
+        })
+
+        self.assertEqual(api_handler.verify_uploaded_files(self.file_checksums), [])
+        self.assertEqual(mock_api_instance.return_value.get_sequence_files.call_count, 2)
+
+    @patch("core.api_handler.get_api_instance")
+    def test_files_do_not_match(self, mock_api_instance):
+        mock_api_instance.return_value = self._stub_api_instance({
+            "sample1": [{"fileName": "sample1_R1.fastq", "uploadSha256": "00", "fileSizeBytes": 100},
+                        {"fileName": "sample1_R2.fastq", "fileSizeBytes": 199}],
+        })
+
+        errors = api_handler.verify_uploaded_files(self.file_checksums)
+
+        self.assertEqual(errors, [
+            "File /run/sample1_R1.fastq on Sample sample1 on Project 1: uploadSha256 on IRIDA is 00, bb was uploaded",
+            "File /run/sample1_R2.fastq on Sample sample1 on Project 1: "
+            "fileSizeBytes on IRIDA is 199 bytes, 200 bytes were uploaded",
+            "Sample sample2 does not exist on Project 1",
+        ])
+
+    @patch("core.api_handler.get_api_instance")
+    def test_missing_file(self, mock_api_instance):
+        mock_api_instance.return_value = self._stub_api_instance({
+            "sample1": [{"fileName": "sample1_R1.fastq"}],
+            "sample2": [{"fileName": "sample2_R1.fastq"}],
+        })
+
+        self.assertEqual(api_handler.verify_uploaded_files(self.file_checksums),
+                         ["File /run/sample1_R2.fastq is missing from Sample sample1 on Project 1"])
@@ -1,10 +1,14 @@
+import logging
+import shutil
+import tempfile
+import threading
 import unittest
-from unittest.mock import patch, MagicMock, Mock
+from unittest.mock import patch, MagicMock, Mock, ANY
 from os import path
 import os
 
 from core import cli_entry, logger
-from model import DirectoryStatus
+from model import DirectoryStatus, SequencingRun, Project, Sample
 from parsers.exceptions import DirectoryError
 
 path_to_module = path.abspath(path.dirname(__file__))
@@ -31,7 +35,7 @@ class TestValidateAndUploadSingleEntry(unittest.TestCase):
 
         # Clean up the logger in the case where a test fails to complete
         print("Cleaning up directory logger")
-        if logger.directory_logger:
+        if logger.has_directory_logger():
             logger.remove_directory_logger()
 
     @patch("core.cli_entry.progress")
@@ -76,7 +80,8 @@ class TestValidateAndUploadSingleEntry(unittest.TestCase):
         # api must prep for upload
         mock_api_handler.prepare_and_validate_for_upload.assert_called_with("Fake Sequencing Run")
         # api should try to upload
-        mock_api_handler.upload_sequencing_run.assert_called_with("Fake Sequencing Run")
+        mock_api_handler.upload_sequencing_run.assert_called_with("Fake Sequencing Run", run_id=None,
+                                                                  on_run_created=ANY, on_sample_uploaded=ANY)
 
     @patch("core.cli_entry.progress")
     @patch("core.cli_entry.api_handler")
@@ -265,7 +270,8 @@ class TestValidateAndUploadSingleEntry(unittest.TestCase):
         # api must prep for upload
         mock_api_handler.prepare_and_validate_for_upload.assert_called_with("Fake Sequencing Run")
         # api should try to upload
-        mock_api_handler.upload_sequencing_run.assert_called_with("Fake Sequencing Run")
+        mock_api_handler.upload_sequencing_run.assert_called_with("Fake Sequencing Run", run_id=None,
+                                                                  on_run_created=ANY, on_sample_uploaded=ANY)
 
     @patch("core.cli_entry.progress")
     @patch("core.cli_entry.api_handler")
@@ -310,7 +316,8 @@ class TestValidateAndUploadSingleEntry(unittest.TestCase):
         # api must prep for upload
         mock_api_handler.prepare_and_validate_for_upload.assert_called_with("Fake Sequencing Run")
         # api should try to upload
-        mock_api_handler.upload_sequencing_run.assert_called_with("Fake Sequencing Run")
+        mock_api_handler.upload_sequencing_run.assert_called_with("Fake Sequencing Run", run_id=None,
+                                                                  on_run_created=ANY, on_sample_uploaded=ANY)
 
     @patch("core.cli_entry.progress")
     @patch("core.cli_entry.api_handler")
@@ -353,3 +360,391 @@ class TestValidateAndUploadSingleEntry(unittest.TestCase):
         mock_parsing_handler.parse_and_validate.assert_not_called()
         # make sure the upload is NOT done, as validation is invalid
         mock_api_handler.upload_sequencing_run.assert_not_called()
+
+    @patch("core.cli_entry.progress")
+    @patch("core.cli_entry.api_handler")
+    @patch("core.cli_entry.parsing_handler")
+    def test_valid_resume_upload(self, mock_parsing_handler, mock_api_handler, mock_progress):
+        """
+        Makes sure that a partial run is resumed when resume_upload is used:
+            samples already uploaded are skipped, and the existing run id is reused
+        :return:
+        """
+        class StubValidationResult:
+            @staticmethod
+            def is_valid():
+                return True
+
+        directory = path.join(path_to_module, "fake_ngs_data")
+        directory_status = DirectoryStatus(directory)
+        directory_status.status = DirectoryStatus.PARTIAL
+        directory_status.run_id = 55
+
+        uploaded_sample = Sample(sample_name="uploaded")
+        new_sample = Sample(sample_name="not_uploaded")
+        sequencing_run = SequencingRun(metadata={}, project_list=[
+            Project(id="1", sample_list=[uploaded_sample, new_sample]),
+            Project(id="2", sample_list=[Sample(sample_name="uploaded")])])
+
+        mock_parsing_handler.get_run_status.side_effect = [directory_status]
+        mock_parsing_handler.parse_and_validate.side_effect = [sequencing_run]
+        mock_api_handler.prepare_and_validate_for_upload.side_effect = [StubValidationResult]
+        mock_api_handler.upload_sequencing_run.side_effect = [55]
+        mock_progress.sample_upload_complete.side_effect = lambda status, project_id, name: name == "uploaded"
+
+        cli_entry.validate_and_upload_single_entry(directory, resume_upload=True)
+
+        # api should try to upload the remaining sample to the existing run
+        mock_api_handler.upload_sequencing_run.assert_called_with(sequencing_run, run_id=55,
+                                                                  on_run_created=ANY, on_sample_uploaded=ANY)
+        self.assertEqual(len(sequencing_run.project_list), 1)
+        self.assertEqual(sequencing_run.project_list[0].sample_list, [new_sample])
+
+    @patch("core.cli_entry.progress")
+    @patch("core.cli_entry.api_handler")
+    @patch("core.cli_entry.parsing_handler")
+    def test_invalid_resume_complete_run(self, mock_parsing_handler, mock_api_handler, mock_progress):
+        """
+        Makes sure a complete run is not uploaded again when resuming
+        :return:
+        """
+        directory = path.join(path_to_module, "fake_ngs_data")
+        directory_status = DirectoryStatus(directory)
+        directory_status.status = DirectoryStatus.COMPLETE
+
+        mock_parsing_handler.get_run_status.side_effect = [directory_status]
+
+        cli_entry.validate_and_upload_single_entry(directory, resume_upload=True)
+
+        mock_parsing_handler.parse_and_validate.assert_not_called()
+        mock_api_handler.upload_sequencing_run.assert_not_called()
+
+    @patch("core.cli_entry.progress")
+    @patch("core.cli_entry.api_handler")
+    @patch("core.cli_entry.parsing_handler")
+    def test_valid_pipeline_upload(self, mock_parsing_handler, mock_api_handler, mock_progress):
+        """
+        Makes sure the run is prepared and uploaded in one step when pipelining
+        :return:
+        """
+        class StubValidationResult:
+            @staticmethod
+            def is_valid():
+                return True
+
+        directory = path.join(path_to_module, "fake_ngs_data")
+        directory_status = DirectoryStatus(directory)
+        directory_status.status = DirectoryStatus.NEW
+
+        mock_parsing_handler.get_run_status.side_effect = [directory_status]
+        mock_parsing_handler.parse_and_validate.side_effect = ["Fake Sequencing Run"]
+        mock_api_handler.prepare_and_upload_sequencing_run.side_effect = [(55, StubValidationResult)]
+
+        result = cli_entry.validate_and_upload_single_entry(directory, pipeline_upload=True)
+
+        self.assertEqual(result, cli_entry.EXIT_CODE_SUCCESS)
+        mock_api_handler.prepare_and_upload_sequencing_run.assert_called_with(
+            "Fake Sequencing Run", run_id=None, on_run_created=ANY, on_sample_uploaded=ANY)
+        mock_api_handler.prepare_and_validate_for_upload.assert_not_called()
+        mock_api_handler.upload_sequencing_run.assert_not_called()
+        mock_progress.write_directory_status.assert_called_with(directory_status, run_id=55)
+
+    @patch("core.cli_entry.progress")
+    @patch("core.cli_entry.api_handler")
+    @patch("core.cli_entry.parsing_handler")
+    def test_invalid_pipeline_upload(self, mock_parsing_handler, mock_api_handler, mock_progress):
+        """
+        Makes sure the status file is set to error when the run can not be prepared while pipelining
+        :return:
+        """
+        class StubValidationResult:
+            error_list = ["Boom"]
+
+            @staticmethod
+            def is_valid():
+                return False
+
+            @staticmethod
+            def error_count():
+                return 1
+
+        directory = path.join(path_to_module, "fake_ngs_data")
+        directory_status = DirectoryStatus(directory)
+        directory_status.status = DirectoryStatus.NEW
+
+        mock_parsing_handler.get_run_status.side_effect = [directory_status]
+        mock_parsing_handler.parse_and_validate.side_effect = ["Fake Sequencing Run"]
+        mock_api_handler.prepare_and_upload_sequencing_run.side_effect = [(55, StubValidationResult)]
+
+        result = cli_entry.validate_and_upload_single_entry(directory, pipeline_upload=True)
+
+        self.assertEqual(result, cli_entry.EXIT_CODE_ERROR)
+        self.assertEqual(directory_status.status, DirectoryStatus.ERROR)
+        mock_progress.write_directory_status.assert_called_with(directory_status)
+
+
+class TestVerifySingleEntry(unittest.TestCase):
+    """
+    Tests the core.cli_entry.verify_single_entry function
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+        self.directory = path.join(path_to_module, "fake_ngs_data")
+        self.directory_status = DirectoryStatus(self.directory)
+        self.directory_status.status = DirectoryStatus.COMPLETE
+        self.directory_status.sample_status_dict = {"1": {"sample1": {"Complete": True, "Files": {
+            "sample1_R1.fastq": {"Bytes Sent": 100, "MD5": "aa", "SHA-256": "bb", "Complete": True}}}}}
+
+    def tearDown(self):
+        if logger.has_directory_logger():
+            logger.remove_directory_logger()
+
+    @patch("core.cli_entry.api_handler")
+    @patch("core.cli_entry.parsing_handler")
+    def test_valid_files_verified(self, mock_parsing_handler, mock_api_handler):
+        """
+        Makes sure the checksums from the status file are verified, without uploading
+        :return:
+        """
+        mock_parsing_handler.get_run_status.side_effect = [self.directory_status]
+        mock_api_handler.verify_uploaded_files.side_effect = [[]]
+
+        result = cli_entry.verify_single_entry(self.directory)
+
+        self.assertEqual(result, cli_entry.EXIT_CODE_SUCCESS)
+        mock_api_handler.verify_uploaded_files.assert_called_once_with(
+            {("1", "sample1"): {"sample1_R1.fastq": {"size": 100, "md5": "aa", "sha256": "bb"}}})
+        mock_parsing_handler.parse_and_validate.assert_not_called()
+        mock_api_handler.upload_sequencing_run.assert_not_called()
+
+    @patch("core.cli_entry.api_handler")
+    @patch("core.cli_entry.parsing_handler")
+    def test_invalid_files_do_not_match(self, mock_parsing_handler, mock_api_handler):
+        mock_parsing_handler.get_run_status.side_effect = [self.directory_status]
+        mock_api_handler.verify_uploaded_files.side_effect = [["File sample1_R1.fastq is missing"]]
+
+        self.assertEqual(cli_entry.verify_single_entry(self.directory), cli_entry.EXIT_CODE_ERROR)
+
+    @patch("core.cli_entry.api_handler")
+    @patch("core.cli_entry.parsing_handler")
+    def test_invalid_nothing_uploaded(self, mock_parsing_handler, mock_api_handler):
+        self.directory_status.status = DirectoryStatus.NEW
+        self.directory_status.sample_status_dict = {}
+        mock_parsing_handler.get_run_status.side_effect = [self.directory_status]
+
+        self.assertEqual(cli_entry.verify_single_entry(self.directory), cli_entry.EXIT_CODE_ERROR)
+        mock_api_handler.initialize_api_from_config.assert_not_called()
+
+
+class TestWatchAndUpload(unittest.TestCase):
+    """
+    Tests the core.cli_entry.watch_and_upload function
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+    @patch("core.cli_entry.WATCH_SETTLE_SECONDS", 0)
+    @patch("core.cli_entry._upload_if_new")
+    @patch("core.cli_entry.run_watcher")
+    def test_runs_uploaded(self, mock_run_watcher, mock_upload_if_new):
+        """
+        Makes sure each run the watcher reports is uploaded, and an upload in progress is not started again
+        :return:
+        """
+        stop_event = threading.Event()
+        first_upload_started = threading.Event()
+        finish_first_upload = threading.Event()
+
+        def _upload(directory, pipeline_upload):
+            if directory == "run1":
+                first_upload_started.set()
+                finish_first_upload.wait(5)
+
+        changes = [{"run1"}, {"run2"}, {"run1"}]
+
+        def _wait_for_changes(timeout):
+            if changes:
+                if len(changes) == 2:
+                    first_upload_started.wait(5)
+                return changes.pop(0)
+            finish_first_upload.set()
+            stop_event.set()
+            return set()
+
+        mock_run_watcher.RunWatcher.return_value.wait_for_changes.side_effect = _wait_for_changes
+        mock_upload_if_new.side_effect = _upload
+
+        result = cli_entry.watch_and_upload(path_to_module, jobs=2, stop_event=stop_event)
+
+        self.assertEqual(result, cli_entry.EXIT_CODE_SUCCESS)
+        # run1 was still uploading when it changed again
+        self.assertEqual(sorted(mock_upload_if_new.call_args_list),
+                         [unittest.mock.call("run1", False), unittest.mock.call("run2", False)])
+        mock_run_watcher.RunWatcher.return_value.close.assert_called_once_with()
+
+    @patch("core.cli_entry.validate_and_upload_single_entry")
+    @patch("core.cli_entry.parsing_handler")
+    def test_only_new_runs_uploaded(self, mock_parsing_handler, mock_validate_and_upload):
+        new_status = DirectoryStatus("new_run")
+        new_status.status = DirectoryStatus.NEW
+        incomplete_status = DirectoryStatus("incomplete_run")
+        incomplete_status.status = DirectoryStatus.INVALID
+        mock_parsing_handler.get_run_status.side_effect = [new_status, incomplete_status, DirectoryError("Boom", "")]
+
+        cli_entry._upload_if_new("new_run")
+        cli_entry._upload_if_new("incomplete_run")
+        cli_entry._upload_if_new("broken_run")
+
+        mock_validate_and_upload.assert_called_once_with("new_run", pipeline_upload=False)
+
+    def test_concurrent_directory_logs(self):
+        """
+        Makes sure runs uploaded at the same time each log to their own directory
+        :return:
+        """
+        directories = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+        for directory in directories:
+            self.addCleanup(shutil.rmtree, directory)
+        barrier = threading.Barrier(2)
+
+        def _upload(directory):
+            logger.add_log_to_directory(directory)
+            barrier.wait(5)
+            logging.info("Uploading " + directory)
+            barrier.wait(5)
+            logger.remove_directory_logger()
+
+        threads = [threading.Thread(target=_upload, args=(directory,), name="run_{}".format(i))
+                   for i, directory in enumerate(directories)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for directory, other_directory in [directories, reversed(directories)]:
+            with open(path.join(directory, "irida-uploader.log")) as log_file:
+                log = log_file.read()
+            self.assertIn("Uploading " + directory, log)
+            self.assertNotIn("Uploading " + other_directory, log)
+
+
+class TestBatchUpload(unittest.TestCase):
+    """
+    Tests the core.cli_entry.batch_upload function
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+        self.root = tempfile.mkdtemp()
+        self.runs = []
+        # run_a is the oldest and largest, run_c the newest and smallest
+        for i, (name, size) in enumerate([("run_a", 300), ("run_b", 200), ("run_c", 100)]):
+            run_directory = path.join(self.root, name)
+            os.mkdir(run_directory)
+            with open(path.join(run_directory, "reads.fastq"), "wb") as reads:
+                reads.write(b"A" * size)
+            os.utime(run_directory, (1000 + i, 1000 + i))
+            self.runs.append(run_directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _get_runs(self, directory):
+        directory_status_list = []
+        for run_directory in self.runs + [path.join(self.root, "run_done")]:
+            directory_status = DirectoryStatus(run_directory)
+            directory_status.status = DirectoryStatus.COMPLETE if run_directory.endswith("done") \
+                else DirectoryStatus.NEW
+            directory_status_list.append(directory_status)
+        return directory_status_list
+
+    @patch("core.cli_entry.validate_and_upload_single_entry")
+    @patch("core.cli_entry.parsing_handler")
+    def test_orders(self, mock_parsing_handler, mock_validate_and_upload):
+        """
+        Makes sure only new runs are uploaded, in the order asked for
+        :return:
+        """
+        mock_parsing_handler.get_runs.side_effect = self._get_runs
+        mock_validate_and_upload.return_value = cli_entry.EXIT_CODE_SUCCESS
+        priority_file = path.join(self.root, "priority.txt")
+        with open(priority_file, "w") as priorities:
+            priorities.write("# most urgent first\nrun_b\n")
+
+        for order, expected_names in [(cli_entry.BATCH_ORDER_OLDEST, ["run_a", "run_b", "run_c"]),
+                                      (cli_entry.BATCH_ORDER_SMALLEST, ["run_c", "run_b", "run_a"]),
+                                      (cli_entry.BATCH_ORDER_PRIORITY, ["run_b", "run_a", "run_c"])]:
+            mock_validate_and_upload.reset_mock()
+            result = cli_entry.batch_upload(self.root, order=order, priority_file=priority_file)
+
+            self.assertEqual(result, cli_entry.EXIT_CODE_SUCCESS)
+            self.assertEqual(mock_validate_and_upload.call_args_list,
+                             [unittest.mock.call(path.join(self.root, name), pipeline_upload=False)
+                              for name in expected_names])
+
+    @patch("core.cli_entry.validate_and_upload_single_entry")
+    @patch("core.cli_entry.parsing_handler")
+    def test_failed_run_does_not_stop_batch(self, mock_parsing_handler, mock_validate_and_upload):
+        """
+        Makes sure every run is uploaded at the same time up to jobs, and a failed run fails the batch
+        :return:
+        """
+        mock_parsing_handler.get_runs.side_effect = self._get_runs
+        all_started = threading.Barrier(3, timeout=5)
+
+        def _upload(directory, pipeline_upload):
+            all_started.wait()
+            if directory.endswith("run_b"):
+                raise Exception("Boom")
+            return cli_entry.EXIT_CODE_SUCCESS
+
+        mock_validate_and_upload.side_effect = _upload
+
+        result = cli_entry.batch_upload(self.root, jobs=3)
+
+        self.assertEqual(result, cli_entry.EXIT_CODE_ERROR)
+        self.assertEqual(mock_validate_and_upload.call_count, 3)
+
+    @patch("core.cli_entry.validate_and_upload_single_entry")
+    @patch("core.cli_entry.parsing_handler")
+    def test_priority_order_needs_file(self, mock_parsing_handler, mock_validate_and_upload):
+        mock_parsing_handler.get_runs.side_effect = self._get_runs
+
+        result = cli_entry.batch_upload(self.root, order=cli_entry.BATCH_ORDER_PRIORITY)
+
+        self.assertEqual(result, cli_entry.EXIT_CODE_ERROR)
+        mock_validate_and_upload.assert_not_called()
+
+
+class TestListRunStatuses(unittest.TestCase):
+    """
+    Tests the core.cli_entry.list_run_statuses function
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+    @patch("core.cli_entry.progress")
+    def test_list_run_statuses(self, mock_progress):
+        mock_progress.get_state_store.return_value.find_runs.return_value = [
+            {"directory": "/runs/run_1", "status": DirectoryStatus.COMPLETE, "updated": 0},
+            {"directory": "/runs/run_2", "status": DirectoryStatus.ERROR, "updated": 0},
+            {"directory": "/runs/run_3", "status": DirectoryStatus.COMPLETE, "updated": 0}]
+
+        with self.assertLogs(level=logging.INFO) as logs:
+            result = cli_entry.list_run_statuses("/runs")
+
+        self.assertEqual(result, cli_entry.EXIT_CODE_SUCCESS)
+        mock_progress.get_state_store.return_value.find_runs.assert_called_once_with(parent_directory="/runs")
+        self.assertIn("3 runs in /runs: 2 complete, 1 error", logs.output[-1])
+
+    @patch("core.cli_entry.progress")
+    def test_no_state_store(self, mock_progress):
+        mock_progress.get_state_store.return_value = None
+
+        result = cli_entry.list_run_statuses("/runs")
+
+        self.assertEqual(result, cli_entry.EXIT_CODE_ERROR)
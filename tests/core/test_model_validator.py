@@ -0,0 +1,113 @@
+import unittest
+
+import model
+from core import model_validator
+
+
+class TestCompileSchema(unittest.TestCase):
+    """
+    Test that compiled schemas give the same errors as cerberus
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+    def assert_same_errors(self, schema, documents):
+        compiled = model_validator.compile_schema(schema)
+        self.assertIsInstance(compiled, model_validator._CompiledValidator)
+        cerberus = model_validator._CerberusValidator(schema)
+        for document in documents:
+            self.assertEqual(compiled.validate(document), cerberus.validate(document), document)
+
+    def test_sample_schema(self):
+        sequence_file = model.SequenceFile(file_list=["a_R1.fastq.gz"])
+        self.assert_same_errors(model.Sample.uploadable_schema, [
+            {'_sample_name': 'sample1', '_description': None, '_sample_number': 1, '_sequence_file': sequence_file},
+            {'_sample_name': 'sample1', '_sample_number': '1', '_sequence_file': sequence_file},
+            {'_sample_name': 'ab', '_sample_number': 1.5, '_sequence_file': None},
+            {'_sample_name': '', '_description': 5, '_sequence_file': 'file'},
+            {'_sample_name': None},
+            {},
+        ])
+
+    def test_sequence_file_schema(self):
+        self.assert_same_errors(model.SequenceFile.uploadable_schema, [
+            {'_file_list': ["a_R1.fastq.gz", "a_R2.fastq.gz"], '_properties_dict': {}},
+            {'_file_list': [], '_properties_dict': []},
+            {'_file_list': ["a_R1.fastq.gz", 2, None], '_properties_dict': None},
+            {'_file_list': "a_R1.fastq.gz"},
+            {'_file_list': None},
+        ])
+
+    def test_project_and_run_schemas(self):
+        sample = model.Sample("sample1")
+        project = model.Project(id=1, sample_list=[sample])
+        self.assert_same_errors(model.Project.uploadable_schema, [
+            {'_sample_list': [sample], '_name': None, '_description': 'desc', '_id': '1'},
+            {'_sample_list': [], '_id': None},
+            {'_sample_list': [sample, 'sample'], '_name': 5},
+        ])
+        self.assert_same_errors(model.Project.send_project_schema, [
+            {'_name': 'project', '_description': None},
+            {'_name': 'four'},
+            {'_description': 'desc'},
+        ])
+        self.assert_same_errors(model.SequencingRun.uploadable_schema, [
+            {'_project_list': [project], '_metadata': {'layoutType': 'PAIRED_END'}},
+            {'_project_list': [], '_metadata': {'layoutType': 'PAIRED'}},
+            {'_project_list': [sample], '_metadata': {}},
+            {'_project_list': None, '_metadata': 'PAIRED_END'},
+        ])
+
+    def test_unknown_rule_uses_cerberus(self):
+        schema = {'_name': {'type': 'string', 'regex': '[a-z]+'}}
+        validator = model_validator.compile_schema(schema)
+
+        self.assertIsInstance(validator, model_validator._CerberusValidator)
+        self.assertEqual(validator.validate({'_name': 'abc'}), {})
+        self.assertEqual(validator.validate({'_name': 'ABC'}), {'_name': ["value does not match regex '[a-z]+'"]})
+
+    def test_unknown_type_uses_cerberus(self):
+        schema = {'_paired': {'type': 'boolean', 'nullable': True}}
+        validator = model_validator.compile_schema(schema)
+
+        self.assertIsInstance(validator, model_validator._CerberusValidator)
+        self.assertEqual(validator.validate({'_paired': None}), {})
+        self.assertEqual(validator.validate({'_paired': 'yes'}), {'_paired': ['must be of boolean type']})
+
+
+class TestValidateSequencingRun(unittest.TestCase):
+    """
+    Test that errors are collected for each invalid object
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+    def test_valid(self):
+        sample = model.Sample("sample1")
+        sample.sequence_file = model.SequenceFile(file_list=["a_R1.fastq.gz", "a_R2.fastq.gz"])
+        sequencing_run = model.SequencingRun({'layoutType': 'PAIRED_END'}, [model.Project(id=1, sample_list=[sample])])
+
+        self.assertTrue(model_validator.validate_sequencing_run(sequencing_run).is_valid())
+
+    def test_invalid_samples(self):
+        valid_sample = model.Sample("sample1")
+        valid_sample.sequence_file = model.SequenceFile(file_list=["a_R1.fastq.gz"])
+        no_file_sample = model.Sample("sample2")
+        short_name_sample = model.Sample("s3")
+        short_name_sample.sequence_file = model.SequenceFile(file_list=["b_R1.fastq.gz"])
+        sequencing_run = model.SequencingRun({'layoutType': 'SINGLE_END'}, [
+            model.Project(id=1, sample_list=[valid_sample, no_file_sample, short_name_sample])])
+
+        result = model_validator.validate_sequencing_run(sequencing_run)
+
+        self.assertEqual(result.error_count(), 2)
+        self.assertEqual(result.error_list[0].object, no_file_sample)
+        self.assertEqual(result.error_list[0].message, {'_sequence_file': ['null value not allowed']})
+        self.assertEqual(result.error_list[1].object, short_name_sample)
+        self.assertEqual(result.error_list[1].message, {'_sample_name': ['min length is 3']})
+
+    def test_invalid_send_project(self):
+        with self.assertRaises(model.exceptions.ModelValidationError):
+            model_validator.validate_send_project(model.Project(name="abc"))
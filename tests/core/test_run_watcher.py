@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from core import run_watcher
+
+
+class TestRunWatcher(unittest.TestCase):
+    """
+    Tests finding runs with core.run_watcher.RunWatcher
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.existing_run = os.path.join(self.directory, "existing_run")
+        os.mkdir(self.existing_run)
+
+    def _make_watcher(self, use_inotify):
+        watcher = run_watcher.RunWatcher(self.directory, poll_interval=0.05, use_inotify=use_inotify)
+        self.addCleanup(watcher.close)
+        return watcher
+
+    def _check_watcher(self, watcher):
+        # every run is reported when watching starts
+        self.assertEqual(watcher.wait_for_changes(0), {self.existing_run})
+        self.assertEqual(watcher.wait_for_changes(0.1), set())
+
+        new_run = os.path.join(self.directory, "new_run")
+        os.mkdir(new_run)
+        self.assertEqual(watcher.wait_for_changes(1), {new_run})
+
+        with open(os.path.join(self.existing_run, "CompletedJobInfo.xml"), "w") as marker_file:
+            marker_file.write("<xml/>")
+        self.assertEqual(watcher.wait_for_changes(1), {self.existing_run})
+
+    def test_inotify(self):
+        watcher = self._make_watcher(use_inotify=True)
+        if not watcher.uses_inotify:
+            self.skipTest("inotify is not available")
+
+        self._check_watcher(watcher)
+
+        # other files do not mark a run as ready
+        with open(os.path.join(self.existing_run, "irida_uploader_status.info"), "w") as status_file:
+            status_file.write("{}")
+        self.assertEqual(watcher.wait_for_changes(0.1), set())
+
+    def test_polling(self):
+        watcher = self._make_watcher(use_inotify=False)
+        self.assertFalse(watcher.uses_inotify)
+
+        self._check_watcher(watcher)
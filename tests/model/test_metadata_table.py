@@ -0,0 +1,48 @@
+import unittest
+
+import model
+from model.metadata_table import MetadataTable
+
+
+class TestSampleMetadata(unittest.TestCase):
+    """
+    Test that sample metadata is shared and exposed as read-only views
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+    def test_key_table_shared(self):
+        sample_1 = model.Sample("sample1", samp_dict={"sample_project": "6", "index": "AAAA"})
+        sample_2 = model.Sample("sample2", samp_dict={"sample_project": "7", "index": "CCCC"})
+
+        self.assertIs(sample_1._metadata_table, sample_2._metadata_table)
+        self.assertIs(MetadataTable.get_table(["sample_project", "index"]), sample_1._metadata_table)
+        self.assertEqual(sample_1["index"], "AAAA")
+        self.assertEqual(sample_2.get("sample_project"), "7")
+        self.assertIsNone(sample_1["missing"])
+
+    def test_uploadable_dict(self):
+        sample = model.Sample("sample1", description="desc", samp_dict={"sample_project": "6"})
+        uploadable_dict = sample.get_uploadable_dict()
+
+        self.assertEqual(uploadable_dict, {"sample_project": "6", "sampleName": "sample1", "description": "desc"})
+        self.assertEqual(list(uploadable_dict.keys()), ["sample_project", "sampleName", "description"])
+        with self.assertRaises(TypeError):
+            uploadable_dict["sample_project"] = "7"
+        # a modifiable copy is independent of the sample
+        copied_dict = dict(uploadable_dict)
+        copied_dict["sample_project"] = "7"
+        self.assertEqual(sample["sample_project"], "6")
+
+    def test_sequence_file_properties(self):
+        sequence_file = model.SequenceFile(file_list=["a_R1.fastq.gz"], properties_dict={"Sample_Well": "A01"})
+
+        self.assertEqual(sequence_file.properties_dict, {"Sample_Well": "A01"})
+        self.assertEqual(sequence_file.get("Sample_Well"), "A01")
+        self.assertEqual(sequence_file.get_dict()["_file_list"], ["a_R1.fastq.gz"])
+
+    def test_no_instance_dict(self):
+        sample = model.Sample("sample1")
+        with self.assertRaises(AttributeError):
+            sample.unknown_attribute = True
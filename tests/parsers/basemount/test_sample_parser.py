@@ -0,0 +1,37 @@
+import unittest
+
+from parsers.basemount import sample_parser
+
+
+class TestGetSequenceFileNames(unittest.TestCase):
+    """
+    Tests reading lane files from the File_Forward and File_Reverse columns
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+    def test_single_files(self):
+        self.assertEqual(sample_parser._get_sequence_file_names("/run/s1_R1.fastq.gz", "/run/s1_R2.fastq.gz"),
+                         ("/run/s1_R1.fastq.gz", "/run/s1_R2.fastq.gz", {}))
+        self.assertEqual(sample_parser._get_sequence_file_names("/run/s1_R1.fastq.gz", ""),
+                         ("/run/s1_R1.fastq.gz", "", {}))
+
+    def test_lane_files(self):
+        r1_lanes = ["/run/s1_S1_L001_R1_001.fastq.gz", "/run/s1_S1_L002_R1_001.fastq.gz"]
+        r2_lanes = ["/run/s1_S1_L001_R2_001.fastq.gz", "/run/s1_S1_L002_R2_001.fastq.gz"]
+
+        file_forward, file_reverse, file_parts = sample_parser._get_sequence_file_names(";".join(r1_lanes),
+                                                                                        ";".join(r2_lanes))
+
+        self.assertEqual(file_forward, "/run/s1_S1_R1_001.fastq.gz")
+        self.assertEqual(file_reverse, "/run/s1_S1_R2_001.fastq.gz")
+        self.assertEqual(file_parts, {file_forward: r1_lanes, file_reverse: r2_lanes})
+
+    def test_lane_files_without_lane_in_name(self):
+        lanes = ["/run/a_R1.fastq.gz", "/run/b_R1.fastq.gz"]
+
+        file_forward, _, file_parts = sample_parser._get_sequence_file_names(";".join(lanes), "")
+
+        self.assertNotIn(file_forward, lanes)
+        self.assertEqual(file_parts, {file_forward: lanes})
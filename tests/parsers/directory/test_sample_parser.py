@@ -3,6 +3,7 @@ from os import path
 
 import parsers.directory.sample_parser as sample_parser
 from parsers.exceptions import SampleSheetError
+from parsers.sample_sheet import read_sample_sheet
 import model
 
 path_to_module = path.abspath(path.dirname(__file__))
@@ -104,15 +105,15 @@ class TestBuildSequencingRunFromSamples(unittest.TestCase):
                          sample3.get_uploadable_dict())
 
 
-class TestGetCsvReader(unittest.TestCase):
+class TestReadSampleSheet(unittest.TestCase):
     """
-    Test that the csv reader behaves as expected
+    Test that the sample sheet is read as expected
     """
 
     def setUp(self):
         print("\nStarting " + self.__module__ + ": " + self._testMethodName)
 
-    def test_get_csv_reader_valid_sheet(self):
+    def test_read_sample_sheet_valid_sheet(self):
         """
         Given a valid sample sheet, ensure the parsed sheet matches expected output
         :return:
@@ -120,7 +121,7 @@ class TestGetCsvReader(unittest.TestCase):
         sheet_file = path.join(path_to_module, "fake_dir_data",
                                "test_csv_reader.csv")
 
-        lines = sample_parser.get_csv_reader(sheet_file)
+        lines = read_sample_sheet(sheet_file).lines
         # This is a sample of what the miseq sample sheet looks like, but it also makes a good
         # example for what we want our csv reader to be able to parse.
         correct_lines = [
@@ -152,9 +153,9 @@ class TestGetCsvReader(unittest.TestCase):
         ]
 
         for line, c_line in zip(lines, correct_lines):
-            self.assertEqual(line, c_line)
+            self.assertEqual(list(line), c_line)
 
-    def test_get_csv_reader_no_sheet(self):
+    def test_read_sample_sheet_no_sheet(self):
         """
         When no sheet is given to parser, throw error
         :return:
@@ -162,7 +163,7 @@ class TestGetCsvReader(unittest.TestCase):
         sheet_file = path.join(path_to_module, "fake_dir_data")
 
         with self.assertRaises(SampleSheetError):
-            sample_parser.get_csv_reader(sheet_file)
+            read_sample_sheet(sheet_file)
 
 
 class TestParseSampleList(unittest.TestCase):
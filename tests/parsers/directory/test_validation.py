@@ -5,6 +5,7 @@ from io import StringIO
 
 from parsers.directory.validation import validate_sample_sheet
 from parsers.exceptions import SampleSheetError
+from parsers.sample_sheet import SampleSheet
 
 
 class TestValidation(unittest.TestCase):
@@ -15,11 +16,11 @@ class TestValidation(unittest.TestCase):
     def setUp(self):
         print("\nStarting " + self.__module__ + ": " + self._testMethodName)
 
-    @patch("parsers.directory.validation.get_csv_reader")
-    def test_validate_sample_sheet_no_data_header(self, mock_csv_reader):
+    @patch("parsers.directory.validation.read_sample_sheet")
+    def test_validate_sample_sheet_no_data_header(self, mock_read_sample_sheet):
         """
         Given a sample sheet with no header, make sure the correct errors are included in the response
-        :param mock_csv_reader:
+        :param mock_read_sample_sheet:
         :return:
         """
         field_values = (
@@ -34,9 +35,9 @@ class TestValidation(unittest.TestCase):
         # converts string as a pseudo file / memory file
         sample_sheet_file = StringIO(file_contents_str)
 
-        # the call to get_csv_reader() inside parse_samples() will return
+        # the call to read_sample_sheet() inside parse_samples() will return
         # items inside side_effect
-        mock_csv_reader.side_effect = [reader(sample_sheet_file)]
+        mock_read_sample_sheet.side_effect = [SampleSheet(None, reader(sample_sheet_file))]
 
         res = validate_sample_sheet(None)
 
@@ -48,11 +49,11 @@ class TestValidation(unittest.TestCase):
         self.assertEqual(type(res.error_list[0]), SampleSheetError)
         self.assertEqual(type(res.error_list[1]), SampleSheetError)
 
-    @patch("parsers.directory.validation.get_csv_reader")
-    def test_validate_sample_sheet_no_data(self, mock_csv_reader):
+    @patch("parsers.directory.validation.read_sample_sheet")
+    def test_validate_sample_sheet_no_data(self, mock_read_sample_sheet):
         """
         Given a sample sheet with no data, make sure the correct errors are included in the response
-        :param mock_csv_reader:
+        :param mock_read_sample_sheet:
         :return:
         """
         file_contents_str = "[Data]\n"
@@ -60,9 +61,9 @@ class TestValidation(unittest.TestCase):
         # converts string as a pseudo file / memory file
         sample_sheet_file = StringIO(file_contents_str)
 
-        # the call to get_csv_reader() inside parse_samples() will return
+        # the call to read_sample_sheet() inside parse_samples() will return
         # items inside side_effect
-        mock_csv_reader.side_effect = [reader(sample_sheet_file)]
+        mock_read_sample_sheet.side_effect = [SampleSheet(None, reader(sample_sheet_file))]
 
         res = validate_sample_sheet(None)
 
@@ -73,11 +74,11 @@ class TestValidation(unittest.TestCase):
         # Error type should be SampleSheetError
         self.assertEqual(type(res.error_list[0]), SampleSheetError)
 
-    @patch("parsers.directory.validation.get_csv_reader")
-    def test_validate_sample_sheet_valid(self, mock_csv_reader):
+    @patch("parsers.directory.validation.read_sample_sheet")
+    def test_validate_sample_sheet_valid(self, mock_read_sample_sheet):
         """
         Given a valid sample sheet, make sure the response shows as valid
-        :param mock_csv_reader:
+        :param mock_read_sample_sheet:
         :return:
         """
         field_values = (
@@ -93,9 +94,9 @@ class TestValidation(unittest.TestCase):
         # converts string as a pseudo file / memory file
         sample_sheet_file = StringIO(file_contents_str)
 
-        # the call to get_csv_reader() inside parse_samples() will return
+        # the call to read_sample_sheet() inside parse_samples() will return
         # items inside side_effect
-        mock_csv_reader.side_effect = [reader(sample_sheet_file)]
+        mock_read_sample_sheet.side_effect = [SampleSheet(None, reader(sample_sheet_file))]
 
         res = validate_sample_sheet(None)
 
@@ -6,6 +6,7 @@ from io import StringIO
 
 import parsers.miniseq.sample_parser as sample_parser
 from parsers.exceptions import SampleSheetError, SequenceFileError
+from parsers.sample_sheet import SampleSheet, read_sample_sheet
 import model
 
 path_to_module = path.abspath(path.dirname(__file__))
@@ -21,8 +22,8 @@ class TestParseMetadata(unittest.TestCase):
     def setUp(self):
         print("\nStarting " + self.__module__ + ": " + self._testMethodName)
 
-    @patch("parsers.miniseq.sample_parser.get_csv_reader")
-    def test_parse_metadata_paired_valid(self, mock_csv_reader):
+    @patch("parsers.miniseq.sample_parser.read_sample_sheet")
+    def test_parse_metadata_paired_valid(self, mock_read_sample_sheet):
         """
         When given a valid directory, ensure valid metadata is built
         paired end reads
@@ -66,9 +67,9 @@ class TestParseMetadata(unittest.TestCase):
         # converts string as a pseudo file / memory file
         sample_sheet_file = StringIO(file_contents_str)
 
-        # the call to get_csv_reader() inside parse_samples() will return
+        # the call to read_sample_sheet() inside parse_samples() will return
         # items inside side_effect
-        mock_csv_reader.side_effect = [reader(sample_sheet_file)]
+        mock_read_sample_sheet.side_effect = [SampleSheet(None, reader(sample_sheet_file))]
 
         metadata = sample_parser.parse_metadata(None)
         # The meta data we care about the most
@@ -82,8 +83,8 @@ class TestParseMetadata(unittest.TestCase):
         self.assertEqual(metadata['description'], "12-34")
         self.assertEqual(metadata['chemistry'], "Yes")
 
-    @patch("parsers.miniseq.sample_parser.get_csv_reader")
-    def test_parse_metadata_single_valid(self, mock_csv_reader):
+    @patch("parsers.miniseq.sample_parser.read_sample_sheet")
+    def test_parse_metadata_single_valid(self, mock_read_sample_sheet):
         """
         When given a valid directory, ensure valid metadata is built
         single end reads
@@ -125,9 +126,9 @@ class TestParseMetadata(unittest.TestCase):
         # converts string as a pseudo file / memory file
         sample_sheet_file = StringIO(file_contents_str)
 
-        # the call to get_csv_reader() inside parse_samples() will return
+        # the call to read_sample_sheet() inside parse_samples() will return
         # items inside side_effect
-        mock_csv_reader.side_effect = [reader(sample_sheet_file)]
+        mock_read_sample_sheet.side_effect = [SampleSheet(None, reader(sample_sheet_file))]
 
         metadata = sample_parser.parse_metadata(None)
         self.assertEqual(metadata['layoutType'], "SINGLE_END")
@@ -207,15 +208,15 @@ class TestBuildSequencingRunFromSamples(unittest.TestCase):
         self.assertEqual(type(sequencing_run.project_list[0].sample_list[0].sequence_file), model.SequenceFile)
 
 
-class TestGetCsvReader(unittest.TestCase):
+class TestReadSampleSheet(unittest.TestCase):
     """
-    Test that the csv reader behaves as expected
+    Test that the sample sheet is read as expected
     """
 
     def setUp(self):
         print("\nStarting " + self.__module__ + ": " + self._testMethodName)
 
-    def test_get_csv_reader_valid_sheet(self):
+    def test_read_sample_sheet_valid_sheet(self):
         """
         Given a valid sample sheet, ensure the parsed sheet matches expected output
         :return:
@@ -223,7 +224,7 @@ class TestGetCsvReader(unittest.TestCase):
         sheet_file = path.join(path_to_module, "fake_ngs_data",
                                "SampleSheet.csv")
 
-        lines = sample_parser.get_csv_reader(sheet_file)
+        lines = read_sample_sheet(sheet_file).lines
 
         correct_lines = [
             ['[Header]'],
@@ -250,18 +251,46 @@ class TestGetCsvReader(unittest.TestCase):
         ]
 
         for line, c_line in zip(lines, correct_lines):
-            self.assertEqual(line, c_line)
+            self.assertEqual(list(line), c_line)
 
-    def test_get_csv_reader_no_sheet(self):
+    def test_read_sample_sheet_no_sheet(self):
         """
-        Make sure an error is raised if the csv reader is not given a valid sample sheet
+        Make sure an error is raised if read_sample_sheet is not given a valid sample sheet
         :return:
         """
         sheet_file = path.join(path_to_module, "fake_ngs_data",
                                "Alignment_1")
 
         with self.assertRaises(SampleSheetError):
-            sample_parser.get_csv_reader(sheet_file)
+            read_sample_sheet(sheet_file)
+
+
+class TestBuildFileIndex(unittest.TestCase):
+    """
+    Testing the index of fastq file names in a data directory
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+    def test_build_file_index(self):
+        file_index = sample_parser._build_file_index([
+            '01-1111_S1_L001_R1_001.fastq.gz',
+            'Undetermined_S0_L001_R1_001.fastq.gz',
+            '01-1111_S1_L001_R2_001.fastq.gz',
+            '1111_S3_L001_R1_001.fastq.gz',
+            'SampleSheet.csv',
+        ])
+
+        self.assertEqual(file_index['01-1111'], {
+            '1': [('01-1111_S1_L001_R1_001.fastq.gz', 1), ('01-1111_S1_L001_R2_001.fastq.gz', 2)]
+        })
+        # sample names are matched exactly, not as a suffix of a longer name
+        self.assertEqual(file_index['1111'], {'3': [('1111_S3_L001_R1_001.fastq.gz', 1)]})
+        self.assertEqual(len(file_index), 3)
+
+    def test_build_file_index_no_fastq(self):
+        self.assertEqual(sample_parser._build_file_index(['SampleSheet.csv', '01-1111_S1_L001_R_001.fastq.gz']), {})
 
 
 class TestValidatePfList(unittest.TestCase):
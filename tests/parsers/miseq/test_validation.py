@@ -5,6 +5,7 @@ from io import StringIO
 
 from parsers.miseq.validation import validate_sample_sheet
 from parsers.exceptions import SampleSheetError
+from parsers.sample_sheet import SampleSheet
 
 
 class TestValidation(unittest.TestCase):
@@ -15,11 +16,11 @@ class TestValidation(unittest.TestCase):
     def setUp(self):
         print("\nStarting " + self.__module__ + ": " + self._testMethodName)
 
-    @patch("parsers.miseq.validation.get_csv_reader")
-    def test_validate_sample_sheet_no_header(self, mock_csv_reader):
+    @patch("parsers.miseq.validation.read_sample_sheet")
+    def test_validate_sample_sheet_no_header(self, mock_read_sample_sheet):
         """
         Given a sample sheet with no header, make sure the correct errors are included in the response
-        :param mock_csv_reader:
+        :param mock_read_sample_sheet:
         :return:
         """
         headers = ("Sample_ID,Sample_Name,Sample_Plate,Sample_Well," +
@@ -48,9 +49,9 @@ class TestValidation(unittest.TestCase):
         # converts string as a pseudo file / memory file
         sample_sheet_file = StringIO(file_contents_str)
 
-        # the call to get_csv_reader() inside parse_samples() will return
+        # the call to read_sample_sheet() inside parse_samples() will return
         # items inside side_effect
-        mock_csv_reader.side_effect = [reader(sample_sheet_file)]
+        mock_read_sample_sheet.side_effect = [SampleSheet(None, reader(sample_sheet_file))]
 
         res = validate_sample_sheet(None)
 
@@ -61,11 +62,11 @@ class TestValidation(unittest.TestCase):
         # Error type should be SampleSheetError
         self.assertEqual(type(res.error_list[0]), SampleSheetError)
 
-    @patch("parsers.miseq.validation.get_csv_reader")
-    def test_validate_sample_sheet_no_data(self, mock_csv_reader):
+    @patch("parsers.miseq.validation.read_sample_sheet")
+    def test_validate_sample_sheet_no_data(self, mock_read_sample_sheet):
         """
         Given a sample sheet with no data, make sure the correct errors are included in the response
-        :param mock_csv_reader:
+        :param mock_read_sample_sheet:
         :return:
         """
         field_values = (
@@ -98,9 +99,9 @@ class TestValidation(unittest.TestCase):
         # converts string as a pseudo file / memory file
         sample_sheet_file = StringIO(file_contents_str)
 
-        # the call to get_csv_reader() inside parse_samples() will return
+        # the call to read_sample_sheet() inside parse_samples() will return
         # items inside side_effect
-        mock_csv_reader.side_effect = [reader(sample_sheet_file)]
+        mock_read_sample_sheet.side_effect = [SampleSheet(None, reader(sample_sheet_file))]
 
         res = validate_sample_sheet(None)
 
@@ -112,11 +113,11 @@ class TestValidation(unittest.TestCase):
         self.assertEqual(type(res.error_list[0]), SampleSheetError)
         self.assertEqual(type(res.error_list[1]), SampleSheetError)
 
-    @patch("parsers.miseq.validation.get_csv_reader")
-    def test_validate_sample_sheet_missing_data_header(self, mock_csv_reader):
+    @patch("parsers.miseq.validation.read_sample_sheet")
+    def test_validate_sample_sheet_missing_data_header(self, mock_read_sample_sheet):
         """
         Given a sample sheet with no data header, make sure the correct errors are included in the response
-        :param mock_csv_reader:
+        :param mock_read_sample_sheet:
         :return:
         """
         h_field_values = (
@@ -159,9 +160,9 @@ class TestValidation(unittest.TestCase):
         # converts string as a pseudo file / memory file
         sample_sheet_file = StringIO(file_contents_str)
 
-        # the call to get_csv_reader() inside parse_samples() will return
+        # the call to read_sample_sheet() inside parse_samples() will return
         # items inside side_effect
-        mock_csv_reader.side_effect = [reader(sample_sheet_file)]
+        mock_read_sample_sheet.side_effect = [SampleSheet(None, reader(sample_sheet_file))]
 
         res = validate_sample_sheet(None)
 
@@ -172,11 +173,11 @@ class TestValidation(unittest.TestCase):
         # Error type should be SampleSheetError
         self.assertEqual(type(res.error_list[0]), SampleSheetError)
 
-    @patch("parsers.miseq.validation.get_csv_reader")
-    def test_validate_sample_sheet_valid(self, mock_csv_reader):
+    @patch("parsers.miseq.validation.read_sample_sheet")
+    def test_validate_sample_sheet_valid(self, mock_read_sample_sheet):
         """
         Given a valid sample sheet, test that everything shows as valid
-        :param mock_csv_reader:
+        :param mock_read_sample_sheet:
         :return:
         """
         h_field_values = (
@@ -219,9 +220,9 @@ class TestValidation(unittest.TestCase):
         # converts string as a pseudo file / memory file
         sample_sheet_file = StringIO(file_contents_str)
 
-        # the call to get_csv_reader() inside parse_samples() will return
+        # the call to read_sample_sheet() inside parse_samples() will return
         # items inside side_effect
-        mock_csv_reader.side_effect = [reader(sample_sheet_file)]
+        mock_read_sample_sheet.side_effect = [SampleSheet(None, reader(sample_sheet_file))]
 
         res = validate_sample_sheet(None)
 
@@ -0,0 +1,107 @@
+import unittest
+from unittest.mock import patch
+from csv import reader
+from io import StringIO
+from os import path, utime, stat
+import tempfile
+import shutil
+
+from parsers.exceptions import SampleSheetError
+from parsers.sample_sheet import SampleSheet, read_sample_sheet, clear_sample_sheet_cache
+
+path_to_module = path.abspath(path.dirname(__file__))
+if len(path_to_module) == 0:
+    path_to_module = '.'
+
+
+class TestSampleSheet(unittest.TestCase):
+    """
+    Test that the lines of a sample sheet are split into sections
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+    def test_sections(self):
+        sample_sheet = read_sample_sheet(path.join(path_to_module, "miseq", "fake_ngs_data", "SampleSheet.csv"))
+
+        self.assertEqual(sample_sheet.section_names, ["Header", "Reads", "Settings", "Data"])
+        self.assertEqual(sample_sheet.preamble, ())
+        self.assertEqual(sample_sheet.header['Investigator Name'], 'Some Guy')
+        self.assertEqual(sample_sheet.header['Workflow'], 'GenerateFASTQ')
+        self.assertEqual(sample_sheet.settings['Adapter'], 'AAAAGGGGAAAAGGGGAAA')
+        self.assertEqual(sample_sheet.reads, ['251', '250'])
+        self.assertEqual(sample_sheet.data_columns[0], 'Sample_ID')
+        self.assertEqual(len(sample_sheet.data_rows), 3)
+        self.assertEqual(sample_sheet.data_rows[0][0], '01-1111')
+
+    def test_missing_sections(self):
+        file_contents_str = (
+            "Stray line\n" +
+            "[Data]\n" +
+            "Sample_Name,Project_ID\n" +
+            "\n" +
+            "sample1,6\n" +
+            ",\n"
+        )
+
+        sample_sheet = SampleSheet(None, reader(StringIO(file_contents_str)))
+
+        self.assertEqual(sample_sheet.preamble, (("Stray line",),))
+        self.assertFalse(sample_sheet.has_section("Header"))
+        self.assertEqual(sample_sheet.get_section("Header"), ())
+        self.assertEqual(len(sample_sheet.header), 0)
+        self.assertEqual(sample_sheet.reads, [])
+        # blank lines in [Data] are skipped
+        self.assertEqual(sample_sheet.data_rows, (("sample1", "6"),))
+
+
+class TestReadSampleSheet(unittest.TestCase):
+    """
+    Test that sample sheets are only parsed again when the file changes
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+        self.temp_dir = tempfile.mkdtemp()
+        self.sheet_file = path.join(self.temp_dir, "SampleList.csv")
+        with open(self.sheet_file, "w") as sheet:
+            sheet.write("[Data]\nSample_Name,Project_ID\nsample1,6\n")
+        clear_sample_sheet_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        clear_sample_sheet_cache()
+
+    def test_read_cached(self):
+        sample_sheet = read_sample_sheet(self.sheet_file)
+
+        with patch("parsers.sample_sheet.open", create=True) as mock_open:
+            self.assertIs(read_sample_sheet(self.sheet_file), sample_sheet)
+            mock_open.assert_not_called()
+
+    def test_read_after_change(self):
+        sample_sheet = read_sample_sheet(self.sheet_file)
+
+        with open(self.sheet_file, "a") as sheet:
+            sheet.write("sample2,6\n")
+
+        changed_sample_sheet = read_sample_sheet(self.sheet_file)
+        self.assertIsNot(changed_sample_sheet, sample_sheet)
+        self.assertEqual(len(changed_sample_sheet.data_rows), 2)
+
+    def test_read_after_same_size_change(self):
+        sample_sheet = read_sample_sheet(self.sheet_file)
+
+        with open(self.sheet_file, "w") as sheet:
+            sheet.write("[Data]\nSample_Name,Project_ID\nsample2,7\n")
+        # make sure the modification time moves even on file systems with coarse timestamps
+        file_stat = stat(self.sheet_file)
+        utime(self.sheet_file, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns + 1000000000))
+
+        self.assertEqual(read_sample_sheet(self.sheet_file).data_rows, (("sample2", "7"),))
+        self.assertEqual(sample_sheet.data_rows, (("sample1", "6"),))
+
+    def test_read_no_sheet(self):
+        with self.assertRaises(SampleSheetError):
+            read_sample_sheet(self.temp_dir)
@@ -0,0 +1,91 @@
+import shutil
+import tempfile
+import time
+import unittest
+from os import path
+
+from progress.state_store import StateStore
+
+
+class TestStateStore(unittest.TestCase):
+    """
+    Tests the progress.state_store.StateStore class
+    """
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+        self.temp_dir = tempfile.mkdtemp()
+        self.state_store = StateStore(path.join(self.temp_dir, "state", "uploader.db"))
+
+    def tearDown(self):
+        self.state_store.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_write_and_get_run(self):
+        samples = {"6": {"sample_1": {"Complete": True, "Files": {"a.fastq.gz": {"Bytes Sent": 10}}},
+                         "sample_2": {"Complete": False}}}
+        self.state_store.write_run("/runs/run_1", "partial", run_id=55, irida_instance="http://irida/api/",
+                                   sample_status_dict=samples)
+
+        run = self.state_store.get_run("/runs/run_1")
+        self.assertEqual(run["status"], "partial")
+        self.assertEqual(run["run_id"], 55)
+        self.assertEqual(run["irida_instance"], "http://irida/api/")
+        self.assertEqual(run["sample_status_dict"], samples)
+        self.assertIsNone(self.state_store.get_run("/runs/run_2"))
+
+        # samples that are no longer in the status are removed
+        del samples["6"]["sample_2"]
+        self.state_store.write_run("/runs/run_1", "complete", run_id=55, irida_instance="http://irida/api/",
+                                   sample_status_dict=samples)
+        run = self.state_store.get_run("/runs/run_1")
+        self.assertEqual(run["status"], "complete")
+        self.assertEqual(run["sample_status_dict"], samples)
+
+    def test_updated_only_when_changed(self):
+        self.state_store.write_run("/runs/run_1", "new")
+        updated = self.state_store.get_run("/runs/run_1")["updated"]
+        time.sleep(0.01)
+
+        self.state_store.write_run("/runs/run_1", "new")
+        self.assertEqual(self.state_store.get_run("/runs/run_1")["updated"], updated)
+
+        self.state_store.write_run("/runs/run_1", "partial")
+        self.assertGreater(self.state_store.get_run("/runs/run_1")["updated"], updated)
+
+    def test_find_runs(self):
+        self.state_store.write_run("/runs/run_1", "complete")
+        self.state_store.write_run("/runs/run_2", "error")
+        self.state_store.write_run("/runs/run_3", "new")
+        self.state_store.write_run("/runs_other/run_4", "new")
+        self.state_store.write_run("/runs/nested/run_5", "error")
+
+        self.assertEqual([run["directory"] for run in self.state_store.find_runs(parent_directory="/runs")],
+                         ["/runs/run_1", "/runs/run_2", "/runs/run_3", "/runs/nested/run_5"])
+        new_or_error_runs = self.state_store.find_runs(status_list=["new", "error"], parent_directory="/runs/")
+        self.assertEqual([run["directory"] for run in new_or_error_runs],
+                         ["/runs/run_2", "/runs/run_3", "/runs/nested/run_5"])
+        self.assertEqual([run["directory"] for run in self.state_store.find_runs(updated_since=time.time() + 60)],
+                         [])
+
+    def test_find_samples(self):
+        self.state_store.write_run("/runs/run_1", "partial", sample_status_dict={
+            "6": {"sample_1": {"Complete": True}, "sample_2": {"Complete": False}}})
+
+        samples = self.state_store.find_samples(complete=True)
+        self.assertEqual([(sample["directory"], sample["project_id"], sample["sample_name"]) for sample in samples],
+                         [("/runs/run_1", "6", "sample_1")])
+        self.assertEqual(len(self.state_store.find_samples(directory="/runs/run_1")), 2)
+
+    def test_shared_between_stores(self):
+        """
+        Makes sure a second store on the same database file, as another uploader process would open, sees the runs
+        :return:
+        """
+        self.state_store.write_run("/runs/run_1", "complete")
+
+        other_store = StateStore(self.state_store.database_file)
+        try:
+            self.assertEqual(other_store.get_run("/runs/run_1")["status"], "complete")
+        finally:
+            other_store.close()
@@ -1,9 +1,13 @@
+import json
+import shutil
+import tempfile
 import unittest
+from unittest.mock import patch
 from os import path
 import os
 
 import progress
-from model import DirectoryStatus
+from model import DirectoryStatus, Sample, SequenceFile
 
 path_to_module = path.abspath(path.dirname(__file__))
 if len(path_to_module) == 0:
@@ -134,3 +138,137 @@ class TestWriteDirectoryStatus(unittest.TestCase):
         # Check that file matches what we wrote
         status = progress.get_directory_status(self.directory, ["SampleSheet.csv"])
         self.assertEqual(DirectoryStatus.COMPLETE, status.status)
+
+
+class TestWriteSampleStatus(unittest.TestCase):
+    """
+    This class tests that per sample upload progress is written to and read from the status file
+    """
+    directory = path.join(path_to_module, 'write_status_dir')
+    status_file = path.join(directory, "irida_uploader_status.info")
+    sequence_file = path.join(directory, "SampleSheet.csv")
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+
+    def tearDown(self):
+        # remove status file after using it
+        if path.exists(self.status_file):
+            os.remove(self.status_file)
+
+    @patch("progress.upload_status.config")
+    def test_write_and_read_sample_status(self, mock_config):
+        mock_config.read_config_option.return_value = "http://irida/api/"
+
+        # Create DirectoryStatus to use for writing
+        directory_status = DirectoryStatus(self.directory)
+        directory_status.status = DirectoryStatus.PARTIAL
+
+        sample = Sample(sample_name="sample_1")
+        sample.sequence_file = SequenceFile(file_list=[self.sequence_file])
+
+        progress.write_sample_status(directory_status, 55, "6", sample)
+
+        # Check that the progress is read back from the file
+        status = progress.get_directory_status(self.directory, ["SampleSheet.csv"])
+        self.assertEqual(DirectoryStatus.PARTIAL, status.status)
+        self.assertEqual(55, status.run_id)
+        self.assertTrue(progress.sample_upload_complete(status, "6", "sample_1"))
+        self.assertFalse(progress.sample_upload_complete(status, "6", "sample_2"))
+        file_status = status.sample_status_dict["6"]["sample_1"]["Files"][self.sequence_file]
+        self.assertEqual(file_status["Bytes Sent"], path.getsize(self.sequence_file))
+
+    @patch("progress.upload_status.config")
+    def test_write_and_read_checksums(self, mock_config):
+        mock_config.read_config_option.return_value = "http://irida/api/"
+
+        directory_status = DirectoryStatus(self.directory)
+        directory_status.status = DirectoryStatus.PARTIAL
+
+        sample = Sample(sample_name="sample_1")
+        sample.sequence_file = SequenceFile(file_list=[self.sequence_file])
+        file_checksums = {self.sequence_file: {"size": 10, "md5": "aa", "sha256": "bb"}}
+
+        progress.write_sample_status(directory_status, 55, "6", sample, file_checksums)
+
+        status = progress.get_directory_status(self.directory, ["SampleSheet.csv"])
+        file_status = status.sample_status_dict["6"]["sample_1"]["Files"][self.sequence_file]
+        self.assertEqual(file_status, {"Bytes Sent": 10, "MD5": "aa", "SHA-256": "bb", "Complete": True})
+        self.assertEqual(progress.get_uploaded_file_checksums(status), {("6", "sample_1"): file_checksums})
+
+
+class TestStateStoreSync(unittest.TestCase):
+    """
+    This class tests that statuses are kept in sync with the state database, and kept there for read only status files
+    """
+    directory = path.join(path_to_module, 'write_status_dir')
+    status_file = path.join(directory, "irida_uploader_status.info")
+
+    def setUp(self):
+        print("\nStarting " + self.__module__ + ": " + self._testMethodName)
+        self.temp_dir = tempfile.mkdtemp()
+        self.state_store = progress.StateStore(path.join(self.temp_dir, "uploader.db"))
+
+    def tearDown(self):
+        self.state_store.close()
+        shutil.rmtree(self.temp_dir)
+        if path.exists(self.status_file):
+            os.remove(self.status_file)
+
+    def _read_only_status_file(self, file_path, mode):
+        # tests can run as root, which can write to read only files
+        if path.basename(file_path) == "irida_uploader_status.info":
+            return False
+        return os.path.isdir(file_path) or os.path.exists(file_path)
+
+    def test_statuses_written_to_state_store(self):
+        with patch("progress.upload_status._state_store", self.state_store):
+            # reading a status, e.g. for --status, does not write to the database
+            progress.get_directory_status(path.join(path_to_module, "new_dir"), ["SampleSheet.csv"])
+            progress.get_directory_status(path.join(path_to_module, "complete_dir"), ["SampleSheet.csv"])
+
+            directory_status = DirectoryStatus(self.directory)
+            directory_status.status = DirectoryStatus.ERROR
+            progress.write_directory_status(directory_status)
+
+        self.assertIsNone(self.state_store.get_run(path.join(path_to_module, "new_dir")))
+        self.assertIsNone(self.state_store.get_run(path.join(path_to_module, "complete_dir")))
+        self.assertEqual(self.state_store.get_run(self.directory)["status"], DirectoryStatus.ERROR)
+        self.assertTrue(path.exists(self.status_file))
+
+    @patch("progress.upload_status.config")
+    def test_read_only_status_file_kept_in_state_store(self, mock_config):
+        mock_config.read_config_option.return_value = "http://irida/api/"
+        directory_status = DirectoryStatus(self.directory)
+        directory_status.status = DirectoryStatus.PARTIAL
+        progress.write_directory_status(directory_status)
+
+        with patch("progress.upload_status._state_store", self.state_store), \
+                patch("progress.upload_status.os.access", side_effect=self._read_only_status_file):
+            directory_status.status = DirectoryStatus.COMPLETE
+            progress.write_directory_status(directory_status, run_id=55)
+            status = progress.get_directory_status(self.directory, ["SampleSheet.csv"])
+
+        self.assertEqual(status.status, DirectoryStatus.COMPLETE)
+        self.assertEqual(status.run_id, 55)
+        # the read only status file was not written
+        with open(self.status_file) as status_file:
+            self.assertEqual(json.load(status_file)["Upload Status"], DirectoryStatus.PARTIAL)
+
+    def test_read_only_status_file_without_state_store(self):
+        directory_status = DirectoryStatus(self.directory)
+        directory_status.status = DirectoryStatus.PARTIAL
+        progress.write_directory_status(directory_status)
+
+        with patch("progress.upload_status.user_cache_dir", return_value=self.temp_dir), \
+                patch("progress.upload_status.os.access", side_effect=self._read_only_status_file):
+            directory_status.status = DirectoryStatus.ERROR
+            progress.write_directory_status(directory_status)
+            status = progress.get_directory_status(self.directory, ["SampleSheet.csv"])
+            # another run with a read only status file does not read the status written for this one
+            other_status = progress.get_directory_status(path.join(path_to_module, "complete_dir"),
+                                                         ["SampleSheet.csv"])
+
+        self.assertEqual(status.status, DirectoryStatus.ERROR)
+        self.assertEqual(other_status.status, DirectoryStatus.COMPLETE)
+        self.assertEqual(len(os.listdir(path.join(self.temp_dir, "status"))), 1)
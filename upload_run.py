@@ -4,6 +4,7 @@ import argparse
 import global_settings
 import config
 import core
+import progress
 
 
 class ConfigAction(argparse.Action):
@@ -40,6 +41,22 @@ class ConfigAction(argparse.Action):
         global_settings.config_file = values
 
 
+def positive_int(value):
+    """
+    argparse type for options that need a number of at least 1
+
+    :param value: The value passed via the command line
+    :return: the value as an int
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid int value: '{}'".format(value))
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, got {}".format(number))
+    return number
+
+
 # Set up an argument parser. We are using defaults to stay consistent with other software.
 # description gets added to the usage statements
 argument_parser = argparse.ArgumentParser(description='This program parses sequencing runs and uploads them to IRIDA.')
@@ -59,21 +76,131 @@ argument_parser.add_argument('-f', '--force',
                              action='store_true',  # This line makes it not parse a variable
                              help='Uploader will ignore the status file, '
                                   'and try to upload even when a run is in non new status.')
+# Optional argument, Continue a partial or failed upload
+argument_parser.add_argument('-r', '--resume',
+                             action='store_true',  # This line makes it not parse a variable
+                             help='Uploader will continue a partial or failed upload, skipping samples that '
+                                  'were already uploaded and reusing the existing sequencing run on IRIDA.')
+# Optional argument, Upload samples while the rest of the run is still being verified
+argument_parser.add_argument('-p', '--pipeline',
+                             action='store_true',  # This line makes it not parse a variable
+                             help='Uploader will start uploading each sample as soon as it exists on IRIDA, '
+                                  'instead of waiting until every sample has been verified.')
+# Optional argument, Check an uploaded run instead of uploading
+argument_parser.add_argument('--verify',
+                             action='store_true',  # This line makes it not parse a variable
+                             help='Uploader will not upload, but check that the samples the status file records as '
+                                  'uploaded are on IRIDA, comparing file sizes and checksums without downloading.')
+# Optional argument, List the runs the state database knows instead of uploading
+argument_parser.add_argument('--status',
+                             action='store_true',  # This line makes it not parse a variable
+                             help='Uploader will not upload, but list the status of every run in the directory that '
+                                  'the state database (state_database in the config file) has recorded. '
+                                  'The directory is the one that contains the run directories.')
+# Optional argument, Keep running and upload each new run that appears in the directory
+argument_parser.add_argument('-w', '--watch',
+                             action='store_true',  # This line makes it not parse a variable
+                             help='Uploader will keep running, and upload each new run that is written to the '
+                                  'directory as soon as it is complete. The directory is the one that contains '
+                                  'the run directories. Stop with Ctrl+C.')
+# Optional argument, Upload every new run in the directory once
+argument_parser.add_argument('-b', '--batch',
+                             action='store_true',  # This line makes it not parse a variable
+                             help='Uploader will upload every new run in the directory, then stop. The directory is '
+                                  'the one that contains the run directories.')
+# Optional argument, Number of runs uploaded at the same time
+argument_parser.add_argument('-j', '--jobs',
+                             type=positive_int, default=1,
+                             help='Number of runs to upload at the same time when watching a directory or uploading '
+                                  'a batch. Default: 1')
+# Optional argument, Order batch runs are uploaded in
+argument_parser.add_argument('--order',
+                             choices=core.cli_entry.BATCH_ORDERS, default=core.cli_entry.BATCH_ORDER_OLDEST,
+                             help='Order to upload batch runs in: the oldest run directory first, the run with the '
+                                  'smallest files first, or the order of --priority-file. Default: oldest')
+# Optional argument, File listing the batch runs to upload first
+argument_parser.add_argument('--priority-file',
+                             help='File with a run directory name per line, for --order priority. The runs it lists '
+                                  'are uploaded first, in that order, then the other runs oldest first.')
+
+
 def main():
     # Parse the arguments passed from the command line and start the upload
     args = argument_parser.parse_args()
-    upload(args.directory, args.force)
+    if args.verify:
+        verify(args.directory)
+    elif args.status:
+        status(args.directory)
+    elif args.watch:
+        watch(args.directory, args.jobs, args.pipeline)
+    elif args.batch:
+        batch(args.directory, args.jobs, args.order, args.priority_file, args.pipeline)
+    else:
+        upload(args.directory, args.force, args.resume, args.pipeline)
 
 
-def upload(run_directory, force_upload):
+def upload(run_directory, force_upload, resume_upload=False, pipeline_upload=False):
     """
     start upload on a single run directory
     :param run_directory:
     :param force_upload:
+    :param resume_upload:
+    :param pipeline_upload:
+    :return:
+    """
+    config.setup()
+    progress.initialize_state_store_from_config()
+    core.cli_entry.validate_and_upload_single_entry(run_directory, force_upload, resume_upload, pipeline_upload)
+
+
+def verify(run_directory):
+    """
+    check the uploaded files of a single run directory
+    :param run_directory:
+    :return:
+    """
+    config.setup()
+    progress.initialize_state_store_from_config()
+    core.cli_entry.verify_single_entry(run_directory)
+
+
+def status(directory):
+    """
+    list the status of the runs in a directory from the state database
+    :param directory:
+    :return:
+    """
+    config.setup()
+    progress.initialize_state_store_from_config()
+    core.cli_entry.list_run_statuses(directory)
+
+
+def watch(directory, jobs=1, pipeline_upload=False):
+    """
+    upload each new run that appears in a directory, until stopped
+    :param directory:
+    :param jobs:
+    :param pipeline_upload:
+    :return:
+    """
+    config.setup()
+    progress.initialize_state_store_from_config()
+    core.cli_entry.watch_and_upload(directory, jobs, pipeline_upload)
+
+
+def batch(directory, jobs=1, order=core.cli_entry.BATCH_ORDER_OLDEST, priority_file=None, pipeline_upload=False):
+    """
+    upload every new run in a directory
+    :param directory:
+    :param jobs:
+    :param order:
+    :param priority_file:
+    :param pipeline_upload:
     :return:
     """
     config.setup()
-    core.cli_entry.validate_and_upload_single_entry(run_directory, force_upload)
+    progress.initialize_state_store_from_config()
+    core.cli_entry.batch_upload(directory, jobs, order, priority_file, pipeline_upload)
 
 
 # This is called when the program is run for the first time